@@ -2,6 +2,8 @@ from flask import Flask
 from flask_login import LoginManager
 from .config import Config
 from .db import DB
+from .export_worker import ExportWorker
+from . import fragment_cache
 
 login = LoginManager()
 login.login_view = 'users.login'
@@ -13,8 +15,18 @@ def create_app():
 
     # Attach DB helper
     app.db = DB(app)
+    fragment_cache.init_app(app)
+
+    # CSV exports off the request path (see csv_sync.mark_dirty)
+    app.export_worker = None
+    if app.config.get('CSV_EXPORT_MODE') == 'background':
+        app.export_worker = ExportWorker(app, interval=app.config.get('CSV_EXPORT_INTERVAL', 1.0),
+                                         compact_interval=app.config.get('CSV_COMPACT_INTERVAL', 300))
     login.init_app(app)
 
+    from .csv_sync import csv_cli
+    app.cli.add_command(csv_cli)
+
     # -----------------------------
     # Blueprints
     # -----------------------------
@@ -49,6 +61,9 @@ def create_app():
     from .messages import bp as messages_bp
     app.register_blueprint(messages_bp)
 
+    from .internal import bp as internal_bp
+    app.register_blueprint(internal_bp)
+
     # -----------------------------
     # Context processor: expose seller flag + unread messages safely
     # -----------------------------
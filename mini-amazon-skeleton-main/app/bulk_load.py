@@ -0,0 +1,339 @@
+"""Parallel loader for db/create.sql + db/load.sql.
+
+Does what db/setup.sh does with psql, but faster:
+
+* the \\COPY and setval() statements are read from db/load.sql itself, so
+  the two loaders cannot drift apart;
+* tables are loaded in waves following the foreign keys, and the tables of
+  a wave are COPYed concurrently, each over its own connection;
+* indexes that back no constraint are dropped before the load and rebuilt
+  (also concurrently) afterwards, and user triggers are disabled meanwhile.
+  What the AFTER INSERT triggers on order_items would have done -- filling
+  order_sellers and setting the order status -- is replayed as one
+  statement each once order_items is loaded, and product_stats and
+  product_facets are computed in one pass each at the end.
+
+Instead of the CSV files it can restore a compressed snapshot (see
+app/snapshot.py), whose chunks load concurrently too, even within a table,
+and are checked against the manifest before they are committed.
+
+Usage (with the usual DB_* environment; the database must exist):
+
+    python -m app.bulk_load [DATADIR] [--jobs 4] [--no-schema]
+    python -m app.bulk_load --snapshot [SNAPSHOT_DIR]
+
+DATADIR defaults to db/generate, like db/setup.sh.
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import create_app
+from . import csv_sync
+from . import snapshot as snapshots
+
+_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db')
+
+_COPY_RE = re.compile(r"^\\COPY\s+(\w+)\s*\(([^)]*)\)\s+FROM\s+'([^']+)'\s*(.*?);\s*$",
+                      re.IGNORECASE | re.MULTILINE)
+_SETVAL_RE = re.compile(r"^SELECT\s+setval\(pg_get_serial_sequence\('(\w+)'.*;\s*$",
+                        re.IGNORECASE | re.MULTILINE)
+
+# The AFTER INSERT triggers on order_items, as set-based statements.
+_TRIGGER_REPLAY = {
+    'order_items': (
+        '''
+INSERT INTO order_sellers(order_id, seller_id)
+SELECT DISTINCT order_id, seller_id FROM order_items
+ON CONFLICT DO NOTHING
+''',
+        '''
+UPDATE orders o
+SET status = CASE WHEN s.fulfilled = 0 THEN 'PENDING'
+                  WHEN s.fulfilled < s.total THEN 'PARTIAL'
+                  ELSE 'FULFILLED' END,
+    order_fulfilled_at = CASE WHEN s.fulfilled = s.total THEN now() END
+FROM (SELECT order_id, COUNT(*) AS total, COUNT(fulfilled_at) AS fulfilled
+      FROM order_items
+      GROUP BY order_id) s
+WHERE o.order_id = s.order_id
+''',
+    ),
+}
+# Tables that load.sql does not COPY, and the table whose replay fills them
+_FILLED_BY = {'order_sellers': 'order_items'}
+# Tables the triggers derive from several others, rebuilt once all are loaded
+_REFRESH = {'product_stats': 'SELECT refresh_product_stats()',
+            'product_facets': 'SELECT refresh_product_facets()'}
+
+_FOREIGN_KEYS_SQL = '''
+SELECT conrelid::regclass::text, confrelid::regclass::text
+FROM pg_constraint
+WHERE contype = 'f' AND connamespace = current_schema()::regnamespace
+'''
+
+# indexes not backing a primary key, unique or exclusion constraint
+_PLAIN_INDEXES_SQL = '''
+SELECT ci.relname, ct.relname, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+JOIN pg_class ci ON ci.oid = i.indexrelid
+JOIN pg_class ct ON ct.oid = i.indrelid
+WHERE ct.relnamespace = current_schema()::regnamespace
+  AND ct.relname = ANY(%s)
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint k
+                  WHERE k.conindid = i.indexrelid AND k.contype IN ('p', 'u', 'x'))
+ORDER BY ct.relname, ci.relname
+'''
+
+
+class _Load:
+
+    def __init__(self, table, columns, filename, options):
+        self.table = table
+        self.filename = filename
+        self.copy_sql = f'COPY {table}({columns}) FROM STDIN {options}'
+        self.setval_sql = None
+        # (COPY statement, snapshot chunk or None) per part loaded
+        self.parts = [(self.copy_sql, None)]
+        self.rows = 0
+        self.seconds = 0.0
+        self._started = None
+        self._lock = threading.Lock()
+
+    def add(self, rows, started, finished):
+        # parts load concurrently: seconds is the wall time from the first
+        # part's start to the last part's end
+        with self._lock:
+            self.rows += rows
+            if self._started is None or started < self._started:
+                self._started = started
+            self.seconds = max(self.seconds, finished - self._started)
+
+
+def parse_load_sql(path):
+    """The tables db/load.sql loads, in file order, as {table: _Load}."""
+    with open(path) as f:
+        script = f.read()
+    loads = {}
+    for table, columns, filename, options in _COPY_RE.findall(script):
+        loads[table] = _Load(table, columns, filename, options)
+    for match in _SETVAL_RE.finditer(script):
+        loads[match.group(1)].setval_sql = match.group(0).rstrip().rstrip(';')
+    return loads
+
+
+def load_waves(loads, foreign_keys):
+    """Group the tables into waves: each table only references tables of
+    earlier waves (or itself), so the tables of a wave can load at once."""
+    deps = {table: set() for table in loads}
+    for child, parent in foreign_keys:
+        child = _FILLED_BY.get(child, child)
+        parent = _FILLED_BY.get(parent, parent)
+        if child in deps and parent in deps and child != parent:
+            deps[child].add(parent)
+    waves = []
+    done = set()
+    while deps:
+        wave = [table for table in loads if table in deps and deps[table] <= done]
+        if not wave:
+            raise ValueError(f'foreign key cycle between {", ".join(sorted(deps))}')
+        waves.append(wave)
+        done.update(wave)
+        for table in wave:
+            del deps[table]
+    return waves
+
+
+class BulkLoader:
+
+    def __init__(self, app, datadir, jobs=4, snapshot=None):
+        self.app = app
+        self.datadir = datadir
+        self.jobs = jobs
+        self.snapshot = snapshot
+        self.loads = parse_load_sql(os.path.join(_DB_DIR, 'load.sql'))
+        if snapshot is not None:
+            self._use_snapshot(snapshots.read_manifest(snapshot))
+        self.tables = list(self.loads) + list(_FILLED_BY) + list(_REFRESH)
+        self.indexes = []
+        self.index_seconds = 0.0
+
+    def _use_snapshot(self, manifest):
+        # the snapshot replaces the CSV files of the tables load.sql loads;
+        # tables it has beyond those (order_sellers) are derived anyway
+        for table, load in self.loads.items():
+            entry = manifest['tables'].get(table)
+            if entry is None:
+                raise ValueError(f'{self.snapshot}: no {table} in the snapshot')
+            copy_sql = snapshots.copy_from_sql(table, entry['columns'])
+            load.parts = [(copy_sql, chunk) for chunk in entry['chunks']]
+
+    def _connect(self):
+        conn = self.app.db.engine.raw_connection()
+        with conn.cursor() as cur:
+            # losing the last commits on a crash only means re-running the load
+            cur.execute('SET synchronous_commit = off')
+        return conn
+
+    def apply_schema(self):
+        with open(os.path.join(_DB_DIR, 'create.sql')) as f:
+            script = f.read()
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(script)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _prepare(self):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_FOREIGN_KEYS_SQL)
+                foreign_keys = cur.fetchall()
+                cur.execute(_PLAIN_INDEXES_SQL, (self.tables,))
+                self.indexes = cur.fetchall()
+                for name, _, _ in self.indexes:
+                    cur.execute(f'DROP INDEX {name}')
+                for table in self.tables:
+                    cur.execute(f'ALTER TABLE {table} DISABLE TRIGGER USER')
+            conn.commit()
+        finally:
+            conn.close()
+        return foreign_keys
+
+    def _open(self, load, chunk):
+        if chunk is None:
+            return open(os.path.join(self.datadir, load.filename), 'rb')
+        return snapshots.ChunkReader(self.snapshot, chunk)
+
+    def _copy(self, part):
+        load, copy_sql, chunk = part
+        started = time.perf_counter()
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur, self._open(load, chunk) as f:
+                cur.copy_expert(copy_sql, f, size=1 << 20)
+                if chunk is not None:
+                    # a damaged chunk is rolled back, not committed
+                    f.check(cur.rowcount)
+                rows = cur.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        load.add(rows, started, time.perf_counter())
+
+    def _after_load(self, tables):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                for table in tables:
+                    load = self.loads[table]
+                    for sql in _TRIGGER_REPLAY.get(table, ()):
+                        cur.execute(sql)
+                    if load.setval_sql:
+                        cur.execute(load.setval_sql)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _refresh(self):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                for sql in _REFRESH.values():
+                    cur.execute(sql)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _create_index(self, definition):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(definition)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _finish(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.jobs) as pool:
+            list(pool.map(self._create_index, [d for _, _, d in self.indexes]))
+        self.index_seconds = time.perf_counter() - started
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                for table in self.tables:
+                    cur.execute(f'ALTER TABLE {table} ENABLE TRIGGER USER')
+            conn.commit()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f'ANALYZE {", ".join(self.tables)}')
+        finally:
+            conn.close()
+
+    def _fold_deltas(self, report):
+        # the CSV exports append changes to delta logs next to the
+        # db/generate snapshots (see csv_sync); fold them in first, or the
+        # changes not compacted yet would not be loaded
+        generate = csv_sync._generate_path('')
+        if self.snapshot is None and os.path.isdir(self.datadir) \
+                and os.path.samefile(self.datadir, generate):
+            csv_sync.compact_all()
+            report('delta logs folded into the snapshots')
+
+    def run(self, schema=True, report=print):
+        self._fold_deltas(report)
+        if schema:
+            self.apply_schema()
+        foreign_keys = self._prepare()
+        try:
+            with ThreadPoolExecutor(self.jobs) as pool:
+                for n, wave in enumerate(load_waves(self.loads, foreign_keys), 1):
+                    started = time.perf_counter()
+                    loads = [self.loads[table] for table in wave]
+                    list(pool.map(self._copy, [(load, copy_sql, chunk)
+                                               for load in loads
+                                               for copy_sql, chunk in load.parts]))
+                    self._after_load(wave)
+                    for load in loads:
+                        report(f'  {load.table:22} {load.rows:>10,} rows {load.seconds:7.2f} s '
+                               f'{load.rows / max(load.seconds, 1e-9):>12,.0f} rows/s '
+                               f'{len(load.parts):>4} parts')
+                    report(f'wave {n}: {", ".join(wave)} in {time.perf_counter() - started:.2f} s')
+            self._refresh()
+        finally:
+            # put indexes and triggers back even if a COPY failed
+            self._finish()
+        report(f'{len(self.indexes)} indexes rebuilt in {self.index_seconds:.2f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load db/create.sql and the CSV files of '
+                                                 'db/load.sql in parallel.')
+    parser.add_argument('datadir', nargs='?', default=os.path.join(_DB_DIR, 'generate'))
+    parser.add_argument('--jobs', type=int, default=min(4, os.cpu_count() or 1),
+                        help='concurrent connections (default: %(default)s)')
+    parser.add_argument('--snapshot', nargs='?', const=snapshots.default_path(),
+                        help='restore this snapshot (default: %(const)s) instead of DATADIR')
+    parser.add_argument('--no-schema', dest='schema', action='store_false',
+                        help='load into the existing (empty) tables instead of running create.sql')
+    args = parser.parse_args()
+
+    app = create_app()
+    loader = BulkLoader(app, os.path.abspath(args.datadir), jobs=args.jobs,
+                        snapshot=args.snapshot and os.path.abspath(args.snapshot))
+    started = time.perf_counter()
+    loader.run(schema=args.schema)
+    seconds = time.perf_counter() - started
+    rows = sum(load.rows for load in loader.loads.values())
+    print(f'total: {rows:,} rows in {seconds:.2f} s ({rows / seconds:,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,20 +3,16 @@ from datetime import datetime
 from flask_login import login_required, current_user
 from flask import current_app as app
 from app.models.cart_item import CartItem
+from app.db import unit_of_work
 from sqlalchemy import text
-from .csv_sync import (
-    export_cart_items,
-    export_users,
-    export_inventory,
-    export_orders,
-    export_order_items,
-)
+from .csv_sync import mark_dirty
 
 
 bp = Blueprint('cart', __name__)
 
 
 @bp.route('/cart')
+@unit_of_work(read_only=True)
 @login_required
 def view():
     # TODO (Johnson): fetch cart and saved-for-later items for current user
@@ -110,6 +106,7 @@ def add_to_cart():
 
     CartItem.add_to_cart(user_id=current_user.id, product_id=product_id,
                          seller_id=seller_id, quantity=quantity)
+    mark_dirty('cart_items', [(current_user.id, product_id, seller_id, True)])
 
     flash(f"Added {quantity} item(s) to your cart.", "success")
     return redirect(url_for('products.detail', product_id=product_id))
@@ -134,7 +131,7 @@ def update_quantity():
         SET quantity = :q
         WHERE user_id = :uid AND product_id = :pid AND seller_id = :sid AND is_in_cart = TRUE
         '''), dict(q=quantity, uid=current_user.id, pid=product_id, sid=seller_id))
-    export_cart_items()
+    mark_dirty('cart_items', [(current_user.id, product_id, seller_id, True)])
     flash('Quantity updated', 'success')
     return redirect(url_for('cart.view'))
 
@@ -155,7 +152,7 @@ def remove_item():
 DELETE FROM cart_items
 WHERE user_id = :uid AND product_id = :pid AND seller_id = :sid AND is_in_cart = :is_in_cart
 '''), dict(uid=current_user.id, pid=product_id, sid=seller_id, is_in_cart=is_in_cart))
-    export_cart_items()
+    mark_dirty('cart_items', [(current_user.id, product_id, seller_id, is_in_cart)])
     flash('Item removed from cart', 'success')
     return redirect(url_for('cart.view'))
 
@@ -206,7 +203,8 @@ def move_to_save():
         # 4. Delete the source entry if quantity <= 0
         conn.execute(text(sql_delete), dict(uid=current_user.id, pid=product_id, sid=seller_id, qty=qty))
 
-    export_cart_items()
+    mark_dirty('cart_items', [(current_user.id, product_id, seller_id, True),
+                              (current_user.id, product_id, seller_id, False)])
     flash('Item moved to save list', 'success')
     return redirect(url_for('cart.view'))
 
@@ -259,7 +257,8 @@ def move_to_cart():
         # 4. Delete the source entry if quantity <= qty (would become 0 or negative)
         conn.execute(text(sql_delete), dict(uid=current_user.id, pid=product_id, sid=seller_id, qty=qty))
 
-    export_cart_items()
+    mark_dirty('cart_items', [(current_user.id, product_id, seller_id, False),
+                              (current_user.id, product_id, seller_id, True)])
     flash('Item moved to cart', 'success')
     return redirect(url_for('cart.view'))
 
@@ -289,25 +288,24 @@ def apply_coupon():
     return redirect(url_for('cart.view'))
 
 
-@bp.route('/cart/checkout', methods=['POST'])
-@login_required
-def checkout():
-    # Transactional checkout
-    try:
-        with app.db.engine.begin() as conn:
-            # Lock buyer row and get balance/address
-            # conn.execute IS standard SQLAlchemy, so text() and dict() are CORRECT here.
-            buyer_row = conn.execute(text('''
+def _place_order(conn, uid, coupon_code):
+    # Body of the checkout transaction; run through app.db.run_transaction,
+    # so it may be re-executed from the top after a serialization failure.
+    # Returns (status, order_id) with status one of 'ok', 'no_user', 'empty',
+    # 'insufficient_inventory', 'insufficient_balance'.
+
+    # Lock buyer row and get balance/address
+    # conn.execute IS standard SQLAlchemy, so text() and dict() are CORRECT here.
+    buyer_row = conn.execute(text('''
 SELECT balance, address FROM users WHERE id = :uid FOR UPDATE
-'''), dict(uid=current_user.id)).first()
-            if not buyer_row:
-                flash('User not found', 'danger')
-                return redirect(url_for('cart.view'))
-            buyer_balance_cents = int(buyer_row[0] * 100) if buyer_row[0] is not None else 0
-            shipping_address = buyer_row[1]
-
-            # Load cart items with inventory, lock inventory rows
-            rows = conn.execute(text('''
+'''), dict(uid=uid)).first()
+    if not buyer_row:
+        return 'no_user', None
+    buyer_balance_cents = int(buyer_row[0] * 100) if buyer_row[0] is not None else 0
+    shipping_address = buyer_row[1]
+
+    # Load cart items with inventory, lock inventory rows
+    rows = conn.execute(text('''
 SELECT c.product_id, c.seller_id, c.quantity,
        i.price_cents, i.quantity_on_hand,
        s.user_id AS seller_user_id,
@@ -318,136 +316,178 @@ JOIN sellers s ON s.id = c.seller_id
 JOIN products p ON c.product_id = p.id
 WHERE c.user_id = :uid AND c.is_in_cart = TRUE
 FOR UPDATE OF i
-'''), dict(uid=current_user.id)).fetchall()
-            if not rows:
-                flash('Cart is empty', 'warning')
-                return redirect(url_for('cart.view'))
-
-            # Coupon Validation
-            coupon_code = session.get('coupon_code')
-            discount_percent = 0
-            scope_pid = None
-            scope_catid = None
-            
-            if coupon_code:
-                # conn.execute uses standard SQLAlchemy
-                coupon_row = conn.execute(text('''
-                    SELECT discount_percent, product_id, category_id
-                    FROM coupons
-                    WHERE code = :code AND expiration_time > NOW()
-                '''), dict(code=coupon_code)).first()
-                if coupon_row:
-                    discount_percent, scope_pid, scope_catid = coupon_row
-                else:
-                    # Invalid/Expired during checkout process - ignore
-                    pass
-
-            # Validate inventory and compute totals
-            total_cents = 0
-            insufficient = []
-            per_seller_user_total = {}
-            final_order_items = [] # Store tuple for insertion later: (pid, sid, qty, final_price, discount, seller_uid)
-
-            for pid, sid, qty, price_cents, qty_on_hand, seller_user_id, cat_id in rows:
-                if qty > qty_on_hand:
-                    insufficient.append((pid, sid))
-                
-                # Calculate Line Discount
-                line_original_total = price_cents * qty
-                line_discount = 0
-                
-                applies = False
-                if discount_percent > 0:
-                    if scope_pid is None and scope_catid is None:
-                        applies = True
-                    elif scope_pid == pid:
-                        applies = True
-                    elif scope_catid == cat_id:
-                        applies = True
-                
-                if applies:
-                    line_discount = (line_original_total * discount_percent) // 100
-                
-                line_final_total = line_original_total - line_discount
-                
-                total_cents += line_final_total
-                per_seller_user_total[seller_user_id] = per_seller_user_total.get(seller_user_id, 0) + line_final_total
-                
-                final_order_items.append({
-                    'pid': pid, 'sid': sid, 'qty': qty, 
-                    'price': price_cents, # This is UNIT price (original)
-                    'discount_cents': line_discount, # Total discount for this line? 
-                    'line_discount_cents': line_discount 
-                })
-
-            if insufficient:
-                flash('Insufficient inventory for some items', 'danger')
-                return redirect(url_for('cart.view'))
-            if buyer_balance_cents < total_cents:
-                flash('Insufficient balance', 'danger')
-                return redirect(url_for('cart.view'))
-
-            # Create order
-            order_row = conn.execute(text('''
+'''), dict(uid=uid)).fetchall()
+    if not rows:
+        return 'empty', None
+
+    # Coupon Validation
+    discount_percent = 0
+    scope_pid = None
+    scope_catid = None
+
+    if coupon_code:
+        # conn.execute uses standard SQLAlchemy
+        coupon_row = conn.execute(text('''
+            SELECT discount_percent, product_id, category_id
+            FROM coupons
+            WHERE code = :code AND expiration_time > NOW()
+        '''), dict(code=coupon_code)).first()
+        if coupon_row:
+            discount_percent, scope_pid, scope_catid = coupon_row
+        else:
+            # Invalid/Expired during checkout process - ignore
+            pass
+
+    # Validate inventory and compute totals
+    total_cents = 0
+    insufficient = []
+    per_seller_user_total = {}
+    final_order_items = [] # Store tuple for insertion later: (pid, sid, qty, final_price, discount, seller_uid)
+
+    for pid, sid, qty, price_cents, qty_on_hand, seller_user_id, cat_id in rows:
+        if qty > qty_on_hand:
+            insufficient.append((pid, sid))
+
+        # Calculate Line Discount
+        line_original_total = price_cents * qty
+        line_discount = 0
+
+        applies = False
+        if discount_percent > 0:
+            if scope_pid is None and scope_catid is None:
+                applies = True
+            elif scope_pid == pid:
+                applies = True
+            elif scope_catid == cat_id:
+                applies = True
+
+        if applies:
+            line_discount = (line_original_total * discount_percent) // 100
+
+        line_final_total = line_original_total - line_discount
+
+        total_cents += line_final_total
+        per_seller_user_total[seller_user_id] = per_seller_user_total.get(seller_user_id, 0) + line_final_total
+
+        final_order_items.append({
+            'pid': pid, 'sid': sid, 'qty': qty,
+            'price': price_cents, # This is UNIT price (original)
+            'discount_cents': line_discount, # Total discount for this line?
+            'line_discount_cents': line_discount
+        })
+
+    if insufficient:
+        return 'insufficient_inventory', None
+    if buyer_balance_cents < total_cents:
+        return 'insufficient_balance', None
+
+    # Create order
+    order_row = conn.execute(text('''
 INSERT INTO orders(buyer_id, shipping_address, status)
 VALUES(:uid, :addr, 'PENDING')
 RETURNING order_id
-'''), dict(uid=current_user.id, addr=shipping_address)).first()
-            order_id = order_row[0]
-
-            # Insert order items and update inventory
-            for item in final_order_items:
-                conn.execute(text('''
-INSERT INTO order_items(order_id, product_id, seller_id, quantity, unit_price_final_cents, discount_cents, fulfilled_at)
-VALUES(:oid, :pid, :sid, :qty, :price, :disc, NULL)
-'''), dict(oid=order_id, pid=item['pid'], sid=item['sid'], qty=item['qty'], 
-           price=item['price'], disc=item['line_discount_cents']))
-                
-                conn.execute(text('''
-UPDATE inventory
-SET quantity_on_hand = quantity_on_hand - :qty, updated_at = NOW()
-WHERE seller_id = :sid AND product_id = :pid
-'''), dict(qty=item['qty'], sid=item['sid'], pid=item['pid']))
+'''), dict(uid=uid, addr=shipping_address)).first()
+    order_id = order_row[0]
 
-            # Clear applied coupon from session
-            if coupon_code:
-                session.pop('coupon_code', None)
+    # Each phase below is one statement over the whole cart (see DB.execute_batch)
 
-
-            # Update balances
-            conn.execute(text('''
-UPDATE users SET balance = balance - (:total_cents / 100.0) WHERE id = :uid
-'''), dict(total_cents=total_cents, uid=current_user.id))
-            
-            # Record transaction for buyer
-            conn.execute(text('''
-INSERT INTO transactions(user_id, amount, order_id)
-VALUES(:uid, -(:total_cents / 100.0), :oid)
-'''), dict(uid=current_user.id, total_cents=total_cents, oid=order_id))
-
-            for seller_user_id, amount_cents in per_seller_user_total.items():
-                conn.execute(text('''
-UPDATE users SET balance = balance + (:amount_cents / 100.0) WHERE id = :sid
-'''), dict(amount_cents=amount_cents, sid=seller_user_id))
-                # Record transaction for seller
-                conn.execute(text('''
+    # Insert order items
+    app.db.execute_batch('''
+INSERT INTO order_items(order_id, product_id, seller_id, quantity, unit_price_final_cents, discount_cents, fulfilled_at)
+SELECT :oid, t.pid, t.sid, t.qty, t.price, t.line_discount_cents, NULL
+FROM unnest(CAST(:pid AS INT[]), CAST(:sid AS INT[]), CAST(:qty AS INT[]),
+            CAST(:price AS INT[]), CAST(:line_discount_cents AS INT[]))
+     AS t(pid, sid, qty, price, line_discount_cents)
+''', final_order_items, conn=conn, oid=order_id)
+
+    # Update inventory
+    app.db.execute_batch('''
+UPDATE inventory i
+SET quantity_on_hand = i.quantity_on_hand - t.qty, updated_at = NOW()
+FROM unnest(CAST(:sid AS INT[]), CAST(:pid AS INT[]), CAST(:qty AS INT[])) AS t(sid, pid, qty)
+WHERE i.seller_id = t.sid AND i.product_id = t.pid
+''', final_order_items, conn=conn)
+
+    # Transactions: the buyer pays the total, each seller receives their share
+    ledger = [{'uid': uid, 'amount_cents': -total_cents}]
+    ledger += [{'uid': seller_user_id, 'amount_cents': amount_cents}
+               for seller_user_id, amount_cents in per_seller_user_total.items()]
+
+    # Update balances, netting the entries per user (a buyer may also be
+    # the seller of some items, and UPDATE ... FROM applies one row per user)
+    balance_deltas = {}
+    for entry in ledger:
+        balance_deltas[entry['uid']] = balance_deltas.get(entry['uid'], 0) + entry['amount_cents']
+    app.db.execute_batch('''
+UPDATE users u
+SET balance = u.balance + (t.delta_cents / 100.0)
+FROM unnest(CAST(:uid AS INT[]), CAST(:delta_cents AS BIGINT[])) AS t(uid, delta_cents)
+WHERE u.id = t.uid
+''', [{'uid': user_id, 'delta_cents': delta} for user_id, delta in balance_deltas.items()],
+        conn=conn)
+
+    # Record transactions for buyer and sellers
+    app.db.execute_batch('''
 INSERT INTO transactions(user_id, amount, order_id)
-VALUES(:sid, (:amount_cents / 100.0), :oid)
-'''), dict(sid=seller_user_id, amount_cents=amount_cents, oid=order_id))
+SELECT t.uid, (t.amount_cents / 100.0), :oid
+FROM unnest(CAST(:uid AS INT[]), CAST(:amount_cents AS BIGINT[])) AS t(uid, amount_cents)
+''', ledger, conn=conn, oid=order_id)
 
-            # Clear cart
-            conn.execute(text('''
+    # Clear cart
+    conn.execute(text('''
 DELETE FROM cart_items WHERE user_id = :uid AND is_in_cart = TRUE
-'''), dict(uid=current_user.id))
+'''), dict(uid=uid))
+
+    return 'ok', order_id
+
+
+def _export_order_changes(uid, order_id):
+    # Rows touched by _place_order: the buyer's and sellers' balances and
+    # transactions, the inventory and cart rows of each line item, and the
+    # new order itself (order_sellers is filled by a trigger).
+    lines = app.db.execute('''
+SELECT oi.product_id, oi.seller_id, s.user_id
+FROM order_items oi
+JOIN sellers s ON s.id = oi.seller_id
+WHERE oi.order_id = :oid
+''', oid=order_id)
+    mark_dirty('users', [(uid,)] + [(seller_uid,) for _, _, seller_uid in lines])
+    mark_dirty('inventory', [(sid, pid) for pid, sid, _ in lines])
+    mark_dirty('orders', [(order_id,)])
+    mark_dirty('order_items', [(order_id, pid, sid) for pid, sid, _ in lines])
+    mark_dirty('order_sellers', [(order_id, sid) for _, sid, _ in lines])
+    mark_dirty('transactions', app.db.execute(
+        'SELECT id FROM transactions WHERE order_id = :oid', oid=order_id))
+    mark_dirty('cart_items', [(uid, pid, sid, True) for pid, sid, _ in lines])
+
+
+@bp.route('/cart/checkout', methods=['POST'])
+@login_required
+def checkout():
+    # Transactional checkout, retried on serialization failures
+    coupon_code = session.get('coupon_code')
+    try:
+        status, order_id = app.db.run_transaction(_place_order, current_user.id, coupon_code)
+        if status == 'no_user':
+            flash('User not found', 'danger')
+            return redirect(url_for('cart.view'))
+        if status == 'empty':
+            flash('Cart is empty', 'warning')
+            return redirect(url_for('cart.view'))
+        if status == 'insufficient_inventory':
+            flash('Insufficient inventory for some items', 'danger')
+            return redirect(url_for('cart.view'))
+        if status == 'insufficient_balance':
+            flash('Insufficient balance', 'danger')
+            return redirect(url_for('cart.view'))
+
+        # Clear applied coupon from session
+        if coupon_code:
+            session.pop('coupon_code', None)
 
         # CSV sync after commit
-        export_users()
-        export_inventory()
-        export_orders()
-        export_order_items()
-        export_cart_items()
+        _export_order_changes(current_user.id, order_id)
         flash('Order placed successfully', 'success')
     except Exception as e:
         flash(f'Checkout failed: {str(e)}', 'danger')
     return redirect(url_for('cart.view'))
-
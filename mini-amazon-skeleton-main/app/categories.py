@@ -1,12 +1,48 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request
+
+from .models.category import Category
+from .models.product import Product
+from .models.product_facet import ProductFacets
+from .db import unit_of_work
 
 
 bp = Blueprint('categories', __name__)
 
 
 @bp.route('/categories')
+@unit_of_work(read_only=True)
 def index():
-    # TODO (Jameson): list categories for browsing
-    return render_template('categories/index.html')
+    tree = Category.tree()
+    return render_template('categories/index.html',
+                           nodes=tree.rollup(ProductFacets.category_counts()))
+
+
+@bp.route('/categories/<int:category_id>')
+@unit_of_work(read_only=True)
+def detail(category_id: int):
+    tree = Category.tree()
+    category = tree.get(category_id)
+    if category is None:
+        return "Category not found", 404
+
+    # (own, subtree) product counts of every category
+    counts = {node.id: (count, total)
+              for node, count, total in tree.rollup(ProductFacets.category_counts())}
+    subcategories = [(child, counts[child.id][1]) for child in tree.children.get(category_id, [])]
 
+    # products of the whole subtree
+    page = Product.browse_page(
+        category=category_id,
+        sort=request.args.get('sort', type=str),
+        after=request.args.get('after', type=str),
+        before=request.args.get('before', type=str),
+        per_page=20,
+        total=counts[category_id][1]
+    )
 
+    return render_template('categories/detail.html',
+                           category=category,
+                           ancestors=tree.ancestors(category_id),
+                           subcategories=subcategories,
+                           products=page.items,
+                           page=page)
@@ -2,6 +2,13 @@ import os
 from urllib.parse import quote_plus
 
 
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 class Config(object):
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = 'postgresql://{}:{}@{}:{}/{}'\
@@ -11,3 +18,81 @@ class Config(object):
                 os.environ.get('DB_PORT'),
                 os.environ.get('DB_NAME'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool sizing (see DB.__init__ and /internal/db/pool)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', -1))
+    DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', True)
+
+    # Comma-separated read replica URIs; reads fall back to the primary
+    # while every replica is down and for a while after a client's own write
+    DB_REPLICA_URIS = [uri.strip() for uri in os.environ.get('DB_REPLICA_URIS', '').split(',')
+                       if uri.strip()]
+    DB_REPLICA_RETRY_INTERVAL = float(os.environ.get('DB_REPLICA_RETRY_INTERVAL', 30))
+    DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', 5))
+
+    # Isolation level for read_only=True helper calls and read-only views
+    DB_READ_ISOLATION = os.environ.get('DB_READ_ISOLATION', 'READ COMMITTED')
+
+    # DB.run_transaction retries on serialization failure / deadlock
+    DB_RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS', 5))
+    DB_RETRY_BASE_DELAY = float(os.environ.get('DB_RETRY_BASE_DELAY', 0.01))
+    DB_RETRY_MAX_DELAY = float(os.environ.get('DB_RETRY_MAX_DELAY', 0.5))
+
+    # Number of distinct SQL strings whose TextClause DB keeps around
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 512))
+
+    # Per-request query counting, N+1 warnings and a warning for requests
+    # spending over DB_SLOW_REQUEST_MS in the database (see
+    # DB._report_query_stats).  The X-DB-* response headers are only sent
+    # in debug mode or with DB_QUERY_STATS_HEADERS on.
+    DB_QUERY_STATS = _env_bool('DB_QUERY_STATS', True)
+    DB_QUERY_STATS_HEADERS = _env_bool('DB_QUERY_STATS_HEADERS', False)
+    DB_N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_N_PLUS_ONE_THRESHOLD', 5))
+    DB_SLOW_REQUEST_MS = float(os.environ.get('DB_SLOW_REQUEST_MS', 500))
+
+    # In-process cache for DB.execute_cached() (see app/query_cache.py).
+    # Only writes made by this process invalidate it: writes by other web
+    # workers, the export daemon or psql are seen after at most
+    # DB_QUERY_CACHE_TTL seconds, so only cache slow-changing data
+    # (categories, reviews, per-category counts), never stock or prices
+    DB_QUERY_CACHE = _env_bool('DB_QUERY_CACHE', True)
+    DB_QUERY_CACHE_TTL = float(os.environ.get('DB_QUERY_CACHE_TTL', 60))
+    DB_QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('DB_QUERY_CACHE_MAX_ENTRIES', 1024))
+    DB_QUERY_CACHE_MAX_BYTES = int(os.environ.get('DB_QUERY_CACHE_MAX_BYTES', 16 * 2**20))
+
+    # Rendered product page/card fragments (see app/fragment_cache.py)
+    FRAGMENT_CACHE = _env_bool('FRAGMENT_CACHE', True)
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 2**20))
+    FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+    # db/generate/*.csv exports: append changed rows to per-table delta logs
+    # and fold a log into its snapshot once it exceeds CSV_DELTA_MAX_BYTES,
+    # and (background and daemon modes) every CSV_COMPACT_INTERVAL seconds
+    # (0: never).  db/setup.sh and app.bulk_load fold the logs before loading
+    CSV_EXPORT_INCREMENTAL = _env_bool('CSV_EXPORT_INCREMENTAL', True)
+    CSV_DELTA_MAX_BYTES = int(os.environ.get('CSV_DELTA_MAX_BYTES', 1 << 20))
+    CSV_COMPACT_INTERVAL = float(os.environ.get('CSV_COMPACT_INTERVAL', 300))
+    # full snapshots are written by COPY ... TO STDOUT rather than row by row
+    CSV_EXPORT_COPY = _env_bool('CSV_EXPORT_COPY', True)
+    # 'background': a worker thread coalesces exports every CSV_EXPORT_INTERVAL
+    # seconds; 'inline': export before the request returns; 'daemon': the web
+    # tier does no exports, python -m app.export_daemon follows the triggers
+    CSV_EXPORT_MODE = os.environ.get('CSV_EXPORT_MODE', 'background')
+    CSV_EXPORT_INTERVAL = float(os.environ.get('CSV_EXPORT_INTERVAL', 1.0))
+
+    # Product search: 'like' (substring match, trigram-indexed when pg_trgm
+    # is installed) or, opt-in, 'fts' (full-text, GIN-indexed, with query
+    # syntax and a relevance sort, see app/search.py).  fts matches whole
+    # words after stemming: "sho" no longer finds "shoes" (use "sho*"), and
+    # a leading - excludes a word instead of being searched for
+    PRODUCT_SEARCH_MODE = os.environ.get('PRODUCT_SEARCH_MODE', 'like')
+
+    # Expose the /internal/* JSON stats endpoints (off by default), and
+    # only to these comma-separated client addresses
+    INTERNAL_ENDPOINTS = _env_bool('INTERNAL_ENDPOINTS', False)
+    INTERNAL_ENDPOINTS_ALLOW = [addr.strip() for addr in
+                                os.environ.get('INTERNAL_ENDPOINTS_ALLOW', '127.0.0.1,::1').split(',')
+                                if addr.strip()]
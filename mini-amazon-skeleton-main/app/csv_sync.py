@@ -1,6 +1,157 @@
 import csv
+import datetime
 import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Windows: the export locks then only hold within a process
+    fcntl = None
+
+import click
 from flask import current_app as app
+from flask.cli import AppGroup
+
+
+# Keeps db/generate/*.csv in step with the database.
+#
+# Full exports (export_table / export_*) rewrite a table's snapshot,
+# streamed by Postgres itself with COPY ... TO STDOUT (or row by row
+# through SQLAlchemy with CSV_EXPORT_COPY off).
+# Incremental exports (export_changes) instead append the current state of
+# just the changed rows, by primary key, to the table's delta log next to
+# the snapshot (e.g. CartItems.delta.csv):
+#
+#     U,<all columns>     row inserted or updated
+#     D,<key columns>     row deleted
+#
+# compact() folds a delta log into its snapshot; export_changes() does
+# so once the log passes CSV_DELTA_MAX_BYTES, the export worker every
+# CSV_COMPACT_INTERVAL seconds, and the loaders (db/setup.sh, bulk_load)
+# before they read the snapshots, so uncompacted changes are never lost.
+#
+# Several processes (web workers, export_daemon, flask csv ...) may export
+# the same table, so every read-modify-write of a table's files happens
+# under _table_lock(): a thread lock plus an flock on its .lock file.
+#
+# Request handlers call mark_dirty(), which with CSV_EXPORT_MODE=background
+# (the default) leaves the export to app.export_worker instead of doing it
+# while the user waits.  With CSV_EXPORT_MODE=daemon they do nothing:
+# export_daemon picks every change up from row triggers instead.
+
+
+def _bool(value):
+    # CSV text as written by csv.writer, or a bool straight from the DB
+    return value is True or value == 'True'
+
+
+class _Table:
+
+    def __init__(self, name, filename, columns, key, key_types, booleans=()):
+        self.name = name
+        self.filename = filename
+        self.columns = columns
+        self.key = key
+        # (python parser of the CSV text, SQL array type) per key column
+        self.key_types = key_types
+        # COPY writes booleans as t/f, csv.writer as True/False
+        self.booleans = booleans
+        self.key_index = [columns.index(k) for k in key]
+        self.lock = threading.Lock()
+
+    @property
+    def select_sql(self):
+        return f'''
+SELECT {", ".join(self.columns)}
+FROM {self.name}
+ORDER BY {", ".join(self.key)}
+'''
+
+    @property
+    def copy_sql(self):
+        columns = [f"CASE WHEN {c} THEN 'True' ELSE 'False' END" if c in self.booleans else c
+                   for c in self.columns]
+        return f'''
+COPY (SELECT {", ".join(columns)} FROM {self.name} ORDER BY {", ".join(self.key)})
+TO STDOUT WITH (FORMAT csv)
+'''
+
+    @property
+    def select_keys_sql(self):
+        # rows for a batch of primary keys, bound as one array per key column
+        arrays = ', '.join(f'CAST(:k{i} AS {sql_type}[])'
+                           for i, (_, sql_type) in enumerate(self.key_types))
+        on = ' AND '.join(f't.{col} = k.c{i}' for i, col in enumerate(self.key))
+        return f'''
+SELECT {", ".join('t.' + c for c in self.columns)}
+FROM {self.name} t
+JOIN unnest({arrays}) AS k({", ".join(f"c{i}" for i in range(len(self.key)))}) ON {on}
+'''
+
+    def parse_key(self, values):
+        return tuple(parse(v) for (parse, _), v in zip(self.key_types, values))
+
+    def row_key(self, row):
+        return self.parse_key([row[i] for i in self.key_index])
+
+
+_INT_KEY = ((int, 'INT'),)
+
+# The tables of db/export.sql (plus transactions and coupons), with the
+# column lists db/load.sql reads back.
+TABLES = {t.name: t for t in (
+    _Table('users', 'Users.csv',
+           ('id', 'email', 'full_name', 'address', 'password_hash', 'balance', 'created_at'),
+           key=('id',), key_types=_INT_KEY),
+    _Table('sellers', 'Sellers.csv', ('id', 'user_id'), key=('id',), key_types=_INT_KEY),
+    _Table('categories', 'Categories.csv', ('id', 'name', 'parent_id'),
+           key=('id',), key_types=_INT_KEY),
+    _Table('products', 'Products.csv',
+           ('id', 'name', 'description', 'image_url', 'category_id', 'created_by', 'created_at'),
+           key=('id',), key_types=_INT_KEY),
+    _Table('cart_items', 'CartItems.csv',
+           ('user_id', 'product_id', 'seller_id', 'quantity', 'is_in_cart'),
+           key=('user_id', 'product_id', 'seller_id', 'is_in_cart'),
+           key_types=((int, 'INT'), (int, 'INT'), (int, 'INT'), (_bool, 'BOOLEAN')),
+           booleans=('is_in_cart',)),
+    _Table('inventory', 'Inventory.csv',
+           ('seller_id', 'product_id', 'price_cents', 'quantity_on_hand', 'updated_at'),
+           key=('seller_id', 'product_id'), key_types=((int, 'INT'), (int, 'INT'))),
+    _Table('orders', 'Orders.csv',
+           ('order_id', 'buyer_id', 'placed_at', 'shipping_address', 'order_fulfilled_at', 'status'),
+           key=('order_id',), key_types=((int, 'INT'),)),
+    _Table('order_items', 'OrderItems.csv',
+           ('order_id', 'product_id', 'seller_id', 'quantity', 'unit_price_final_cents',
+            'discount_cents', 'fulfilled_at'),
+           key=('order_id', 'product_id', 'seller_id'),
+           key_types=((int, 'INT'), (int, 'INT'), (int, 'INT'))),
+    _Table('order_sellers', 'OrderSellers.csv', ('order_id', 'seller_id'),
+           key=('order_id', 'seller_id'), key_types=((int, 'INT'), (int, 'INT'))),
+    _Table('transactions', 'Transactions.csv',
+           ('id', 'user_id', 'amount', 'order_id', 'created_at'),
+           key=('id',), key_types=_INT_KEY),
+    _Table('product_reviews', 'ProductReviews.csv',
+           ('review_id', 'product_id', 'author_user_id', 'rating', 'title', 'body',
+            'created_at', 'updated_at'),
+           key=('review_id',), key_types=_INT_KEY),
+    _Table('seller_reviews', 'SellerReviews.csv',
+           ('review_id', 'seller_user_id', 'author_user_id', 'rating', 'title', 'body',
+            'created_at', 'updated_at'),
+           key=('review_id',), key_types=_INT_KEY),
+    _Table('review_helpful_votes', 'ReviewHelpfulVotes.csv',
+           ('review_id', 'voter_user_id', 'created_at'),
+           key=('review_id', 'voter_user_id'), key_types=((int, 'INT'), (int, 'INT'))),
+    _Table('message_threads', 'MessageThreads.csv',
+           ('thread_id', 'order_id', 'seller_user_id', 'buyer_user_id', 'created_at'),
+           key=('thread_id',), key_types=_INT_KEY),
+    _Table('messages', 'Messages.csv',
+           ('message_id', 'thread_id', 'sender_user_id', 'body', 'sent_at'),
+           key=('message_id',), key_types=_INT_KEY),
+    _Table('coupons', 'Coupons.csv',
+           ('id', 'code', 'discount_percent', 'expiration_time', 'product_id', 'category_id'),
+           key=('id',), key_types=_INT_KEY),
+)}
 
 
 def _generate_path(filename: str) -> str:
@@ -8,68 +159,265 @@ def _generate_path(filename: str) -> str:
     return os.path.join(base, 'db', 'generate', filename)
 
 
+def _delta_path(table: _Table) -> str:
+    return _generate_path(table.filename[:-len('.csv')] + '.delta.csv')
+
+
+def _lock_path(table: _Table) -> str:
+    # a file of its own: the snapshot and the log are replaced by rename,
+    # and a lock on a replaced file no longer excludes anyone
+    return _generate_path(table.filename[:-len('.csv')] + '.lock')
+
+
+@contextmanager
+def _table_lock(table: _Table):
+    """Hold the exclusive right to change table's snapshot and delta log,
+    against other threads of this process and against other processes."""
+    with table.lock:
+        if fcntl is None:
+            yield
+            return
+        with open(_lock_path(table), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _csv_writer(f):
+    # '\n' line endings, like COPY and the generated files
+    return csv.writer(f, lineterminator='\n')
+
+
+def _csv_value(v):
+    if v is None:
+        return ''
+    if isinstance(v, datetime.datetime) and v.microsecond:
+        # Postgres drops trailing zeros of the fraction, str(datetime) does not
+        return str(v).rstrip('0')
+    return v
+
+
+def _csv_values(row):
+    return [_csv_value(v) for v in row]
+
+
+def _write_rows(table: _Table, f):
+    # rows are streamed from a server-side cursor through csv.writer,
+    # so memory use stays flat however large the table is; on the primary,
+    # as a lagging replica could miss the commit that triggered the export
+    writer = _csv_writer(f)
+    for row in app.db.stream(table.select_sql, primary=True):
+        writer.writerow(_csv_values(row))
+
+
+def _write_copy(table: _Table, f):
+    # Postgres formats the CSV itself and psycopg2 copies it into f in
+    # chunks; no per-row Python work at all
+    conn = app.db.engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(table.copy_sql, f)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def export_table(name: str, path: str = None, use_copy: bool = None):
+    """Rewrite the full snapshot of a table (or write it to path instead)
+    and discard its delta log.  use_copy defaults to CSV_EXPORT_COPY; both
+    ways produce the same file."""
+    table = TABLES[name]
+    if use_copy is None:
+        use_copy = app.config.get('CSV_EXPORT_COPY', True)
+    target = path or _generate_path(table.filename)
+    with _table_lock(table):
+        tmp = target + '.tmp'
+        with open(tmp, 'w', newline='') as f:
+            (_write_copy if use_copy else _write_rows)(table, f)
+        os.replace(tmp, target)
+        if path is None and os.path.exists(_delta_path(table)):
+            os.remove(_delta_path(table))
+
+
+def export_changes(name: str, keys):
+    """Record the current state of the rows of table `name` with the given
+    primary keys (tuples in key column order) in its delta log: rows that
+    exist are written as U lines, keys that no longer exist as D lines.
+    Call after the transaction that changed them has committed.
+
+    Cost is one indexed query and one append for the changed rows only.
+    With CSV_EXPORT_INCREMENTAL off, or before the table has a snapshot,
+    this falls back to export_table().
+
+    The rows are read and appended under the table's lock, so when two
+    processes export the same row the state read last is appended last.
+    """
+    table = TABLES[name]
+    keys = list(dict.fromkeys(tuple(k) for k in keys))
+    if not keys:
+        return
+    if not app.config.get('CSV_EXPORT_INCREMENTAL', True):
+        export_table(name)
+        return
+
+    params = {f'k{i}': [k[i] for k in keys] for i in range(len(table.key))}
+    delta = _delta_path(table)
+    with _table_lock(table):
+        if not os.path.exists(_generate_path(table.filename)):
+            snapshot = True
+        else:
+            snapshot = False
+            found = {table.row_key(row): row
+                     for row in app.db.execute(table.select_keys_sql, **params)}
+            lines = []
+            for key in keys:
+                row = found.get(table.parse_key(key))
+                lines.append(['U'] + _csv_values(row) if row is not None else ['D'] + list(key))
+            with open(delta, 'a', newline='') as f:
+                _csv_writer(f).writerows(lines)
+            too_big = os.path.getsize(delta) > app.config.get('CSV_DELTA_MAX_BYTES', 1 << 20)
+    if snapshot:
+        export_table(name)
+    elif too_big:
+        compact(name)
+
+
+def compact(name: str):
+    """Fold a table's delta log into its snapshot (a missing snapshot
+    counts as empty).
+
+    Runs under the table's lock, so nothing is appended meanwhile.  The
+    snapshot is rewritten in primary key order (as export_table() writes
+    it) via a temp file and rename, and the log is removed only after that:
+    a crash in between leaves a log whose changes are already in the
+    snapshot, and folding it again changes nothing.  Logs left as
+    .compacting by earlier versions are folded first.
+    """
+    table = TABLES[name]
+    path = _generate_path(table.filename)
+    delta = _delta_path(table)
+    with _table_lock(table):
+        logs = [log for log in (delta + '.compacting', delta) if os.path.exists(log)]
+        if not logs:
+            return
+
+        rows = {}
+        if os.path.exists(path):
+            with open(path, newline='') as f:
+                for row in csv.reader(f):
+                    rows[table.row_key(row)] = row
+        for log in logs:
+            with open(log, newline='') as f:
+                for op, *values in csv.reader(f):
+                    if op == 'U':
+                        rows[table.row_key(values)] = values
+                    else:
+                        rows.pop(table.parse_key(values), None)
+
+        tmp = path + '.tmp'
+        with open(tmp, 'w', newline='') as f:
+            writer = _csv_writer(f)
+            for key in sorted(rows):
+                writer.writerow(rows[key])
+        os.replace(tmp, path)
+        for log in logs:
+            os.remove(log)
+
+
+def mark_dirty(name: str, keys=None):
+    """Export the rows of table `name` with the given primary keys (or the
+    whole table if keys is None) after a commit: now, or in the background
+    if the app has an export worker (see export_worker.ExportWorker).
+    A no-op with CSV_EXPORT_MODE=daemon."""
+    if app.config.get('CSV_EXPORT_MODE') == 'daemon':
+        return
+    worker = getattr(app, 'export_worker', None)
+    if worker is not None:
+        worker.mark_dirty(name, keys)
+    elif keys is None:
+        export_table(name)
+    else:
+        export_changes(name, keys)
+
+
+def compact_all():
+    for name in TABLES:
+        compact(name)
+
+
 def export_cart_items():
-    path = _generate_path('CartItems.csv')
-    rows = app.db.execute('''
-SELECT user_id, product_id, seller_id, quantity, is_in_cart
-FROM cart_items
-ORDER BY user_id, product_id, seller_id, is_in_cart
-''')
-    with open(path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        for row in rows:
-            writer.writerow(['' if v is None else v for v in row])
+    export_table('cart_items')
 
 
 def export_users():
-    path = _generate_path('Users.csv')
-    rows = app.db.execute('''
-SELECT id, email, full_name, address, password_hash, balance, created_at
-FROM users
-ORDER BY id
-''')
-    with open(path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        for row in rows:
-            writer.writerow(['' if v is None else v for v in row])
+    export_table('users')
 
 
 def export_inventory():
-    path = _generate_path('Inventory.csv')
-    rows = app.db.execute('''
-SELECT seller_id, product_id, price_cents, quantity_on_hand, updated_at
-FROM inventory
-ORDER BY seller_id, product_id
-''')
-    with open(path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        for row in rows:
-            writer.writerow(['' if v is None else v for v in row])
+    export_table('inventory')
 
 
 def export_orders():
-    path = _generate_path('Orders.csv')
-    rows = app.db.execute('''
-SELECT order_id, buyer_id, placed_at, shipping_address, order_fulfilled_at, status
-FROM orders
-ORDER BY order_id
-''')
-    with open(path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        for row in rows:
-            writer.writerow(['' if v is None else v for v in row])
+    export_table('orders')
 
 
 def export_order_items():
-    path = _generate_path('OrderItems.csv')
-    rows = app.db.execute('''
-SELECT order_id, product_id, seller_id, quantity, unit_price_final_cents, discount_cents, fulfilled_at
-FROM order_items
-ORDER BY order_id, product_id, seller_id
-''')
-    with open(path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        for row in rows:
-            writer.writerow(['' if v is None else v for v in row])
+    export_table('order_items')
+
+
+csv_cli = AppGroup('csv', help='Export tables to db/generate/*.csv or to a snapshot.')
+
+
+@csv_cli.command('export')
+@click.argument('tables', nargs=-1)
+@click.option('--python', 'python_rows', is_flag=True,
+              help='Format rows in Python instead of with COPY.')
+def export_command(tables, python_rows):
+    """Write full snapshots of TABLES (default: all exported tables)."""
+    for name in tables or TABLES:
+        if name not in TABLES:
+            raise click.BadParameter(f'unknown table {name!r}', param_hint='TABLES')
+        export_table(name, use_copy=not python_rows)
+        click.echo(f'{name} -> {_generate_path(TABLES[name].filename)}')
+
+
+@csv_cli.command('compact')
+def compact_command():
+    """Fold all pending delta logs into their snapshots."""
+    compact_all()
+
+
+@csv_cli.command('snapshot')
+@click.argument('path', required=False)
+@click.option('--jobs', default=4, show_default=True, help='Tables exported at once.')
+@click.option('--chunk-mb', default=64.0, show_default=True,
+              help='Uncompressed size of each chunk.')
+def snapshot_command(path, jobs, chunk_mb):
+    """Write a compressed, chunked snapshot of all tables to PATH
+    (default: db/generate/snapshot); see app/snapshot.py."""
+    from .snapshot import default_path, write_snapshot
+    # the exporting threads have no app context of their own
+    manifest = write_snapshot(app._get_current_object(), path, jobs=jobs,
+                              chunk_bytes=int(chunk_mb * 2**20))
+    for name, entry in manifest['tables'].items():
+        chunks = entry['chunks']
+        click.echo(f"{name:22} {sum(c['rows'] for c in chunks):>10} rows "
+                   f"{len(chunks):>4} chunks "
+                   f"{sum(c['bytes'] for c in chunks):>12} -> "
+                   f"{sum(c['compressed_bytes'] for c in chunks):>10} bytes")
+    click.echo(f'-> {path or default_path()}')
 
 
+@csv_cli.command('verify')
+@click.argument('path', required=False)
+def verify_command(path):
+    """Check every chunk of the snapshot at PATH against its manifest."""
+    from .snapshot import verify_snapshot
+    try:
+        manifest = verify_snapshot(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    chunks = sum(len(entry['chunks']) for entry in manifest['tables'].values())
+    click.echo(f'{len(manifest["tables"])} tables, {chunks} chunks OK')
@@ -1,4 +1,58 @@
-from sqlalchemy import create_engine, text
+import logging
+import random
+import time
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+from flask import current_app, g, has_request_context, request, session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from .db_replicas import ReplicaSet, is_read_statement
+from .db_stats import PoolStats, RequestQueryStats, RetryStats, TimedQueuePool
+from .query_cache import QueryCache, written_tables
+
+
+# SQLSTATEs after which re-running the whole transaction may succeed:
+# serialization_failure and deadlock_detected.
+RETRYABLE_SQLSTATES = ('40001', '40P01')
+
+
+def unit_of_work(view=None, *, read_only=False, isolation=None):
+    """Decorator for view functions: every DB.execute/query_all/query_one
+    call made while handling the request shares one connection and one
+    transaction, committed once when the request finishes (or rolled
+    back if the view raises).  Put it directly below @bp.route so that
+    login checks and context processors join the same transaction.
+
+    Pure read pages should use @unit_of_work(read_only=True): the shared
+    transaction then runs READ ONLY at DB_READ_ISOLATION (or at the given
+    isolation level) instead of the default SERIALIZABLE.
+    """
+    if view is None:
+        return lambda v: unit_of_work(v, read_only=read_only, isolation=isolation)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        current_app.db.begin_request_scope(read_only=read_only, isolation=isolation)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class _RequestScope:
+    """Connection + transaction shared by the helpers during one request."""
+
+    def __init__(self, options):
+        self.options = options
+        self.conn = None
+        self.trans = None
+        self.replica = None             # the _Replica conn is on, if any
+        self.primary_only = False       # set once a replica failed this request
+
+
+class _ReplicaReadFailed(Exception):
+    """A read on a replica failed with an OperationalError; raised by
+    DB._connection() for DB._read() to run it again on the primary."""
 
 
 class DB:
@@ -17,12 +71,393 @@ class DB:
     >>>     conn.execute(text('UPDATE...'), par=value)
     >>>
 
+    Transactions that may hit serialization failures under contention
+    should go through run_transaction(), which retries them:
+
+    >>> def transfer(conn, uid, amount):
+    >>>     conn.execute(text('UPDATE...'), dict(uid=uid, amt=amount))
+    >>> app.db.run_transaction(transfer, uid, amount)
+
+    Views decorated with @unit_of_work run all helper calls for the
+    request inside a single transaction instead (see unit_of_work()).
+
+    Rarely-changing reads can be served from an in-process cache with
+    execute_cached(); writes through this process's engine invalidate
+    it, other processes' writes are seen once the entry's TTL runs out.
+
+    When DB_REPLICA_URIS is set, query_all(), query_one(), stream() and
+    read_only=True calls that only read are sent to a replica (see
+    _use_replica()); everything else, including engine.begin() and
+    run_transaction(), stays on the primary.
+
     """
     def __init__(self, app):
-        self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'],
-                                    execution_options={"isolation_level": "SERIALIZABLE"})
+        config = app.config
+        self.max_overflow = config.get('DB_MAX_OVERFLOW', 10)
+        self.read_isolation = config.get('DB_READ_ISOLATION', 'READ COMMITTED')
+        self.retry_attempts = config.get('DB_RETRY_ATTEMPTS', 5)
+        self.retry_base_delay = config.get('DB_RETRY_BASE_DELAY', 0.01)
+        self.retry_max_delay = config.get('DB_RETRY_MAX_DELAY', 0.5)
+        pool_args = dict(pool_size=config.get('DB_POOL_SIZE', 5),
+                         max_overflow=self.max_overflow,
+                         pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+                         pool_recycle=config.get('DB_POOL_RECYCLE', -1),
+                         pool_pre_ping=config.get('DB_POOL_PRE_PING', True))
+        self.engine = create_engine(config['SQLALCHEMY_DATABASE_URI'],
+                                    execution_options={"isolation_level": "SERIALIZABLE"},
+                                    poolclass=TimedQueuePool,
+                                    **pool_args)
+        self.replicas = ReplicaSet([create_engine(uri, **pool_args)
+                                    for uri in config.get('DB_REPLICA_URIS', [])],
+                                   retry_interval=config.get('DB_REPLICA_RETRY_INTERVAL', 30))
+        self.read_your_writes_s = config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+        if self.replicas:
+            event.listen(self.engine, 'before_cursor_execute', self._note_write)
+            app.after_request(self._save_write_time)
+        self._extensions = {}
+        self.pool_counters = PoolStats()
+        self.retry_counters = RetryStats()
+        # text() is pure, so identical SQL strings can share one TextClause
+        # (and with it SQLAlchemy's compiled-statement cache entry)
+        self.text = lru_cache(maxsize=config.get('DB_STATEMENT_CACHE_SIZE', 512))(text)
+        self.engine.pool.stats = self.pool_counters
+        event.listen(self.engine, 'connect', lambda dbapi_conn, record: self.pool_counters.record_connect())
+        app.after_request(self._commit_request_scope)
+        app.teardown_request(self._close_request_scope)
+
+        self.query_cache = None
+        if config.get('DB_QUERY_CACHE', True):
+            self.query_cache = QueryCache(ttl=config.get('DB_QUERY_CACHE_TTL', 60),
+                                          max_entries=config.get('DB_QUERY_CACHE_MAX_ENTRIES', 1024),
+                                          max_bytes=config.get('DB_QUERY_CACHE_MAX_BYTES', 16 * 2**20))
+            event.listen(self.engine, 'before_cursor_execute', self._track_writes)
+            event.listen(self.engine, 'commit', self._invalidate_written)
+            event.listen(self.engine, 'rollback', self._invalidate_written)
+
+        self.n_plus_one_threshold = config.get('DB_N_PLUS_ONE_THRESHOLD', 5)
+        self.slow_request_ms = config.get('DB_SLOW_REQUEST_MS', 500)
+        self.query_stats_headers = config.get('DB_QUERY_STATS_HEADERS', False)
+        if config.get('DB_QUERY_STATS', True):
+            for engine in [self.engine] + [r.engine for r in self.replicas.replicas]:
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+                event.listen(engine, 'handle_error', self._handle_cursor_error)
+            app.before_request(self._start_query_stats)
+            app.after_request(self._report_query_stats)
+
+    def pool_stats(self):
+        """Return a dict describing the connection pool right now:
+        configured size/overflow, how many connections are checked out
+        or idle, and cumulative checkout wait statistics.
+        """
+        pool = self.engine.pool
+        stats = {
+            'pool_size': pool.size(),
+            'max_overflow': self.max_overflow,
+            'timeout_s': pool.timeout(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        }
+        stats.update(self.pool_counters.snapshot())
+        return stats
+
+    def statement_cache_stats(self):
+        """Return hit/miss counters of the TextClause cache behind self.text()."""
+        info = self.text.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'hit_ratio': round(info.hits / lookups, 4) if lookups else 0.0,
+            'size': info.currsize,
+            'max_size': info.maxsize,
+        }
+
+    def query_cache_stats(self):
+        """Return hit ratio, memory use and eviction counters of the query cache."""
+        if self.query_cache is None:
+            return {'enabled': False}
+        return dict(enabled=True, **self.query_cache.stats())
+
+    def replica_stats(self):
+        """Return per-replica health and checkout counters."""
+        return self.replicas.stats()
+
+    def retry_stats(self):
+        """Return cumulative run_transaction() retry counters."""
+        return self.retry_counters.snapshot()
+
+    def has_extension(self, name):
+        """Whether a Postgres extension (e.g. pg_trgm) is installed in the
+        database; looked up once per process."""
+        if name not in self._extensions:
+            rows = self.execute('SELECT 1 FROM pg_extension WHERE extname = :name',
+                                read_only=True, name=name)
+            self._extensions[name] = bool(rows)
+        return self._extensions[name]
+
+    def run_transaction(self, fn, *args, attempts=None, **kwargs):
+        """Call fn(conn, *args, **kwargs) inside a fresh SERIALIZABLE
+        transaction and return its result.
+
+        If the transaction (including its COMMIT) fails with a
+        serialization failure or deadlock, it is rolled back and fn is
+        called again on a new transaction, sleeping a jittered exponential
+        backoff in between, up to `attempts` tries in total (default:
+        DB_RETRY_ATTEMPTS).  fn must therefore not have side effects
+        outside the database.  Any other error is raised immediately.
+        """
+        attempts = attempts or self.retry_attempts
+        for attempt in range(1, attempts + 1):
+            try:
+                with self.engine.begin() as conn:
+                    result = fn(conn, *args, **kwargs)
+            except DBAPIError as e:
+                sqlstate = getattr(e.orig, 'pgcode', None)
+                if sqlstate not in RETRYABLE_SQLSTATES:
+                    raise
+                if attempt == attempts:
+                    self.retry_counters.record_done(attempt, exhausted=True)
+                    raise
+                self.retry_counters.record_retry(sqlstate)
+                cap = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1))
+                time.sleep(random.uniform(0, cap))
+            else:
+                self.retry_counters.record_done(attempt)
+                return result
+
+    # ------------------------------------------------------------------
+    # Per-request query instrumentation
+    # ------------------------------------------------------------------
+    # The start time is kept on the statement's execution context, which is
+    # dropped with it whether the statement succeeds or fails.
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.db_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._record_query(statement, context)
+
+    def _handle_cursor_error(self, exception_context):
+        # failed statements (e.g. serialization failures that
+        # run_transaction() retries) took their time too
+        self._record_query(exception_context.statement, exception_context.execution_context)
 
-    def execute(self, sqlstr, **kwargs):
+    def _record_query(self, statement, context):
+        started = getattr(context, 'db_query_started', None)
+        if started is None or not has_request_context():
+            return
+        context.db_query_started = None
+        stats = g.get('_db_query_stats')
+        if stats is not None:
+            stats.record(statement, (time.perf_counter() - started) * 1000)
+
+    def _start_query_stats(self):
+        g._db_query_stats = RequestQueryStats()
+
+    def _report_query_stats(self, response):
+        """Log a summary line: as a warning if the request spent
+        slow_request_ms or more in the database, else at debug level (shown
+        in debug mode).  Statement shapes repeated n_plus_one_threshold
+        times or more are logged as warnings.  In debug mode or with
+        DB_QUERY_STATS_HEADERS on, the counts also go to the client as
+        X-DB-Queries / X-DB-Time-ms / X-DB-Repeated-Statements headers."""
+        stats = g.get('_db_query_stats')
+        if stats is None:
+            return response
+        headers = self.query_stats_headers or current_app.debug
+        if headers:
+            response.headers['X-DB-Queries'] = str(stats.count)
+            response.headers['X-DB-Time-ms'] = f'{stats.total_ms:.1f}'
+        logger = current_app.logger
+        logger.log(logging.WARNING if stats.total_ms >= self.slow_request_ms else logging.DEBUG,
+                   '%s %s: %d queries, %.1f ms in DB; slowest: %s',
+                   request.method, request.path, stats.count, stats.total_ms,
+                   '; '.join(f'{ms:.1f} ms {shape[:120]}' for ms, shape in stats.slowest))
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        if repeated:
+            if headers:
+                response.headers['X-DB-Repeated-Statements'] = str(len(repeated))
+            for shape, n in repeated.items():
+                logger.warning('possible N+1 in %s %s: statement ran %d times: %s',
+                               request.method, request.path, n, shape[:300])
+        return response
+
+    # ------------------------------------------------------------------
+    # Query cache invalidation
+    # ------------------------------------------------------------------
+    def _track_writes(self, conn, cursor, statement, parameters, context, executemany):
+        tables = written_tables(statement)
+        if tables:
+            # drop now so this transaction's own later reads miss, and again
+            # at commit/rollback in case something was re-cached meanwhile
+            conn.info.setdefault('written_tables', set()).update(tables)
+            self.query_cache.invalidate(tables)
+
+    def _invalidate_written(self, conn):
+        tables = conn.info.pop('written_tables', None)
+        if tables:
+            self.query_cache.invalidate(tables)
+
+    # ------------------------------------------------------------------
+    # Replica routing
+    # ------------------------------------------------------------------
+    def _note_write(self, conn, cursor, statement, parameters, context, executemany):
+        # this request wrote (primary engine only); _save_write_time() starts
+        # the client's read-your-writes window once the response is ready
+        if has_request_context() and not is_read_statement(statement):
+            g._db_wrote = True
+
+    def _save_write_time(self, response):
+        if g.get('_db_wrote'):
+            session['_db_wrote_at'] = time.time()
+        return response
+
+    def _in_write_window(self):
+        if not has_request_context():
+            return False
+        if g.get('_db_wrote'):
+            return True
+        return session.get('_db_wrote_at', 0) + self.read_your_writes_s > time.time()
+
+    def _use_replica(self, statement=None, isolation=None):
+        """Whether a read may go to a replica: replicas are configured, the
+        statement does not write or lock rows, it does not need SERIALIZABLE
+        (not available on a hot standby), and this client has not written
+        within the last DB_READ_YOUR_WRITES_SECONDS."""
+        if not self.replicas or isolation == 'SERIALIZABLE':
+            return False
+        if statement is not None and not is_read_statement(statement):
+            return False
+        return not self._in_write_window()
+
+    def _replica_connection(self, isolation=None):
+        """Open a read-only connection on a replica and return (replica,
+        connection), or None."""
+        acquired = self.replicas.acquire()
+        if acquired is None:
+            return None
+        acquired[1].execution_options(**self._transaction_options(True, isolation))
+        return acquired
+
+    def _replica_failed(self, replica, error):
+        # a dropped connection means the replica is gone: skip it for a
+        # while; other errors (e.g. a query cancelled by a recovery
+        # conflict) only send this one read to the primary
+        if error.connection_invalidated:
+            self.replicas.mark_down(replica)
+        self.replicas.record_fallback()
+
+    def begin_request_scope(self, read_only=False, isolation=None):
+        """Opt the current request into a shared connection/transaction.
+        The connection is only checked out on the first helper call."""
+        if g.get('_db_scope') is None:
+            g._db_scope = _RequestScope(self._transaction_options(read_only, isolation))
+
+    def _transaction_options(self, read_only=False, isolation=None):
+        """Execution options for a transaction that is read-only and/or
+        runs at a non-default isolation level (engine default: SERIALIZABLE).
+        """
+        options = {}
+        if read_only:
+            isolation = isolation or self.read_isolation
+            options['postgresql_readonly'] = True
+            if isolation == 'SERIALIZABLE':
+                # never aborts with a serialization failure, never takes SIREAD locks
+                options['postgresql_deferrable'] = True
+        if isolation:
+            options['isolation_level'] = isolation
+        return options
+
+    def _request_connection(self):
+        if not has_request_context():
+            return None
+        scope = g.get('_db_scope')
+        if scope is None:
+            return None
+        if scope.conn is None:
+            if scope.options.get('postgresql_readonly') and not scope.primary_only and \
+                    self._use_replica(isolation=scope.options.get('isolation_level')):
+                acquired = self._replica_connection(scope.options.get('isolation_level'))
+                if acquired is not None:
+                    scope.replica, scope.conn = acquired
+            if scope.conn is None:
+                scope.conn = self.engine.connect()
+            if scope.options:
+                scope.conn.execution_options(**scope.options)
+            scope.trans = scope.conn.begin()
+        return scope.conn
+
+    def _commit_request_scope(self, response):
+        scope = g.get('_db_scope')
+        if scope is not None and scope.trans is not None and scope.trans.is_active:
+            scope.trans.commit()
+        return response
+
+    def _close_request_scope(self, exc):
+        scope = g.pop('_db_scope', None)
+        if scope is None or scope.conn is None:
+            return
+        try:
+            if scope.trans.is_active:
+                scope.trans.rollback()
+        finally:
+            scope.conn.close()
+
+    @contextmanager
+    def _connection(self, read_only=False, isolation=None, statement=None):
+        # inside a @unit_of_work request the scope's own options apply
+        conn = self._request_connection()
+        if conn is not None:
+            scope = g._db_scope
+            try:
+                yield conn
+            except OperationalError as e:
+                if scope.replica is None:
+                    raise
+                # the rest of the request runs on the primary
+                self._replica_failed(scope.replica, e)
+                scope.primary_only = True
+                scope.replica = scope.trans = None
+                scope.conn, failed = None, scope.conn
+                failed.close()
+                raise _ReplicaReadFailed() from e
+            return
+        # statement is only passed by callers whose reads may use a replica
+        if statement is not None and self._use_replica(statement, isolation):
+            acquired = self._replica_connection(isolation)
+            if acquired is not None:
+                replica, conn = acquired
+                try:
+                    with conn, conn.begin():
+                        yield conn
+                except OperationalError as e:
+                    self._replica_failed(replica, e)
+                    raise _ReplicaReadFailed() from e
+                return
+        options = self._transaction_options(read_only, isolation)
+        if not options:
+            with self.engine.begin() as conn:
+                yield conn
+            return
+        with self.engine.connect() as conn:
+            conn.execution_options(**options)
+            with conn.begin():
+                yield conn
+
+    def _read(self, run, read_only=False, isolation=None, statement=None):
+        """Return run(conn) on the connection _connection() picks.  A read
+        that fails on a replica with an OperationalError (the replica went
+        away, or cancelled the query) is run again on the primary."""
+        try:
+            with self._connection(read_only, isolation, statement) as conn:
+                return run(conn)
+        except _ReplicaReadFailed:
+            with self._connection(read_only, isolation) as conn:
+                return run(conn)
+
+    def execute(self, sqlstr, read_only=False, isolation=None, **kwargs):
         """Execute a single SQL statement sqlstr.
         If the statement is a query or a modification with a RETURNING clause,
         return the list of result tuples;
@@ -30,33 +465,154 @@ class DB:
         return the rows matched by the WHERE criterion of the UPDATE or DELETE statement;
         otherwise, return None.
         An exception will be raised for any error encountered.
-        sqlstr will be wrapped automatically in a sqlalchemy.sql.expression.TextClause.
+        sqlstr will be wrapped automatically in a sqlalchemy.sql.expression.TextClause
+        (cached per distinct string, so prefer bind parameters over building
+        values into the SQL text).
         You can use :param inside sqlstr and supply its value as a kwarg.  See
         https://docs.sqlalchemy.org/en/14/core/connections.html#sqlalchemy.engine.execute
         https://docs.sqlalchemy.org/en/14/core/sqlelement.html#sqlalchemy.sql.expression.text
         https://docs.sqlalchemy.org/en/14/core/connections.html#sqlalchemy.engine.CursorResult
         for additional details.  See models/*.py for examples of
         calling this function.
+        Pass read_only=True for pure reads so they run in a READ ONLY
+        transaction at DB_READ_ISOLATION (on a replica, if configured),
+        and/or isolation='...' to pick the isolation level explicitly.
         """
-        with self.engine.begin() as conn:
-            result = conn.execute(text(sqlstr), kwargs)
+        def run(conn):
+            result = conn.execute(self.text(sqlstr), kwargs)
             if result.returns_rows:
                 return result.fetchall()
             else:
                 return result.rowcount
+        return self._read(run, read_only, isolation, sqlstr if read_only else None)
+
+    def execute_cached(self, sqlstr, cache_tables, cache_ttl=None, **kwargs):
+        """Like execute() for a SELECT, but the result is kept in the query
+        cache for cache_ttl seconds (default DB_QUERY_CACHE_TTL), keyed by
+        sqlstr and the parameter values.  cache_tables lists every table
+        the query reads; any write to one of them through this DB drops the
+        entry:
+
+        >>> rows = app.db.execute_cached('SELECT ... FROM categories',
+        >>>                              cache_tables=('categories',))
+
+        Only writes made by this process invalidate entries; other
+        processes' writes show up once the TTL runs out.  Keep data that
+        must be current (stock, prices, offers) out of cached queries.
+
+        The cached rows are shared between callers and must not be
+        modified.  Misses always run on the primary (outside a read-only
+        request scope that is on a replica), so a lagging replica cannot
+        repopulate an entry right after an invalidation.
+        """
+        if self.query_cache is None:
+            return self.execute(sqlstr, **kwargs)
+        key = (sqlstr, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable parameter (e.g. a list): not cacheable
+            return self.execute(sqlstr, **kwargs)
+        rows = self.query_cache.get(key)
+        if rows is None:
+            generation = self.query_cache.generation()
+            rows = self._execute_on_primary(sqlstr, kwargs)
+            self.query_cache.put(key, rows, frozenset(cache_tables), ttl=cache_ttl,
+                                 generation=generation)
+        return rows
+
+    def _execute_on_primary(self, sqlstr, params):
+        # A request scope's connection is used unless it is (or, read-only
+        # and not yet opened, may become) a replica connection; the read
+        # then gets a read-only transaction of its own on the primary.
+        scope = g.get('_db_scope') if has_request_context() else None
+        if scope is None or not (scope.replica is not None or (
+                scope.conn is None and self.replicas and not scope.primary_only
+                and scope.options.get('postgresql_readonly'))):
+            return self.execute(sqlstr, **params)
+        with self.engine.connect() as conn:
+            conn.execution_options(**self._transaction_options(read_only=True))
+            with conn.begin():
+                return conn.execute(self.text(sqlstr), params).fetchall()
+
+    def execute_batch(self, sqlstr, rows, conn=None, **kwargs):
+        """Execute sqlstr once for a whole batch of rows (dicts sharing the
+        same keys) instead of once per row.  Each key is bound as an array
+        holding that column's values, so the statement reads the batch as
+        a relation with unnest():
 
-    def query_all(self, sqlstr, params=None, **kwargs):
-        """Run a SELECT and return a list of dicts (column_name -> value)."""
+        >>> app.db.execute_batch('''
+        >>> UPDATE inventory i SET quantity_on_hand = i.quantity_on_hand - t.qty
+        >>> FROM unnest(CAST(:sid AS INT[]), CAST(:pid AS INT[]), CAST(:qty AS INT[]))
+        >>>      AS t(sid, pid, qty)
+        >>> WHERE i.seller_id = t.sid AND i.product_id = t.pid
+        >>> ''', items, conn=conn)
+
+        Extra kwargs are bound as ordinary scalar parameters.  Pass conn to
+        run inside a transaction you already hold (e.g. in run_transaction);
+        otherwise this behaves like execute().  An empty batch is not sent
+        to the database at all and returns 0.
+        """
+        if not rows:
+            return 0
+        params = {key: [row[key] for row in rows] for key in rows[0]}
+        params.update(kwargs)
+        if conn is None:
+            with self._connection() as conn:
+                result = conn.execute(self.text(sqlstr), params)
+                return result.fetchall() if result.returns_rows else result.rowcount
+        result = conn.execute(self.text(sqlstr), params)
+        return result.fetchall() if result.returns_rows else result.rowcount
+
+    def stream(self, sqlstr, params=None, batch_size=1000, mappings=False, primary=False,
+               **kwargs):
+        """Run a SELECT through a server-side cursor and yield its rows
+        one at a time (as tuples, or as dicts with mappings=True), fetching
+        batch_size rows per round-trip, so memory use does not grow with
+        the size of the result.  The query runs read-only (see execute()),
+        on a replica if one is configured unless primary=True (for reads
+        that must see every committed write, like the CSV exports); the
+        connection is held until the generator is exhausted or closed.
+        If a replica fails before the first row, the query is run again on
+        the primary; after that the error is raised, as the rows already
+        yielded cannot be taken back.
+        """
+        bind = params if params is not None else kwargs
+        options = {'stream_results': True, 'yield_per': batch_size}
+        statement = None if primary else sqlstr
+        yielded = False
+        while True:
+            try:
+                with self._connection(read_only=True, statement=statement) as conn:
+                    result = conn.execute(self.text(sqlstr), bind, execution_options=options)
+                    for row in result.mappings() if mappings else result:
+                        yielded = True
+                        yield dict(row) if mappings else row
+                return
+            except _ReplicaReadFailed as e:
+                if yielded:
+                    raise e.__cause__
+                statement = None
+
+    def query_all(self, sqlstr, params=None, read_only=False, isolation=None, **kwargs):
+        """Run a SELECT and return a list of dicts (column_name -> value).
+        read_only/isolation behave as in execute(); plain reads may be
+        answered by a replica."""
         # allow either dict via params=... or kwargs (named params)
         bind = params if params is not None else kwargs
-        with self.engine.begin() as conn:
-            result = conn.execute(text(sqlstr), bind)
-            return [dict(row._mapping) for row in result]
 
-    def query_one(self, sqlstr, params=None, **kwargs):
-        """Run a SELECT and return a single dict (or None)."""
+        def run(conn):
+            return [dict(row._mapping) for row in conn.execute(self.text(sqlstr), bind)]
+        return self._read(run, read_only, isolation, sqlstr)
+
+    def query_one(self, sqlstr, params=None, read_only=False, isolation=None, **kwargs):
+        """Run a SELECT and return a single dict (or None).
+        read_only/isolation behave as in execute(); plain reads may be
+        answered by a replica."""
         bind = params if params is not None else kwargs
-        with self.engine.begin() as conn:
-            result = conn.execute(text(sqlstr), bind).mappings().first()
+
+        def run(conn):
+            result = conn.execute(self.text(sqlstr), bind).mappings().first()
             return dict(result) if result else None
+        return self._read(run, read_only, isolation, sqlstr)
 
@@ -0,0 +1,99 @@
+import re
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError
+
+
+# Statements containing any of these are never sent to a replica.
+_WRITE_RE = re.compile(
+    r'\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|ALTER|DROP|GRANT|REVOKE'
+    r'|COPY|LOCK|NEXTVAL|SETVAL|PG_NOTIFY)\b|\bFOR\s+(NO\s+KEY\s+|KEY\s+)?(UPDATE|SHARE)\b',
+    re.IGNORECASE)
+
+
+def is_read_statement(statement):
+    """True if statement is a plain query that a hot standby can answer."""
+    return _WRITE_RE.search(statement) is None
+
+
+class _Replica:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.down_until = 0.0
+        self.checkouts = 0
+        self.failures = 0
+
+
+class ReplicaSet:
+    """Read replicas handed out round-robin.
+
+    A replica whose connect attempt fails, or that drops a connection
+    during a read (see mark_down()), is skipped for retry_interval
+    seconds; acquire() returns None when no replica is usable, in which
+    case the caller falls back to the primary.
+    """
+
+    def __init__(self, engines, retry_interval=30.0):
+        self.replicas = [_Replica(engine) for engine in engines]
+        self.retry_interval = retry_interval
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def _candidates(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        now = time.monotonic()
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [r for r in ordered if r.down_until <= now]
+
+    def acquire(self):
+        """Return (replica, connection) for the next healthy replica, or None."""
+        for replica in self._candidates():
+            try:
+                conn = replica.engine.connect()
+            except DBAPIError:
+                self.mark_down(replica)
+                continue
+            with self._lock:
+                replica.checkouts += 1
+                replica.down_until = 0.0
+            return replica, conn
+        self.record_fallback()
+        return None
+
+    def record_fallback(self):
+        """Count a read sent to the primary for want of a working replica."""
+        with self._lock:
+            self.fallbacks += 1
+
+    def mark_down(self, replica):
+        """Skip replica for the next retry_interval seconds."""
+        with self._lock:
+            replica.failures += 1
+            replica.down_until = time.monotonic() + self.retry_interval
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'fallbacks_to_primary': self.fallbacks,
+                'replicas': [{
+                    'url': r.engine.url.render_as_string(hide_password=True),
+                    'healthy': r.down_until <= now,
+                    'retry_in_s': round(max(r.down_until - now, 0.0), 1),
+                    'checkouts': r.checkouts,
+                    'failures': r.failures,
+                    'checked_out': r.engine.pool.checkedout(),
+                } for r in self.replicas],
+            }
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose()
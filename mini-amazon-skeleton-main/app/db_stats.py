@@ -0,0 +1,159 @@
+import re
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+# Upper bounds (milliseconds) of the checkout wait histogram buckets.
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts from the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.connects = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, wait_ms, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if wait_ms <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+            else:
+                self.wait_buckets[-1] += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self):
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            histogram = {f'le_{bound}ms': n
+                         for bound, n in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+            histogram[f'gt_{WAIT_BUCKETS_MS[-1]}ms'] = self.wait_buckets[-1]
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'wait_avg_ms': round(self.wait_total_ms / waits, 3) if waits else 0.0,
+                'wait_max_ms': round(self.wait_max_ms, 3),
+                'wait_histogram': histogram,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited to a PoolStats.
+
+    The wait includes time spent blocked on an exhausted pool as well as
+    time spent opening a fresh connection when the pool has to grow.
+    """
+
+    stats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            if self.stats is not None:
+                self.stats.record_wait((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        if self.stats is not None:
+            self.stats.record_wait((time.perf_counter() - start) * 1000)
+        return conn
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting to the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class RetryStats:
+    """Counters for DB.run_transaction retries on serialization failures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.transactions = 0
+        self.retried_transactions = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.retries_by_sqlstate = {}
+
+    def record_retry(self, sqlstate):
+        with self._lock:
+            self.retries += 1
+            self.retries_by_sqlstate[sqlstate] = self.retries_by_sqlstate.get(sqlstate, 0) + 1
+
+    def record_done(self, attempts, exhausted=False):
+        with self._lock:
+            self.transactions += 1
+            if attempts > 1:
+                self.retried_transactions += 1
+            if exhausted:
+                self.exhausted += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'transactions': self.transactions,
+                'retried_transactions': self.retried_transactions,
+                'retries': self.retries,
+                'exhausted': self.exhausted,
+                'retries_by_sqlstate': dict(self.retries_by_sqlstate),
+            }
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def statement_shape(statement):
+    """Collapse whitespace and replace literal strings/numbers with '?',
+    so that statements differing only in inlined values compare equal."""
+    return _LITERAL_RE.sub('?', _WHITESPACE_RE.sub(' ', statement).strip())
+
+
+class RequestQueryStats:
+    """SQL statements issued while handling one request."""
+
+    def __init__(self, keep_slowest=3):
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = []   # [(elapsed_ms, shape)], slowest first
+        self.shapes = {}    # shape -> times seen
+
+    def record(self, statement, elapsed_ms):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if len(self.slowest) < self.keep_slowest or elapsed_ms > self.slowest[-1][0]:
+            self.slowest.append((elapsed_ms, shape))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep_slowest:]
+
+    def repeated(self, threshold):
+        """Shapes issued at least `threshold` times: likely N+1 loops."""
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
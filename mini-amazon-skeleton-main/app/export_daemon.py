@@ -0,0 +1,170 @@
+"""Standalone process that keeps db/generate/*.csv in step with the database.
+
+Row-level triggers on every exported table (see csv_sync.TABLES) send the
+primary key of each inserted, updated or deleted row to the csv_export
+channel with pg_notify().  This daemon LISTENs on that channel and feeds
+the keys to an ExportWorker, which coalesces them and appends the changed
+rows to the delta logs, so every write reaches the snapshots -- whichever
+code path made it -- and the web processes (CSV_EXPORT_MODE=daemon) do no
+export work at all.
+
+Run it next to the web server:
+
+    python -m app.export_daemon            # installs the triggers, then listens
+    python -m app.export_daemon --uninstall
+
+On start, and after losing its connection, it writes full snapshots of all
+tables, since notifications sent while nobody listens are lost.
+"""
+import argparse
+import json
+import select
+import time
+
+from sqlalchemy import text
+
+from . import create_app
+from .csv_sync import TABLES, export_table
+from .export_worker import ExportWorker
+
+CHANNEL = 'csv_export'
+
+_NOTIFY_FUNCTION = f'''
+CREATE OR REPLACE FUNCTION csv_export_notify()
+RETURNS TRIGGER AS $$
+DECLARE
+  rec JSONB;
+  keys JSONB;
+  old_keys JSONB;
+  col TEXT;
+BEGIN
+  -- TG_ARGV holds the primary key column names of the table
+  IF TG_OP = 'DELETE' THEN rec := to_jsonb(OLD); ELSE rec := to_jsonb(NEW); END IF;
+  keys := '[]'::jsonb;
+  FOREACH col IN ARRAY TG_ARGV LOOP
+    keys := keys || jsonb_build_array(rec -> col);
+  END LOOP;
+  PERFORM pg_notify('{CHANNEL}', jsonb_build_object('t', TG_TABLE_NAME, 'k', keys)::text);
+
+  IF TG_OP = 'UPDATE' THEN
+    -- the key itself may have changed: the old key is now a delete
+    rec := to_jsonb(OLD);
+    old_keys := '[]'::jsonb;
+    FOREACH col IN ARRAY TG_ARGV LOOP
+      old_keys := old_keys || jsonb_build_array(rec -> col);
+    END LOOP;
+    IF old_keys <> keys THEN
+      PERFORM pg_notify('{CHANNEL}', jsonb_build_object('t', TG_TABLE_NAME, 'k', old_keys)::text);
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+def install_triggers(app):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(_NOTIFY_FUNCTION))
+        for table in TABLES.values():
+            key_args = ', '.join(f"'{col}'" for col in table.key)
+            conn.execute(text(f'DROP TRIGGER IF EXISTS trg_csv_export_notify ON {table.name}'))
+            conn.execute(text(f'''
+CREATE TRIGGER trg_csv_export_notify
+AFTER INSERT OR UPDATE OR DELETE ON {table.name}
+FOR EACH ROW
+EXECUTE FUNCTION csv_export_notify({key_args})
+'''))
+
+
+def uninstall_triggers(app):
+    with app.db.engine.begin() as conn:
+        for table in TABLES.values():
+            conn.execute(text(f'DROP TRIGGER IF EXISTS trg_csv_export_notify ON {table.name}'))
+        conn.execute(text('DROP FUNCTION IF EXISTS csv_export_notify()'))
+
+
+def _listen(app):
+    # a dedicated connection, taken out of the pool for good
+    conn = app.db.engine.raw_connection()
+    dbapi_conn = conn.driver_connection
+    conn.detach()
+    try:
+        dbapi_conn.autocommit = True
+        with dbapi_conn.cursor() as cur:
+            cur.execute(f'LISTEN {CHANNEL}')
+    except Exception:
+        dbapi_conn.close()
+        raise
+    return dbapi_conn
+
+
+def run(app, initial_export=True, poll_timeout=5.0):
+    worker = ExportWorker(app, interval=app.config.get('CSV_EXPORT_INTERVAL', 1.0),
+                          compact_interval=app.config.get('CSV_COMPACT_INTERVAL', 300))
+    backoff = 1.0
+    while True:
+        conn = None
+        try:
+            conn = _listen(app)
+            app.logger.info('listening on %s', CHANNEL)
+            if initial_export:
+                # LISTEN first, so nothing committed after the snapshot is missed
+                with app.app_context():
+                    for name in TABLES:
+                        export_table(name)
+            initial_export = True
+            backoff = 1.0
+            while True:
+                if select.select([conn], [], [], poll_timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(note.payload)
+                        table, key = payload['t'], payload['k']
+                    except (ValueError, KeyError):
+                        app.logger.warning('ignoring malformed notification %r', note.payload)
+                        continue
+                    if table in TABLES:
+                        worker.mark_dirty(table, [key])
+        except KeyboardInterrupt:
+            worker.stop()
+            return
+        except Exception:
+            app.logger.exception('export daemon lost its connection; retrying in %.0f s', backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+        finally:
+            # the connection is detached from the pool: close it ourselves,
+            # or each reconnect leaves a backend LISTENing behind
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep db/generate/*.csv up to date from '
+                                                 'row change notifications.')
+    parser.add_argument('--uninstall', action='store_true',
+                        help='drop the notification triggers and exit')
+    parser.add_argument('--no-install', action='store_true',
+                        help='do not (re)create the notification triggers')
+    parser.add_argument('--no-initial-export', action='store_true',
+                        help='skip the full export on start-up')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.uninstall:
+        uninstall_triggers(app)
+        return
+    if not args.no_install:
+        install_triggers(app)
+    run(app, initial_export=not args.no_initial_export)
+
+
+if __name__ == '__main__':
+    main()
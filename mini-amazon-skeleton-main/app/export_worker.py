@@ -0,0 +1,157 @@
+import atexit
+import threading
+import time
+
+
+# pending[table] = FULL: rewrite the whole snapshot instead of a delta
+FULL = None
+
+
+class ExportWorker:
+    """Background thread that keeps db/generate/*.csv up to date.
+
+    Requests call mark_dirty() after committing and return immediately.
+    Signals arriving within `interval` seconds of the first one are
+    coalesced, so a burst of writes to a table costs one export of the
+    union of the changed keys (or a single full export).  Being the only
+    writer of the CSV files in this process, the worker also removes the
+    races between concurrent requests exporting the same table.
+
+    Every compact_interval seconds (if set) it also folds the delta logs
+    into their snapshots (csv_sync.compact_all), so the snapshots of
+    quiet tables do not wait for their log to grow past
+    CSV_DELTA_MAX_BYTES.
+    """
+
+    def __init__(self, app, interval=1.0, compact_interval=None):
+        self.app = app
+        self.interval = interval
+        self.compact_interval = compact_interval
+        self._next_compact = None   # monotonic deadline, set once the thread runs
+        self._cond = threading.Condition()
+        self._pending = {}          # table -> set of keys, or FULL
+        self._oldest = None         # monotonic time of the oldest pending signal
+        self._thread = None
+        self._stopping = False
+        self.signals = 0
+        self.batches = 0
+        self.exports = 0
+        self.compactions = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_lag_s = 0.0
+        self.last_duration_s = 0.0
+
+    def mark_dirty(self, table, keys=FULL):
+        """Schedule an export of table: of the given primary keys
+        (see csv_sync.export_changes), or of the whole table if keys is None."""
+        with self._cond:
+            if keys is FULL or self._pending.get(table, ()) is FULL:
+                self._pending[table] = FULL
+            else:
+                self._pending.setdefault(table, set()).update(tuple(k) for k in keys)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self.signals += 1
+            self._ensure_started()
+            self._cond.notify()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='csv-export', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        if self.compact_interval:
+            self._next_compact = time.monotonic() + self.compact_interval
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping and not self._compact_due():
+                    self._cond.wait(self._compact_wait())
+                if self._stopping and not self._pending:
+                    return
+                exporting = bool(self._pending)
+            if exporting:
+                if not self._stopping:
+                    # let the rest of the burst arrive
+                    time.sleep(self.interval)
+                with self._cond:
+                    batch, self._pending = self._pending, {}
+                    oldest, self._oldest = self._oldest, None
+                self._export(batch, oldest)
+            if self._compact_due():
+                self._compact()
+
+    def _compact_wait(self):
+        # seconds until the next compaction, None (forever) without one
+        if self._next_compact is None:
+            return None
+        return max(0.0, self._next_compact - time.monotonic())
+
+    def _compact_due(self):
+        return self._next_compact is not None and self._next_compact <= time.monotonic()
+
+    def _compact(self):
+        from .csv_sync import compact_all
+
+        try:
+            with self.app.app_context():
+                compact_all()
+            self.compactions += 1
+        except Exception as e:
+            self.errors += 1
+            self.last_error = f'compaction: {e}'
+            self.app.logger.exception('CSV delta compaction failed')
+        self._next_compact = time.monotonic() + self.compact_interval
+
+    def _export(self, batch, oldest):
+        from .csv_sync import export_changes, export_table
+
+        started = time.monotonic()
+        with self.app.app_context():
+            for table, keys in batch.items():
+                try:
+                    if keys is FULL:
+                        export_table(table)
+                    else:
+                        export_changes(table, keys)
+                    self.exports += 1
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = f'{table}: {e}'
+                    self.app.logger.exception('CSV export of %s failed', table)
+        finished = time.monotonic()
+        self.batches += 1
+        self.last_duration_s = finished - started
+        self.last_lag_s = finished - oldest
+
+    def stop(self, timeout=10.0):
+        """Export whatever is still pending and stop the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            pending = {table: 'full' if keys is FULL else len(keys)
+                       for table, keys in self._pending.items()}
+            lag = time.monotonic() - self._oldest if self._oldest is not None else 0.0
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval_s': self.interval,
+            'compact_interval_s': self.compact_interval,
+            'queue_depth': len(pending),
+            'pending': pending,
+            'lag_s': round(lag, 3),
+            'last_lag_s': round(self.last_lag_s, 3),
+            'last_duration_s': round(self.last_duration_s, 3),
+            'signals': self.signals,
+            'batches': self.batches,
+            'exports': self.exports,
+            'compactions': self.compactions,
+            'errors': self.errors,
+            'last_error': self.last_error,
+        }
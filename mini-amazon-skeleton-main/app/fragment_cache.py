@@ -0,0 +1,146 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+
+class _Entry:
+    __slots__ = ('version', 'html', 'expires', 'size')
+
+    def __init__(self, version, html, expires, size):
+        self.version = version
+        self.html = html
+        self.expires = expires
+        self.size = size
+
+
+class FragmentCache:
+    """In-process cache of rendered template fragments.
+
+    A fragment is stored under a key (fragment name, object id, variant...)
+    together with the version stamp of the data it was rendered from, and
+    is only served for that same version: bumping the version (e.g.
+    product_stats.version, which the triggers bump on writes to products,
+    product_reviews and review_helpful_votes and on offer price and stock
+    changes) invalidates it
+    without any explicit purge, and the next render replaces it.  Entries
+    also expire after ttl seconds, which bounds the staleness of anything
+    a fragment shows that its version does not cover.  The least recently
+    used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, max_bytes=8 * 2**20, ttl=300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> _Entry, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0                  # misses on an entry of another version
+        self.evictions = 0
+        self.expirations = 0
+        self._by_fragment = {}          # fragment name -> [hits, misses]
+
+    def get(self, key, version):
+        """The cached html of key at version, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            counts = self._by_fragment.setdefault(key[0], [0, 0])
+            if entry is None or entry.version != version:
+                if entry is not None:
+                    self.stale += 1
+                self.misses += 1
+                counts[1] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            counts[0] += 1
+            return entry.html
+
+    def put(self, key, version, html):
+        """Cache html as key's fragment at version, replacing any other
+        version of it."""
+        size = sys.getsizeof(html) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(version, html, expires, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def render(self, key, version, render):
+        """key's fragment at version, calling render() to produce (and
+        cache) it on a miss."""
+        html = self.get(key, version)
+        if html is None:
+            html = str(render())
+            self.put(key, version, html)
+        return Markup(html)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_s': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'by_fragment': {
+                    name: {'hits': hits, 'misses': misses,
+                           'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0}
+                    for name, (hits, misses) in sorted(self._by_fragment.items())},
+            }
+
+
+def cache_fragment(name, id, version, *variant, caller):
+    """Template global caching the body of a call block:
+
+        {% call cache_fragment('offers', product.id, product.version,
+                               current_user.is_authenticated) %}
+          ...
+        {% endcall %}
+
+    renders the body once per (name, id, *variant) and version.  The
+    variant arguments must cover everything else the body depends on
+    (e.g. whether a user is logged in).  Without a version, or with the
+    cache switched off, the body is rendered every time."""
+    cache = current_app.fragment_cache
+    if cache is None or version is None:
+        return caller()
+    return cache.render((name, id) + variant, version, caller)
+
+
+def init_app(app):
+    app.fragment_cache = None
+    if app.config.get('FRAGMENT_CACHE', True):
+        app.fragment_cache = FragmentCache(max_bytes=app.config.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 2**20),
+                                           ttl=app.config.get('FRAGMENT_CACHE_TTL', 300))
+    app.jinja_env.globals['cache_fragment'] = cache_fragment
@@ -1,19 +1,27 @@
-from flask import render_template
+from flask import render_template, request
 from flask_login import current_user
 import datetime
 
 from .models.product import Product
 from .models.seller import Seller
 from .models.purchase import Purchase
+from .db import unit_of_work
 
 from flask import Blueprint
 bp = Blueprint('index', __name__)
 
 
 @bp.route('/')
+@unit_of_work(read_only=True)
 def index():
-    # get all available products for sale:
-    products = Product.get_all(True)
+    # get one page of the available products for sale (in stock):
+    PER_PAGE = 24
+    page = Product.browse_page(
+        after=request.args.get('after', type=str),
+        before=request.args.get('before', type=str),
+        per_page=PER_PAGE,
+        in_stock=True
+    )
     # find the products current user has bought:
     if current_user.is_authenticated:
         purchases = Purchase.get_all_by_uid_since(
@@ -29,7 +37,8 @@ def index():
     # render the page by adding information to the index.html file
     return render_template(
         'index.html',
-        avail_products=products,
+        avail_products=page.items,
+        page=page,
         purchase_history=purchases,
         is_seller=is_seller
 )
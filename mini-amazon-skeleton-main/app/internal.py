@@ -0,0 +1,62 @@
+from flask import Blueprint, abort, jsonify, request
+from flask import current_app as app
+
+
+bp = Blueprint('internal', __name__)
+
+
+@bp.before_request
+def require_enabled():
+    # operational endpoints are only served with INTERNAL_ENDPOINTS=true,
+    # and then only to the addresses in INTERNAL_ENDPOINTS_ALLOW (loopback
+    # by default); everyone else gets the same 404 as when they are off
+    if not app.config.get('INTERNAL_ENDPOINTS'):
+        abort(404)
+    if request.remote_addr not in app.config.get('INTERNAL_ENDPOINTS_ALLOW', ()):
+        abort(404)
+
+
+@bp.get('/internal/db/pool')
+def db_pool():
+    """Connection pool occupancy and checkout wait statistics."""
+    return jsonify(app.db.pool_stats())
+
+
+@bp.get('/internal/db/retries')
+def db_retries():
+    """Serialization-failure retry counters from DB.run_transaction."""
+    return jsonify(app.db.retry_stats())
+
+
+@bp.get('/internal/db/statements')
+def db_statements():
+    """Hit/miss counters of the compiled statement cache."""
+    return jsonify(app.db.statement_cache_stats())
+
+
+@bp.get('/internal/db/query-cache')
+def db_query_cache():
+    """Query result cache hit ratio, memory use and evictions."""
+    return jsonify(app.db.query_cache_stats())
+
+
+@bp.get('/internal/fragment-cache')
+def fragment_cache():
+    """Rendered fragment cache hit ratio (overall and per fragment) and memory use."""
+    if app.fragment_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(enabled=True, **app.fragment_cache.stats()))
+
+
+@bp.get('/internal/db/replicas')
+def db_replicas():
+    """Read replica health and how often reads fell back to the primary."""
+    return jsonify(app.db.replica_stats())
+
+
+@bp.get('/internal/csv-export')
+def csv_export():
+    """Background CSV export queue depth, lag and error counters."""
+    if app.export_worker is None:
+        return jsonify({'mode': app.config.get('CSV_EXPORT_MODE')})
+    return jsonify(dict(mode='background', **app.export_worker.stats()))
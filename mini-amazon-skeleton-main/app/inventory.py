@@ -2,6 +2,7 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from flask import current_app as app
+from .search import like_pattern
 
 bp = Blueprint('inventory', __name__)
 
@@ -20,6 +21,12 @@ def get_seller_id_for_current_user():
     return row["id"] if row else None
 
 
+def _fetch_one(conn, sql, params):
+    """First row of sql as a dict (or None), run on an open connection."""
+    row = conn.execute(app.db.text(sql), params).mappings().first()
+    return dict(row) if row else None
+
+
 # ------------------------------------------------------------
 # Pages (HTML shells; the JS inside the templates calls the APIs below)
 # ------------------------------------------------------------
@@ -77,19 +84,17 @@ def api_inventory_list():
         i.price_cents,
         i.quantity_on_hand,
         i.updated_at,
-        COALESCE(AVG(pr.rating), 0)::numeric(3,2) AS avg_rating,
-        COUNT(pr.review_id) AS num_reviews
+        s.avg_rating::numeric(3,2) AS avg_rating,
+        s.review_count AS num_reviews
       FROM inventory i
       JOIN products p ON p.id = i.product_id
-      LEFT JOIN product_reviews pr ON pr.product_id = p.id
+      JOIN product_stats s ON s.product_id = p.id
       WHERE i.seller_id = :seller_id
         AND (
              :search IS NULL
-             OR p.name ILIKE '%' || :search || '%'
-             OR p.description ILIKE '%' || :search || '%'
+             OR p.name ILIKE :pattern
+             OR p.description ILIKE :pattern
         )
-      GROUP BY i.seller_id, i.product_id, p.name, p.description, p.image_url,
-               i.price_cents, i.quantity_on_hand, i.updated_at
       ORDER BY
         CASE WHEN :sort = 'price_desc' THEN i.price_cents END DESC,
         CASE WHEN :sort = 'price_asc'  THEN i.price_cents END ASC,
@@ -101,6 +106,7 @@ def api_inventory_list():
     rows = app.db.query_all(sql, {
         "seller_id": seller_id,
         "search": search,
+        "pattern": like_pattern(search) if search else None,
         "sort": sort,
         "limit": limit,
         "offset": offset
@@ -143,8 +149,6 @@ def api_inventory_upsert():
     data = request.get_json(silent=True) or {}
 
     pid_raw = data.get("product_id")
-    price_raw = data.get("price_cents", None)
-    qty_raw = data.get("quantity_on_hand", None)
 
     if pid_raw is None:
         return jsonify({"error": "product_id is required"}), 400
@@ -154,11 +158,21 @@ def api_inventory_upsert():
     except (TypeError, ValueError):
         return jsonify({"error": "product_id must be an integer"}), 400
 
-    # Look up existing inventory row for this seller/product
-    existing = app.db.query_one("""
+    body, status = app.db.run_transaction(_upsert_inventory_row, seller_id, pid, data)
+    return jsonify(body), status
+
+
+def _upsert_inventory_row(conn, seller_id, pid, data):
+    # Transaction body for api_inventory_upsert; returns (json_body, status).
+    price_raw = data.get("price_cents", None)
+    qty_raw = data.get("quantity_on_hand", None)
+
+    # Look up (and lock) existing inventory row for this seller/product
+    existing = _fetch_one(conn, """
         SELECT seller_id, product_id, price_cents, quantity_on_hand, updated_at
         FROM inventory
         WHERE seller_id = :sid AND product_id = :pid
+        FOR UPDATE
     """, {"sid": seller_id, "pid": pid})
 
     # ------------------------------------------------------------
@@ -175,7 +189,7 @@ def api_inventory_upsert():
 
         # Case: only product_id → change nothing
         if not price_provided and not qty_provided:
-            return jsonify(existing), 200
+            return existing, 200
 
         set_clauses = []
         params = {"sid": seller_id, "pid": pid}
@@ -185,9 +199,9 @@ def api_inventory_upsert():
             try:
                 new_price = int(price_raw)
             except (TypeError, ValueError):
-                return jsonify({"error": "price_cents must be an integer"}), 400
+                return {"error": "price_cents must be an integer"}, 400
             if new_price < 0:
-                return jsonify({"error": "price_cents must be non-negative"}), 400
+                return {"error": "price_cents must be non-negative"}, 400
             if new_price != cur_price:
                 set_clauses.append("price_cents = :price_cents")
                 params["price_cents"] = new_price
@@ -197,9 +211,9 @@ def api_inventory_upsert():
             try:
                 delta_qty = int(qty_raw)
             except (TypeError, ValueError):
-                return jsonify({"error": "quantity_on_hand must be an integer"}), 400
+                return {"error": "quantity_on_hand must be an integer"}, 400
             if delta_qty < 0:
-                return jsonify({"error": "quantity_on_hand must be non-negative"}), 400
+                return {"error": "quantity_on_hand must be non-negative"}, 400
 
             new_qty = cur_qty + delta_qty
             if new_qty != cur_qty:
@@ -208,16 +222,16 @@ def api_inventory_upsert():
 
         # If nothing actually changed, just return existing
         if not set_clauses:
-            return jsonify(existing), 200
+            return existing, 200
 
-        row = app.db.query_one(f"""
+        row = _fetch_one(conn, f"""
           UPDATE inventory
              SET {', '.join(set_clauses)},
                  updated_at = now()
            WHERE seller_id = :sid AND product_id = :pid
            RETURNING seller_id, product_id, price_cents, quantity_on_hand, updated_at;
         """, params)
-        return jsonify(row), 200
+        return row, 200
 
     # ------------------------------------------------------------
     # NEW ROW
@@ -226,17 +240,17 @@ def api_inventory_upsert():
     try:
         new_price = int(price_raw) if price_raw is not None else 0
     except (TypeError, ValueError):
-        return jsonify({"error": "price_cents must be an integer if provided"}), 400
+        return {"error": "price_cents must be an integer if provided"}, 400
 
     try:
         new_qty = int(qty_raw) if qty_raw is not None else 0
     except (TypeError, ValueError):
-        return jsonify({"error": "quantity_on_hand must be an integer if provided"}), 400
+        return {"error": "quantity_on_hand must be an integer if provided"}, 400
 
     if new_price < 0 or new_qty < 0:
-        return jsonify({"error": "price_cents and quantity_on_hand must be non-negative"}), 400
+        return {"error": "price_cents and quantity_on_hand must be non-negative"}, 400
 
-    row = app.db.query_one("""
+    row = _fetch_one(conn, """
       INSERT INTO inventory (seller_id, product_id, price_cents, quantity_on_hand, updated_at)
       VALUES (:sid, :pid, :price_cents, :quantity_on_hand, now())
       RETURNING seller_id, product_id, price_cents, quantity_on_hand, updated_at;
@@ -246,7 +260,7 @@ def api_inventory_upsert():
         "price_cents": new_price,
         "quantity_on_hand": new_qty
     })
-    return jsonify(row), 201
+    return row, 201
 
 
 @bp.patch('/api/inventory/<int:product_id>')
@@ -289,7 +303,7 @@ def api_inventory_patch(product_id: int):
     if not sets:
         return jsonify({"error": "No fields to update"}), 400
 
-    row = app.db.query_one(f"""
+    row = app.db.run_transaction(_fetch_one, f"""
       UPDATE inventory
          SET {', '.join(sets)}, updated_at = now()
        WHERE seller_id = :sid AND product_id = :pid
@@ -309,9 +323,10 @@ def api_inventory_delete(product_id: int):
     if not seller_id:
         return jsonify({"error": "No seller record for this user"}), 403
 
-    app.db.execute(
-        "DELETE FROM inventory WHERE seller_id = :sid AND product_id = :pid",
-        sid=seller_id, pid=product_id
+    app.db.run_transaction(
+        _fetch_one,
+        "DELETE FROM inventory WHERE seller_id = :sid AND product_id = :pid RETURNING product_id",
+        {"sid": seller_id, "pid": product_id}
     )
     return jsonify({"ok": True})
 
@@ -3,6 +3,8 @@ from flask_login import login_required, current_user
 from flask import current_app as app
 from better_profanity import profanity
 
+from .db import unit_of_work
+
 bp = Blueprint('messages', __name__)
 
 profanity.load_censor_words()
@@ -11,7 +13,8 @@ profanity.add_censor_words(['zebra'])
 
 def get_unread_count(user_id: int) -> int:
     """Get count of unread messages for a user (either as buyer or seller)."""
-    my_seller = app.db.query_one("SELECT id FROM sellers WHERE user_id = :uid", uid=user_id)
+    my_seller = app.db.query_one("SELECT id FROM sellers WHERE user_id = :uid",
+                                 read_only=True, uid=user_id)
     my_sid = my_seller["id"] if my_seller else None
     
     # Count messages where:
@@ -28,11 +31,12 @@ def get_unread_count(user_id: int) -> int:
             mt.buyer_user_id = :uid
             OR (:sid IS NOT NULL AND mt.seller_user_id = :sid)
           )
-    """, uid=user_id, sid=my_sid)
+    """, read_only=True, uid=user_id, sid=my_sid)
     
     return result['count'] if result else 0
 
 @bp.route('/messages')
+@unit_of_work(read_only=True)
 @login_required
 def threads():
     # threads where I'm buyer or I'm seller
@@ -0,0 +1,77 @@
+import inspect
+from operator import itemgetter
+
+
+class Model:
+    """Base class for the row-backed model classes.
+
+    Subclasses declare their attributes in __slots__ (no per-instance
+    __dict__) and build instances from query results with from_row() /
+    from_rows(), which match result columns to __init__ parameters by
+    name, so a query only has to alias its columns (SELECT ... AS attr)
+    instead of listing them in constructor order.  Parameters without a
+    matching column get their __init__ default.
+    """
+
+    __slots__ = ()
+
+    # (cls, column names) -> builder, see _builder()
+    _builders = {}
+
+    @classmethod
+    def from_row(cls, row):
+        """Build one instance from a result row, or None if row is None."""
+        if row is None:
+            return None
+        return cls._builder(row._fields)([row])[0]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a list of instances from result rows (e.g. DB.execute())."""
+        if not rows:
+            return []
+        return cls._builder(rows[0]._fields)(rows)
+
+    @classmethod
+    def _builder(cls, fields):
+        key = (cls, fields)
+        builder = Model._builders.get(key)
+        if builder is None:
+            builder = Model._builders[key] = cls._make_builder(fields)
+        return builder
+
+    @classmethod
+    def _make_builder(cls, fields):
+        # Columns are matched to __init__ parameters once per (class, column
+        # names); building a row is then one itemgetter call that picks the
+        # arguments in parameter order and one positional constructor call.
+        # Parameters up to the last matched one that have no column take
+        # their __init__ default from a tuple appended to the row; later
+        # ones are left out.
+        params = list(inspect.signature(cls.__init__).parameters.values())[1:]
+        unknown = set(fields) - {p.name for p in params}
+        if unknown:
+            raise AttributeError(f'{cls.__name__} has no attribute for column(s) '
+                                 f'{", ".join(sorted(unknown))}')
+        for param in params:
+            if param.name not in fields and param.default is param.empty:
+                raise TypeError(f'{cls.__name__}: no column for required attribute {param.name!r}')
+        matched = [i for i, param in enumerate(params) if param.name in fields]
+        if not matched:
+            return lambda rows: [cls() for _ in rows]
+        indices = []
+        defaults = []
+        for param in params[:matched[-1] + 1]:
+            if param.name in fields:
+                indices.append(fields.index(param.name))
+            else:
+                indices.append(len(fields) + len(defaults))
+                defaults.append(param.default)
+        if len(indices) == 1:
+            index = indices[0]
+            return lambda rows: [cls(row[index]) for row in rows]
+        getter = itemgetter(*indices)
+        if not defaults:
+            return lambda rows: [cls(*getter(row)) for row in rows]
+        defaults = tuple(defaults)
+        return lambda rows: [cls(*getter(tuple(row) + defaults)) for row in rows]
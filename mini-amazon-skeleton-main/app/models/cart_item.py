@@ -1,7 +1,13 @@
 from flask import current_app as app
 
+from .base import Model
+
+
+class CartItem(Model):
+    __slots__ = ('user_id', 'product_id', 'seller_id', 'quantity', 'is_in_cart',
+                 'image_url', 'description', 'product_name', 'seller_name',
+                 'unit_price_cents', 'inventory_quantity')
 
-class CartItem:
     def __init__(self, user_id: int, product_id: int, seller_id: int, quantity: int, is_in_cart: bool,
                  image_url: str = None, description: str = None, product_name: str = None,
                  seller_name: str = None, unit_price_cents: int = None, inventory_quantity: int = None):
@@ -23,10 +29,10 @@ class CartItem:
     def for_user(user_id: int, in_cart: bool = True):
         rows = app.db.execute('''
 SELECT c.user_id, c.product_id, c.seller_id, c.quantity, c.is_in_cart,
-       p.image_url, p.description, p.name,
+       p.image_url, p.description, p.name AS product_name,
        u.full_name AS seller_name,
-       i.price_cents,
-       i.quantity_on_hand
+       i.price_cents AS unit_price_cents,
+       i.quantity_on_hand AS inventory_quantity
 FROM cart_items c
 JOIN products p ON c.product_id = p.id
 JOIN sellers s ON s.id = c.seller_id
@@ -34,25 +40,9 @@ JOIN users u ON u.id = s.user_id
 JOIN inventory i ON i.seller_id = c.seller_id AND i.product_id = c.product_id
 WHERE c.user_id = :user_id AND c.is_in_cart = :in_cart
 ORDER BY c.product_id
-''', user_id=user_id, in_cart=in_cart) 
-        # extend CartItem to store product info as attributes (image_url, description)
-        items = []
-        for row in rows:
-            item = CartItem(
-                row[0],  # user_id
-                row[1],  # product_id
-                row[2],  # seller_id
-                row[3],  # quantity
-                row[4],  # is_in_cart
-                row[5],  # image_url
-                row[6],  # description
-                row[7],  # product_name
-                row[8],  # seller_name
-                row[9],  # unit_price_cents
-                row[10]  # inventory_quantity
-            )
-            items.append(item)
-        return items
+''', user_id=user_id, in_cart=in_cart)
+        # CartItem also carries product/seller info (image_url, description, ...)
+        return CartItem.from_rows(rows)
 
     @staticmethod
     def add_to_cart(user_id, product_id, seller_id, quantity):
@@ -2,14 +2,107 @@ from flask import current_app as app
 
 
 class Category:
-    def __init__(self, id: int, name: str, parent_id: int | None):
+    def __init__(self, id: int, name: str, parent_id: int | None, depth: int = 0):
         self.id = id
         self.name = name
         self.parent_id = parent_id
+        self.depth = depth              # 0 for a top-level category
 
     @staticmethod
     def all():
-        rows = app.db.execute('''
+        rows = app.db.execute_cached('''
 SELECT id, name, parent_id FROM categories ORDER BY name
-''')
+''', cache_tables=('categories',))
         return [Category(*row) for row in rows]
+
+    # Every category reachable from a top-level one, parents before their
+    # children and siblings by name
+    TREE_SQL = '''
+WITH RECURSIVE tree AS (
+  SELECT id, name, parent_id, 0 AS depth, ARRAY[name::text] AS path
+  FROM categories
+  WHERE parent_id IS NULL
+  UNION ALL
+  SELECT c.id, c.name, c.parent_id, t.depth + 1, t.path || c.name::text
+  FROM categories c
+  JOIN tree t ON c.parent_id = t.id
+)
+SELECT id, name, parent_id, depth FROM tree ORDER BY path
+'''
+
+    # the last tree() built, and the cached rows it was built from
+    _tree = None
+
+    @staticmethod
+    def tree():
+        """The CategoryTree.  Its rows come from the query cache, so a
+        write to categories through app.db (or the cache's TTL, for other
+        processes' writes) makes the next call rebuild it; until then
+        every call returns the same tree without querying.  (With
+        DB_QUERY_CACHE off, every call queries and rebuilds.)"""
+        rows = app.db.execute_cached(Category.TREE_SQL, cache_tables=('categories',))
+        tree = Category._tree
+        if tree is None or tree.rows is not rows:
+            tree = Category._tree = CategoryTree(rows)
+        return tree
+
+
+class CategoryTree:
+    """The categories as a tree, in depth-first order (see
+    Category.TREE_SQL), for resolving subtrees and ancestors in memory
+    instead of with a recursive query per request."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.nodes = [Category(*row) for row in rows]
+        self.by_id = {node.id: node for node in self.nodes}
+        self.children = {}
+        for node in self.nodes:
+            self.children.setdefault(node.parent_id, []).append(node)
+        # a subtree is the node and the run of deeper nodes right after it
+        self._index = {node.id: i for i, node in enumerate(self.nodes)}
+        self._subtrees = {}
+
+    def get(self, id):
+        return self.by_id.get(id)
+
+    def roots(self):
+        return self.children.get(None, [])
+
+    def ancestors(self, id):
+        """The categories above id, top-level first."""
+        path = []
+        node = self.by_id.get(id)
+        while node is not None and node.parent_id is not None:
+            node = self.by_id.get(node.parent_id)
+            path.append(node)
+        return path[::-1]
+
+    def subtree_ids(self, id):
+        """Ids of id and all its descendants, as a tuple (usable as the
+        parameter of IN :ids); (id,) if it is no known category."""
+        ids = self._subtrees.get(id)
+        if ids is None:
+            start = self._index.get(id)
+            if start is None:
+                return (id,)
+            depth = self.nodes[start].depth
+            end = start + 1
+            while end < len(self.nodes) and self.nodes[end].depth > depth:
+                end += 1
+            ids = self._subtrees[id] = tuple(node.id for node in self.nodes[start:end])
+        return ids
+
+    def rollup(self, counts):
+        """(category, count, total) for every node in tree order, where
+        count is counts.get(category id, 0) and total sums it over the
+        category's subtree."""
+        totals = [counts.get(node.id, 0) for node in self.nodes]
+        # children come after their parent, so adding each node's total to
+        # its parent's, last node first, sums whole subtrees
+        for i in range(len(self.nodes) - 1, -1, -1):
+            parent = self._index.get(self.nodes[i].parent_id)
+            if parent is not None:
+                totals[parent] += totals[i]
+        return [(node, counts.get(node.id, 0), total)
+                for node, total in zip(self.nodes, totals)]
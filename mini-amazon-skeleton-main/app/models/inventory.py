@@ -1,13 +1,25 @@
 from flask import current_app as app
 
+from .base import Model
 
-class InventoryItem:
-    def __init__(self, seller_id: int, product_id: int, price_cents: int, quantity_on_hand: int, updated_at):
+
+class InventoryItem(Model):
+    __slots__ = ('seller_id', 'product_id', 'price_cents', 'quantity_on_hand', 'updated_at',
+                 'seller_user_id', 'seller_name', 'seller_rating', 'seller_review_count')
+
+    def __init__(self, seller_id: int, product_id: int, price_cents: int, quantity_on_hand: int, updated_at,
+                 seller_user_id: int | None = None, seller_name: str | None = None,
+                 seller_rating: float | None = None, seller_review_count: int | None = None):
         self.seller_id = seller_id
         self.product_id = product_id
         self.price_cents = price_cents
         self.quantity_on_hand = quantity_on_hand
         self.updated_at = updated_at
+        # seller details, only set by the product page's offers (see ProductDetail)
+        self.seller_user_id = seller_user_id
+        self.seller_name = seller_name
+        self.seller_rating = seller_rating
+        self.seller_review_count = seller_review_count
 
     @staticmethod
     def for_seller(seller_id: int):
@@ -15,7 +27,7 @@ class InventoryItem:
 SELECT seller_id, product_id, price_cents, quantity_on_hand, updated_at
 FROM inventory WHERE seller_id = :seller_id
 ''', seller_id=seller_id)
-        return [InventoryItem(*row) for row in rows]
+        return InventoryItem.from_rows(rows)
 
     @staticmethod
     def offers_for_product(product_id: int):
@@ -23,4 +35,4 @@ FROM inventory WHERE seller_id = :seller_id
 SELECT seller_id, product_id, price_cents, quantity_on_hand, updated_at
 FROM inventory WHERE product_id = :product_id
 ''', product_id=product_id)
-        return [InventoryItem(*row) for row in rows]
+        return InventoryItem.from_rows(rows)
@@ -1,7 +1,12 @@
 from flask import current_app as app
 
+from .base import Model
+from ..search import like_pattern
+
+
+class Order(Model):
+    __slots__ = ('order_id', 'buyer_id', 'placed_at', 'shipping_address', 'order_fulfilled_at', 'status')
 
-class Order:
     def __init__(self, order_id: int, buyer_id: int, placed_at, shipping_address: str | None, order_fulfilled_at, status: str):
         self.order_id = order_id
         self.buyer_id = buyer_id
@@ -16,7 +21,7 @@ class Order:
 SELECT order_id, buyer_id, placed_at, shipping_address, order_fulfilled_at, status
 FROM orders WHERE buyer_id = :buyer_id ORDER BY placed_at DESC
 ''', buyer_id=buyer_id)
-        return [Order(*row) for row in rows]
+        return Order.from_rows(rows)
 
     @staticmethod
     def get(order_id: int, buyer_id: int | None = None):
@@ -30,7 +35,7 @@ FROM orders WHERE order_id = :order_id
 SELECT order_id, buyer_id, placed_at, shipping_address, order_fulfilled_at, status
 FROM orders WHERE order_id = :order_id AND buyer_id = :buyer_id
 ''', order_id=order_id, buyer_id=buyer_id)
-        return Order(*rows[0]) if rows else None
+        return Order.from_row(rows[0]) if rows else None
 
     @staticmethod
     def get_history(uid: int, limit: int=10, offset: int=0, q: str=None, seller_id: int=None, start_date: str=None, end_date: str=None):
@@ -47,8 +52,8 @@ FROM orders WHERE order_id = :order_id AND buyer_id = :buyer_id
         if q:
             joins.append("JOIN order_items oi_filter ON o.order_id = oi_filter.order_id")
             joins.append("JOIN products p_filter ON oi_filter.product_id = p_filter.id")
-            where_clauses.append("LOWER(p_filter.name) LIKE LOWER('%' || :q || '%')")
-            params["q"] = q
+            where_clauses.append("p_filter.name ILIKE :q")
+            params["q"] = like_pattern(q)
             joined_items = True
         
         if seller_id:
@@ -81,16 +86,15 @@ FROM orders WHERE order_id = :order_id AND buyer_id = :buyer_id
         params["limit"] = limit
         params["offset"] = offset
         
-        rows_ids = app.db.execute(query_ids, **params)
+        rows_ids = app.db.execute(query_ids, read_only=True, **params)
         if not rows_ids:
             return []
             
         order_ids = [r[0] for r in rows_ids]
         
         # 2. Fetch details for these orders
-        ids_str = ", ".join(str(oid) for oid in order_ids)
-        
-        query_details = f"""
+        # (ids are bound as an array so the SQL text is the same on every call)
+        query_details = """
             WITH user_txns AS (
                 SELECT
                     order_id,
@@ -121,11 +125,11 @@ FROM orders WHERE order_id = :order_id AND buyer_id = :buyer_id
             JOIN sellers s ON s.id = oi.seller_id
             JOIN users u ON u.id = s.user_id
             LEFT JOIN user_txns ut ON ut.order_id = o.order_id
-            WHERE o.order_id IN ({ids_str})
+            WHERE o.order_id = ANY(:order_ids)
             ORDER BY o.placed_at DESC, o.order_id DESC, oi.product_id
         """
         
-        rows_details = app.db.execute(query_details, uid=uid)
+        rows_details = app.db.execute(query_details, read_only=True, uid=uid, order_ids=order_ids)
         
         # 3. Group by Order
         orders = []
@@ -1,10 +1,19 @@
 from flask import current_app as app
 
+from .base import Model
+from .category import Category
+from ..pagination import Cursor, Page
+from ..search import TS_CONFIG, build_tsquery, excludes_only, like_pattern, plain_words
+
+
+class Product(Model):
+    __slots__ = ('id', 'name', 'description', 'image_url', 'avg_price', 'seller_count',
+                 'avg_rating', 'review_count', 'category_id', 'category_name',
+                 'available', 'created_by', 'relevance', 'version')
 
-class Product:
     def __init__(self, id, name, description=None, image_url=None, avg_price=None, seller_count=None,
                  avg_rating=None, review_count=None, category_id=None, category_name=None,
-                 available=True, created_by=None):
+                 available=True, created_by=None, relevance=None, version=None):
         self.id = id
         self.name = name
         self.description = description
@@ -13,28 +22,24 @@ class Product:
         self.seller_count = seller_count
         self.avg_rating = avg_rating
         self.review_count = review_count
-        self.category_id = category_id      
+        self.category_id = category_id
         self.category_name = category_name
         self.available = available
         self.created_by = created_by
+        # search rank, only set by sort=relevance listings
+        self.relevance = relevance
+        # product_stats.version, see fragment_version
+        self.version = version
 
-    #helper method for get_verbose, get_all, and search_filter_sort
-    @staticmethod
-    def row_to_product(row):
-        return Product(
-            id=row[0],
-            name=row[1],
-            description=row[2],
-            image_url=row[3],
-            avg_price=float(row[4]) if row[4] is not None else 0.0,
-            seller_count=int(row[5]) if row[5] is not None else 0,
-            avg_rating=float(row[6]) if row[6] is not None else 0.0,
-            review_count=int(row[7]) if row[7] is not None else 0,
-            category_id=row[8],
-            category_name=row[9],
-            created_by=row[10]
-        )
-
+    @property
+    def fragment_version(self):
+        """Version stamp of the product's cached header and card: its
+        product_stats.version and its category's name, which a category
+        rename changes without bumping the version.  None (never cached)
+        if the product was loaded without its version."""
+        if self.version is None:
+            return None
+        return self.version, self.category_name
 
     @staticmethod
     def get(id):
@@ -43,14 +48,7 @@ SELECT id, name, category_id
 FROM Products
 WHERE id = :id
 ''', id=id)
-        if not rows:
-            return None
-        row = rows[0]
-        return Product(
-            id=row[0],
-            name=row[1],
-            category_id=row[2],
-        )
+        return Product.from_row(rows[0]) if rows else None
 
     @staticmethod
     def get_verbose(id):
@@ -60,99 +58,248 @@ SELECT
     p.name,
     p.description,
     p.image_url,
-    COALESCE(AVG(i.price_cents)/100.0, 0) AS avg_price,
-    COUNT(DISTINCT i.seller_id) AS seller_count,
-    COALESCE(AVG(r.rating), 0) AS avg_rating,
-    COUNT(r.review_id) AS review_count,
+    s.avg_price,
+    s.seller_count,
+    s.avg_rating,
+    s.review_count,
     p.category_id,
     c.name AS category_name,
     p.created_by
 FROM products p
+JOIN product_stats s ON s.product_id = p.id
 LEFT JOIN categories c ON p.category_id = c.id
-LEFT JOIN inventory i ON p.id = i.product_id
-LEFT JOIN product_reviews r ON p.id = r.product_id
 WHERE p.id = :id
-GROUP BY p.id, p.name, p.description, p.image_url, p.category_id, c.name, p.created_by
 ''', id=id)
 
-        if not rows:
-            return None
-        return Product.row_to_product(rows[0])
+        return Product.from_row(rows[0]) if rows else None
 
-    @staticmethod
-    def get_all(available=True):
-        rows = app.db.execute('''
-SELECT
-    p.id,
-    p.name,
-    p.description,
-    p.image_url,
-    COALESCE(AVG(i.price_cents)/100.0, 0) AS avg_price,
-    COUNT(DISTINCT i.seller_id) AS seller_count,
-    COALESCE(AVG(r.rating), 0) AS avg_rating,
-    COUNT(r.review_id) AS review_count,
-    p.category_id,
-    c.name AS category_name,
-    p.created_by
-FROM products p
-LEFT JOIN categories c ON p.category_id = c.id
-LEFT JOIN inventory i ON p.id = i.product_id
-LEFT JOIN product_reviews r ON p.id = r.product_id
-GROUP BY p.id, p.name, p.description, p.image_url, p.category_id, c.name, p.created_by
-''')
+    # Relevance of a product to :tsquery, for sort=relevance
+    RANK_SQL = f"ts_rank_cd(p.search_vector, to_tsquery('{TS_CONFIG}', :tsquery))"
 
-        return [Product.row_to_product(row) for row in rows]
+    # sort -> (key expression, id expression, Product attribute holding the
+    # key, descending).  Ties are broken by id in the same direction, so
+    # (key, id) orders rows totally and can be seeked with a row comparison;
+    # product_stats is indexed on (avg_price, product_id) and
+    # (avg_rating, product_id), products on (name, id).
+    SORT_KEYS = {
+        'name': ('p.name', 'p.id', 'name', False),
+        'price_asc': ('s.avg_price', 's.product_id', 'avg_price', False),
+        'price_desc': ('s.avg_price', 's.product_id', 'avg_price', True),
+        'rating_desc': ('s.avg_rating', 's.product_id', 'avg_rating', True),
+        'relevance': (RANK_SQL, 'p.id', 'relevance', True),
+    }
 
-    @staticmethod
-    def search_filter_sort(category=None, search=None, sort=None, limit=None):
-        query = '''
+    # Counts above this are reported as capped (or estimated), not exact
+    COUNT_CAP = 1000
+
+    # The browse page's facet filters, as conditions on product_stats s
+    # (buckets: see db/create.sql and product_facet.py).  product_facets
+    # has the same columns, so they apply to it as well.  A category
+    # filter matches its whole subtree.
+    FACET_FILTERS = {
+        'category': 's.category_id IN :category',
+        'price': 's.price_bucket = :price',
+        'rating': 's.rating_bucket >= :rating',
+        'in_stock': 's.in_stock',
+    }
+
+    BROWSE_SQL = '''
 SELECT
     p.id,
     p.name,
     p.description,
     p.image_url,
-    COALESCE(AVG(i.price_cents)/100.0, 0) AS avg_price,
-    COUNT(DISTINCT i.seller_id) AS seller_count,
-    COALESCE(AVG(r.rating), 0) AS avg_rating,
-    COUNT(r.review_id) AS review_count,
+    s.avg_price,
+    s.seller_count,
+    s.avg_rating,
+    s.review_count,
     p.category_id,
     c.name AS category_name,
-    p.created_by
+    p.created_by,
+    s.version{extra_columns}
 FROM products p
+JOIN product_stats s ON s.product_id = p.id
 LEFT JOIN categories c ON p.category_id = c.id
-LEFT JOIN inventory i ON p.id = i.product_id
-LEFT JOIN product_reviews r ON p.id = r.product_id
-WHERE 1=1
+WHERE 1=1{where}
 '''
-        params = {}
 
+    @staticmethod
+    def facet_filters(category=None, price=None, rating=None, in_stock=False):
+        """The FACET_FILTERS in use, by name, and their parameters."""
         if category:
-            query += ' AND p.category_id = :category'
-            params['category'] = category
+            try:
+                # ids from the cached tree, no recursive query
+                category = Category.tree().subtree_ids(int(category))
+            except ValueError:
+                category = None
+        values = {'category': category or None, 'price': price, 'rating': rating or None,
+                  'in_stock': in_stock or None}
+        params = {name: value for name, value in values.items()
+                  if value is not None and name != 'in_stock'}
+        filters = {name: Product.FACET_FILTERS[name]
+                   for name, value in values.items() if value is not None}
+        return filters, params
 
-        if search:
-            query += ' AND (LOWER(p.name) LIKE LOWER(:search) OR LOWER(p.description) LIKE LOWER(:search))'
-            params['search'] = f'%{search}%'
+    @staticmethod
+    def _search_filters(category=None, search=None, price=None, rating=None, in_stock=False):
+        """The AND-ed conditions on products p and product_stats s for
+        the facet filters and a search box string, their parameters, and
+        the tsquery to rank by (if any; not for a query that only excludes
+        words, which matches too much to be worth ranking)."""
+        filters, params = Product.facet_filters(category, price, rating, in_stock)
+        where = ''.join(f' AND {sql}' for sql in filters.values())
 
-        query += '''
-GROUP BY p.id, p.name, p.description, p.image_url, p.category_id, c.name, p.created_by
-'''
+        tsquery = None
+        if search and app.config.get('PRODUCT_SEARCH_MODE', 'like') == 'fts':
+            # GIN index lookup on the generated tsvector, see search.build_tsquery
+            tsquery = build_tsquery(search)
+            if tsquery:
+                where += f" AND p.search_vector @@ to_tsquery('{TS_CONFIG}', :tsquery)"
+                params['tsquery'] = tsquery
+                if excludes_only(tsquery):
+                    # e.g. "-used": every product without the word, found by
+                    # filtering the listing (nothing to look up in the index)
+                    tsquery = None
+        elif search:
+            # trigram-indexed substring match
+            where += ' AND (p.name ILIKE :search OR p.description ILIKE :search)'
+            params['search'] = like_pattern(search)
+
+        return where, params, tsquery
+
+    @staticmethod
+    def _sort_key(sort, tsquery):
+        if sort == 'relevance' and not tsquery:
+            sort = 'name'
+        return Product.SORT_KEYS.get(sort) or Product.SORT_KEYS['name']
+
+    @staticmethod
+    def search_filter_sort(category=None, search=None, sort=None, limit=None,
+                           price=None, rating=None, in_stock=False):
+        where, params, tsquery = Product._search_filters(category, search, price, rating, in_stock)
+        key, id_key, attr, descending = Product._sort_key(sort, tsquery)
+        order = 'DESC' if descending else 'ASC'
+
+        query = Product.BROWSE_SQL.format(
+            extra_columns=f',\n    {key} AS relevance' if attr == 'relevance' else '',
+            where=where)
+        query += f' ORDER BY {key} {order}, {id_key} {order}'
+
+        # LIMIT NULL means no limit, so the clause is always present
+        query += ' LIMIT :limit'
+        params['limit'] = limit or None
+
+        rows = app.db.execute(query, read_only=True, **params)
+        return Product.from_rows(rows)
+
+    @staticmethod
+    def browse_page(category=None, search=None, sort=None, after=None, before=None,
+                    per_page=20, limit=None, price=None, rating=None, in_stock=False,
+                    total=None):
+        """One page of search_filter_sort()'s results, found by seeking
+        past the (encoded) cursor `after`, or back from `before`, rather
+        than with OFFSET.  limit caps the total number of results.
+        Returns a pagination.Page of products with the given total (e.g.
+        from the facet counts), or else an exact, capped or estimated one,
+        see count_matching()."""
+        where, params, tsquery = Product._search_filters(category, search, price, rating, in_stock)
+        key, id_key, attr, descending = Product._sort_key(sort, tsquery)
 
-        if sort == 'price_asc':
-            query += ' ORDER BY avg_price ASC'
-        elif sort == 'price_desc':
-            query += ' ORDER BY avg_price DESC'
-        elif sort == 'rating_desc':
-            query += ' ORDER BY avg_rating DESC'
+        backwards = False
+        cursor = Cursor.decode(before)
+        if cursor is not None:
+            backwards = True
         else:
-            query += ' ORDER BY p.name'
+            cursor = Cursor.decode(after)
+        if cursor is not None and not isinstance(cursor.key, str if attr == 'name' else (int, float)):
+            cursor = None
+            backwards = False
 
-        if limit:
-            query += ' LIMIT :limit'
-            params['limit'] = limit
+        pos = cursor.pos if cursor is not None and not backwards else 0
+        size = per_page
+        if limit and not backwards:
+            size = max(0, min(per_page, limit - pos))
 
-        rows = app.db.execute(query, **params)
-        return [Product.row_to_product(row) for row in rows]
+        # walking back from `before` reads the order in reverse
+        reverse = descending != backwards
+        if cursor is not None:
+            where += f' AND ({key}, {id_key}) {"<" if reverse else ">"} (:cursor_key, :cursor_id)'
+            params['cursor_key'] = cursor.key
+            params['cursor_id'] = cursor.id
+        order = 'DESC' if reverse else 'ASC'
+
+        query = Product.BROWSE_SQL.format(
+            extra_columns=f',\n    {key} AS relevance' if attr == 'relevance' else '',
+            where=where)
+        query += f' ORDER BY {key} {order}, {id_key} {order} LIMIT :size'
+        # one row more than the page tells whether there is another page
+        rows = app.db.execute(query, read_only=True, size=size + 1, **params) if size else []
+        more = len(rows) > size
+        products = Product.from_rows(rows[:size])
+
+        if backwards:
+            products.reverse()
+            pos = max(0, cursor.pos - len(products))
+            has_prev, has_next = more and pos > 0, True
+        else:
+            has_prev, has_next = pos > 0, more and not (limit and pos + size >= limit)
+
+        def at(product, position):
+            return Cursor(getattr(product, attr), product.id, position).encode()
+
+        if total is None:
+            total, exact = Product.count_matching(category, search, price=price, rating=rating,
+                                                  in_stock=in_stock)
+        else:
+            exact = True
+        if limit and limit < total:
+            total, exact = limit, True
+        return Page(
+            products, pos, per_page,
+            next_cursor=at(products[-1], pos + len(products)) if products and has_next else None,
+            prev_cursor=at(products[0], pos) if products and has_prev else None,
+            total=total, total_exact=exact)
+
+    @staticmethod
+    def suggest(search, limit=3):
+        """Names of products resembling a search that found nothing, for
+        "did you mean": the closest by trigram word similarity, so typos
+        within longer names are forgiven.  [] without pg_trgm."""
+        words = plain_words(search)
+        if not words or not app.db.has_extension('pg_trgm'):
+            return []
+        rows = app.db.execute('''
+SELECT name
+FROM products
+WHERE :words <% name
+ORDER BY word_similarity(:words, name) DESC, name
+LIMIT :limit
+''', read_only=True, words=words, limit=limit)
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def count_matching(category=None, search=None, cap=None, price=None, rating=None,
+                       in_stock=False):
+        """(number of products matching, exact?).  Counting stops at cap
+        (default COUNT_CAP) matches; past it the whole catalog's size is
+        estimated from the planner statistics, a filtered count is
+        reported as cap."""
+        cap = cap or Product.COUNT_CAP
+        where, params, _ = Product._search_filters(category, search, price, rating, in_stock)
+        rows = app.db.execute(f'''
+SELECT COUNT(*)
+FROM (SELECT 1 FROM products p JOIN product_stats s ON s.product_id = p.id
+      WHERE 1=1{where} LIMIT :cap) t
+''', read_only=True, cap=cap + 1, **params)
+        count = rows[0][0]
+        if count <= cap:
+            return count, True
+        if not where:
+            rows = app.db.execute('''
+SELECT reltuples::bigint FROM pg_class WHERE oid = 'products'::regclass
+''', read_only=True)
+            return max(rows[0][0], cap), False
+        return cap, False
 
     @staticmethod
     def create(name, description, created_by, image_url=None, category_id=None):
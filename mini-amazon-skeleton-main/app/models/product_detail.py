@@ -0,0 +1,127 @@
+from datetime import datetime
+
+from flask import current_app as app
+
+from .inventory import InventoryItem
+from .product import Product
+from .product_review import ProductReview
+
+
+def _timestamp(value):
+    # timestamps inside json come back as ISO 8601 strings
+    return datetime.fromisoformat(value) if value else None
+
+
+class ProductDetail:
+    """Everything the product page shows, loaded with one query: the
+    product with its statistics, its offers with each seller's name,
+    average rating and stock, the rating histogram, and the newest
+    reviews with their authors and helpful vote counts.
+
+    The offers, histogram and reviews are built by correlated subqueries
+    as json (json_agg / json_object_agg), so they come back in one row
+    instead of in separate round-trips.
+
+    The query is not cached: stock changes with every checkout without
+    bumping product_stats.version (see product_stats_inventory() in
+    db/create.sql).  The rendered fragments of the page are cached by
+    version instead (see app/fragment_cache.py, fragment_version and the
+    *_version properties).
+    """
+
+    REVIEWS_PER_PAGE = 10
+
+    SQL = '''
+SELECT
+    p.id,
+    p.name,
+    p.description,
+    p.image_url,
+    s.avg_price,
+    s.seller_count,
+    s.avg_rating,
+    s.review_count,
+    p.category_id,
+    c.name AS category_name,
+    p.created_by,
+    s.version,
+    (SELECT COALESCE(json_agg(o ORDER BY o.price_cents, o.seller_id), '[]')
+     FROM (SELECT i.seller_id, i.product_id, i.price_cents, i.quantity_on_hand, i.updated_at,
+                  se.user_id AS seller_user_id,
+                  u.full_name AS seller_name,
+                  sr.seller_rating,
+                  sr.seller_review_count
+           FROM inventory i
+           JOIN sellers se ON se.id = i.seller_id
+           JOIN users u ON u.id = se.user_id
+           CROSS JOIN LATERAL (
+             SELECT AVG(rating)::float AS seller_rating, COUNT(*) AS seller_review_count
+             FROM seller_reviews
+             WHERE seller_user_id = i.seller_id) sr
+           WHERE i.product_id = p.id) o) AS offers,
+    (SELECT json_object_agg(rating, n)
+     FROM (SELECT rating, COUNT(*) AS n
+           FROM product_reviews
+           WHERE product_id = p.id AND rating IS NOT NULL
+           GROUP BY rating) h) AS rating_histogram,
+    (SELECT COALESCE(json_agg(r ORDER BY r.created_at DESC, r.review_id DESC), '[]')
+     FROM (SELECT pr.review_id, pr.product_id, pr.author_user_id, pr.rating, pr.title, pr.body,
+                  pr.created_at, pr.updated_at,
+                  u.full_name AS author_name,
+                  (SELECT COUNT(*) FROM review_helpful_votes v
+                   WHERE v.review_id = pr.review_id) AS helpful_count
+           FROM product_reviews pr
+           JOIN users u ON u.id = pr.author_user_id
+           WHERE pr.product_id = p.id
+           ORDER BY pr.created_at DESC, pr.review_id DESC
+           LIMIT :reviews) r) AS reviews
+FROM products p
+JOIN product_stats s ON s.product_id = p.id
+LEFT JOIN categories c ON p.category_id = c.id
+WHERE p.id = :id
+'''
+
+    def __init__(self, product, offers, rating_histogram, reviews):
+        self.product = product
+        self.offers = offers                        # InventoryItems, cheapest first
+        self.rating_histogram = rating_histogram    # {stars: number of reviews}, 1..5
+        self.reviews = reviews                      # newest ProductReviews
+
+    @property
+    def offers_version(self):
+        """Version stamp of the offers table: the product's version and
+        every offer's price, stock and seller (name and rating)."""
+        return (self.product.version,) + tuple(
+            (offer.seller_id, offer.price_cents, offer.quantity_on_hand, offer.updated_at,
+             offer.seller_name, offer.seller_rating, offer.seller_review_count)
+            for offer in self.offers)
+
+    @property
+    def reviews_version(self):
+        """Version stamp of the reviews table: the product's version and
+        each review's author name, which renaming a user changes without
+        bumping the version."""
+        return (self.product.version,) + tuple(
+            (review.review_id, review.author_name) for review in self.reviews)
+
+    @staticmethod
+    def load(product_id, reviews=None):
+        """The ProductDetail of a product, or None if there is no such
+        product.  reviews is how many of the newest reviews to include
+        (default REVIEWS_PER_PAGE)."""
+        rows = app.db.execute(ProductDetail.SQL, id=product_id,
+                              reviews=reviews or ProductDetail.REVIEWS_PER_PAGE)
+        if not rows:
+            return None
+        data = rows[0]._asdict()
+        offers = data.pop('offers')
+        histogram = data.pop('rating_histogram') or {}
+        reviews = data.pop('reviews')
+        return ProductDetail(
+            product=Product(**data),
+            offers=[InventoryItem(**dict(offer, updated_at=_timestamp(offer['updated_at'])))
+                    for offer in offers],
+            rating_histogram={stars: histogram.get(str(stars), 0) for stars in range(1, 6)},
+            reviews=[ProductReview(**dict(review, created_at=_timestamp(review['created_at']),
+                                          updated_at=_timestamp(review['updated_at'])))
+                     for review in reviews])
@@ -0,0 +1,127 @@
+from flask import current_app as app
+
+from .category import Category
+from .product import Product
+
+
+# Labels of product_stats.price_bucket, see product_price_bucket() in
+# db/create.sql (rating_bucket is the whole stars, 0 if not rated)
+PRICE_BUCKETS = ('No offers', 'Under $10', '$10 to $25', '$25 to $50', '$50 to $100',
+                 '$100 to $250', '$250 & above')
+
+# GROUPING() bits of the facets query, s.category_id first
+_GROUPED_BY = {0b0111: 'category', 0b1011: 'price', 0b1101: 'rating', 0b1110: 'in_stock',
+               0b1111: 'total'}
+
+
+class FacetValue:
+    __slots__ = ('value', 'label', 'count', 'total', 'depth')
+
+    def __init__(self, value, label, count, total=None, depth=0):
+        self.value = value
+        self.label = label
+        self.count = count
+        # categories: count including the subcategories'
+        self.total = count if total is None else total
+        self.depth = depth
+
+
+class ProductFacets:
+    """Facet counts of the product browse page: how many of the products
+    matching the search (and the other facets' filters) fall in each
+    category, price bucket and rating, and how many are in stock.
+
+    Each facet is counted without its own filter, so the counts show what
+    choosing another value would give.  All of them come from one GROUPING
+    SETS query: over product_facets (a few rows per category, kept by
+    triggers) when there is no search, else over the matching products'
+    product_stats rows.
+    """
+
+    def __init__(self, categories, prices, ratings, in_stock, total):
+        self.categories = categories    # FacetValues in category tree order, with
+                                        # subtree totals
+        self.prices = prices            # FacetValues, value = price bucket
+        self.ratings = ratings          # FacetValues, value = minimum stars
+        self.in_stock = in_stock
+        self.total = total              # products matching every filter
+
+    @staticmethod
+    def for_search(category=None, search=None, price=None, rating=None, in_stock=False):
+        """The facets of a browse page."""
+        filters, params = Product.facet_filters(category, price, rating, in_stock)
+        if search:
+            where, search_params, _ = Product._search_filters(search=search)
+            params.update(search_params)
+            source = f'''(
+  SELECT COALESCE(s.category_id, 0) AS category_id, s.price_bucket, s.rating_bucket, s.in_stock,
+         1 AS product_count
+  FROM products p
+  JOIN product_stats s ON s.product_id = p.id
+  WHERE 1=1{where}) s'''
+        else:
+            source = 'product_facets s'
+
+        def count(facet):
+            # the products passing every filter except the facet's own
+            conditions = [sql for name, sql in filters.items() if name != facet]
+            if not conditions:
+                return 'COALESCE(SUM(s.product_count), 0)'
+            return (f'COALESCE(SUM(s.product_count) FILTER (WHERE {" AND ".join(conditions)}), 0)')
+
+        # not cached: stock and prices move with every order, and a cache
+        # entry would only be dropped by writes made in this process
+        rows = app.db.execute(f'''
+SELECT GROUPING(s.category_id, s.price_bucket, s.rating_bucket, s.in_stock) AS grouped,
+       s.category_id, s.price_bucket, s.rating_bucket, s.in_stock,
+       {count('category')} AS category_count,
+       {count('price')} AS price_count,
+       {count('rating')} AS rating_count,
+       {count('in_stock')} AS in_stock_count,
+       {count(None)} AS total_count
+FROM {source}
+GROUP BY GROUPING SETS ((s.category_id), (s.price_bucket), (s.rating_bucket), (s.in_stock), ())
+''', read_only=True, **params)
+
+        by_category, by_price, by_rating = {}, {}, {}
+        in_stock_count = total = 0
+        for row in rows:
+            facet = _GROUPED_BY[row.grouped]
+            if facet == 'category':
+                by_category[row.category_id] = row.category_count
+            elif facet == 'price':
+                by_price[row.price_bucket] = row.price_count
+            elif facet == 'rating':
+                by_rating[row.rating_bucket] = row.rating_count
+            elif facet == 'in_stock':
+                if row.in_stock:
+                    in_stock_count = row.in_stock_count
+            else:
+                total = row.total_count
+
+        # "N stars & up" counts every rating bucket from N on
+        ratings, up = [], 0
+        for stars in range(5, 0, -1):
+            up += by_rating.get(stars, 0)
+            ratings.append(FacetValue(stars, f'{stars} stars & up' if stars < 5 else '5 stars', up))
+
+        return ProductFacets(
+            categories=[FacetValue(node.id, node.name, count, total, node.depth)
+                        for node, count, total in Category.tree().rollup(by_category)],
+            prices=[FacetValue(bucket, label, by_price.get(bucket, 0))
+                    for bucket, label in enumerate(PRICE_BUCKETS)],
+            ratings=ratings,
+            in_stock=in_stock_count,
+            total=total)
+
+    @staticmethod
+    def category_counts():
+        """{category id: number of products directly in it}, summed from
+        product_facets (0 is uncategorized)."""
+        rows = app.db.execute_cached('''
+SELECT category_id, SUM(product_count) AS product_count
+FROM product_facets
+GROUP BY category_id
+''', cache_tables=('products', 'inventory', 'product_reviews', 'product_stats',
+                   'product_facets'))
+        return {row.category_id: row.product_count for row in rows}
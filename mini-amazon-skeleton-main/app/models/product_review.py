@@ -1,8 +1,14 @@
 from flask import current_app as app
 
+from .base import Model
 
-class ProductReview:
-    def __init__(self, review_id: int, product_id: int, author_user_id: int, rating: int, title: str | None, body: str | None, created_at, updated_at):
+
+class ProductReview(Model):
+    __slots__ = ('review_id', 'product_id', 'author_user_id', 'rating', 'title', 'body',
+                 'created_at', 'updated_at', 'author_name', 'helpful_count')
+
+    def __init__(self, review_id: int, product_id: int, author_user_id: int, rating: int, title: str | None, body: str | None, created_at, updated_at,
+                 author_name: str | None = None, helpful_count: int | None = None):
         self.review_id = review_id
         self.product_id = product_id
         self.author_user_id = author_user_id
@@ -11,14 +17,17 @@ class ProductReview:
         self.body = body
         self.created_at = created_at
         self.updated_at = updated_at
+        # only set by the product page's reviews (see ProductDetail)
+        self.author_name = author_name
+        self.helpful_count = helpful_count
 
     @staticmethod
     def for_product(product_id: int):
-        rows = app.db.execute('''
+        rows = app.db.execute_cached('''
 SELECT review_id, product_id, author_user_id, rating, title, body, created_at, updated_at
 FROM product_reviews WHERE product_id = :product_id ORDER BY created_at DESC
-''', product_id=product_id)
-        return [ProductReview(*row) for row in rows]
+''', cache_tables=('product_reviews',), product_id=product_id)
+        return ProductReview.from_rows(rows)
 
     @staticmethod
     def for_user(user_id: int):
@@ -26,4 +35,4 @@ FROM product_reviews WHERE product_id = :product_id ORDER BY created_at DESC
 SELECT review_id, product_id, author_user_id, rating, title, body, created_at, updated_at
 FROM product_reviews WHERE author_user_id = :user_id ORDER BY created_at DESC
 ''', user_id=user_id)
-        return [ProductReview(*row) for row in rows]
+        return ProductReview.from_rows(rows)
@@ -1,7 +1,13 @@
 from flask import current_app as app
 
+from .base import Model
+from ..search import like_pattern
+
+
+class Purchase(Model):
+    __slots__ = ('id', 'product_id', 'product_name', 'price_cents', 'quantity', 'total_cents',
+                 'time_purchased', 'seller_id', 'seller_name', 'balance_after_cents')
 
-class Purchase:
     def __init__(self,
                  id: int,
                  product_id: int,
@@ -50,7 +56,7 @@ class Purchase:
             ORDER BY o.placed_at DESC, oi.product_id
         """, id=id)
 
-        return [Purchase(*row) for row in rows]
+        return Purchase.from_rows(rows)
 
     @staticmethod
     def get_all_by_uid_since(uid: int, since):
@@ -79,7 +85,7 @@ class Purchase:
             ORDER BY o.placed_at DESC, oi.order_id, oi.product_id
         """, uid=uid, since=since)
 
-        return [Purchase(*row) for row in rows]
+        return Purchase.from_rows(rows)
 
     @staticmethod
     def get_all_by_uid(uid: int,
@@ -106,8 +112,8 @@ class Purchase:
         }
 
         if q:
-            where_clauses.append("LOWER(p.name) LIKE LOWER('%' || :q || '%')")
-            params["q"] = q
+            where_clauses.append("p.name ILIKE :q")
+            params["q"] = like_pattern(q)
 
         if seller_id:
             where_clauses.append("oi.seller_id = :seller_id")
@@ -156,7 +162,7 @@ class Purchase:
             LIMIT :limit OFFSET :offset
         """, **params)
 
-        return [Purchase(*row) for row in rows]
+        return Purchase.from_rows(rows)
 
     @staticmethod
     def spending_summary(uid: int):
@@ -10,7 +10,7 @@ class Seller:
     def is_user_seller(user_id: int) -> bool:
         rows = app.db.execute('''
 SELECT 1 FROM sellers WHERE user_id = :user_id
-''', user_id=user_id)
+''', read_only=True, user_id=user_id)
         return len(rows) > 0
 
     @staticmethod
@@ -1,7 +1,12 @@
 from flask import current_app as app
 
+from .base import Model
+
+
+class SellerReview(Model):
+    __slots__ = ('review_id', 'seller_user_id', 'author_user_id', 'rating', 'title', 'body',
+                 'created_at', 'updated_at')
 
-class SellerReview:
     def __init__(self, review_id: int, seller_user_id: int, author_user_id: int, rating: int, title: str | None, body: str | None, created_at, updated_at):
         self.review_id = review_id
         self.seller_user_id = seller_user_id
@@ -18,7 +23,7 @@ class SellerReview:
 SELECT review_id, seller_user_id, author_user_id, rating, title, body, created_at, updated_at
 FROM seller_reviews WHERE seller_user_id = :sid ORDER BY created_at DESC
 ''', sid=seller_user_id)
-        return [SellerReview(*row) for row in rows]
+        return SellerReview.from_rows(rows)
 
     @staticmethod
     def for_user(user_id: int):
@@ -26,6 +31,6 @@ FROM seller_reviews WHERE seller_user_id = :sid ORDER BY created_at DESC
 SELECT review_id, seller_user_id, author_user_id, rating, title, body, created_at, updated_at
 FROM seller_reviews WHERE author_user_id = :uid ORDER BY created_at DESC
 ''', uid=user_id)
-        return [SellerReview(*row) for row in rows]
+        return SellerReview.from_rows(rows)
 
 
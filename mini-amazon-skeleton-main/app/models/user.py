@@ -4,6 +4,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import text
 
 from .. import login
+from ..search import like_pattern
 
 
 class User(UserMixin):
@@ -229,8 +230,9 @@ class User(UserMixin):
         """
         Increase balance by amount_delta (positive for top-up, negative for withdraw).
         NOTE: you should check in route that withdraw does not go below zero.
+        Retried automatically if a concurrent checkout causes a serialization failure.
         """
-        with app.db.engine.begin() as conn:
+        def apply(conn):
             conn.execute(text("""
                 UPDATE users
                 SET balance = balance + :amt
@@ -242,6 +244,7 @@ class User(UserMixin):
                 VALUES(:uid, :amt)
             """), dict(uid=user_id, amt=amount_delta))
 
+        app.db.run_transaction(apply)
         return True
 
     @staticmethod
@@ -266,8 +269,8 @@ class User(UserMixin):
         rows = app.db.execute("""
             SELECT id, email, full_name, address, balance
             FROM users
-            WHERE LOWER(full_name) LIKE LOWER(:keyword)
-               OR LOWER(email) LIKE LOWER(:keyword)
-        """, keyword=f'%{keyword}%')
+            WHERE full_name ILIKE :keyword
+               OR email ILIKE :keyword
+        """, keyword=like_pattern(keyword))
         
         return [User(*row) for row in rows]
@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+
+
+class Cursor:
+    """Position in a keyset-paginated listing: the sort key and id of a row,
+    and how many rows come before the page it starts (or ends).
+
+    Pages are fetched with WHERE (sort_key, id) > (:key, :id) instead of
+    OFFSET, so every page costs the same as the first one.  Cursors travel
+    in the URL as opaque url-safe strings (see encode()/decode()).
+    """
+
+    __slots__ = ('key', 'id', 'pos')
+
+    def __init__(self, key, id, pos=0):
+        self.key = key
+        self.id = id
+        self.pos = pos
+
+    def encode(self):
+        data = json.dumps([self.key, self.id, self.pos], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, token):
+        """The cursor of a token from encode(), or None if it is missing or
+        malformed (a hand-edited URL just starts over at the first page)."""
+        if not token:
+            return None
+        try:
+            key, id, pos = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        except (ValueError, TypeError, binascii.Error):
+            return None
+        if not isinstance(id, int) or not isinstance(pos, int) or pos < 0 \
+                or not isinstance(key, (int, float, str)):
+            return None
+        return cls(key, id, pos)
+
+
+class Page:
+    """One page of a keyset-paginated listing."""
+
+    def __init__(self, items, pos, per_page, next_cursor=None, prev_cursor=None,
+                 total=None, total_exact=True):
+        self.items = items
+        self.pos = pos                      # rows before this page
+        self.per_page = per_page
+        self.next_cursor = next_cursor      # encoded, None on the last page
+        self.prev_cursor = prev_cursor      # encoded, None on the first page
+        self.total = total
+        self.total_exact = total_exact      # False: total is a cap or an estimate
+
+    @property
+    def number(self):
+        return self.pos // self.per_page + 1
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(1, (self.total + self.per_page - 1) // self.per_page)
@@ -2,60 +2,79 @@ from flask import Blueprint, request, redirect, url_for, render_template
 from flask_login import login_required, current_user
 
 from .models.product import Product
+from .models.product_detail import ProductDetail
+from .models.product_facet import ProductFacets
 from .models.category import Category
-from .models.inventory import InventoryItem
-from .models.product_review import ProductReview
+from .db import unit_of_work
 
 
 bp = Blueprint('products', __name__)
 
 
 @bp.route('/products')
+@unit_of_work(read_only=True)
 def browse():
     category = request.args.get('category', type=str)
     search = request.args.get('search', type=str)
     sort = request.args.get('sort', type=str)
     limit = request.args.get('limit', type=int)
-    page = request.args.get('page', 1, type=int)
+    after = request.args.get('after', type=str)
+    before = request.args.get('before', type=str)
+    price = request.args.get('price', type=int)
+    rating = request.args.get('rating', type=int)
+    in_stock = request.args.get('in_stock', type=int) == 1
 
-    products = Product.search_filter_sort(
+    facets = ProductFacets.for_search(
         category=category,
         search=search,
-        sort=sort,
-        limit=limit
+        price=price,
+        rating=rating,
+        in_stock=in_stock
     )
 
-    total_products = len(products)
     PER_PAGE = 20 # fixed parameter for number of items per page
-    total_pages = (total_products + PER_PAGE - 1) // PER_PAGE
-
-    start = (page - 1) * PER_PAGE
-    end = start + PER_PAGE
-    products = products[start:end]
+    page = Product.browse_page(
+        category=category,
+        search=search,
+        sort=sort,
+        after=after,
+        before=before,
+        per_page=PER_PAGE,
+        limit=limit,
+        price=price,
+        rating=rating,
+        in_stock=in_stock,
+        total=facets.total
+    )
 
-    categories = Category.all()
+    # "did you mean" when a search finds nothing
+    suggestions = Product.suggest(search) if search and not page.items else []
 
     return render_template('products/browse.html', 
-        products=products, 
-        categories=categories,
-        total_pages=total_pages,
-        current_page=page,
+        products=page.items, 
+        categories=Category.tree().nodes,
+        facets=facets,
+        page=page,
+        suggestions=suggestions,
     )
 
 
 @bp.route('/products/<int:product_id>')
+@unit_of_work(read_only=True)
 def detail(product_id: int):
-    product = Product.get_verbose(product_id)
-    if not product:
+    # product, offers, rating histogram and reviews in one query
+    detail = ProductDetail.load(product_id)
+    if not detail:
         return "Product not found", 404
 
-    offers = InventoryItem.offers_for_product(product_id)
-    reviews = ProductReview.for_product(product_id)
     return render_template(
         'products/detail.html', 
-        product=product, 
-        offers=offers,
-        reviews=reviews
+        product=detail.product, 
+        offers=detail.offers,
+        offers_version=detail.offers_version,
+        reviews_version=detail.reviews_version,
+        rating_histogram=detail.rating_histogram,
+        reviews=detail.reviews
     )
 
 
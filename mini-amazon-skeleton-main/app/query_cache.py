@@ -0,0 +1,152 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+# Target table of a data-modifying statement (INSERT/UPDATE/DELETE/...).
+_WRITE_TARGET_RE = re.compile(
+    r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|MERGE\s+INTO|COPY)'
+    r'\s+(?:ONLY\s+)?([A-Za-z_"][\w."]*)',
+    re.IGNORECASE)
+
+
+def written_tables(statement):
+    """Names of the tables a SQL statement writes to, lower-cased and
+    without schema.  Errs on the side of reporting too many."""
+    return {match.rsplit('.', 1)[-1].strip('"').lower()
+            for match in _WRITE_TARGET_RE.findall(statement)}
+
+
+def _approx_size(rows):
+    # shallow sizes of the list, each row and each value: good enough to
+    # compare entries and bound the total, not an exact accounting
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class _Entry:
+    __slots__ = ('rows', 'tables', 'expires', 'size')
+
+    def __init__(self, rows, tables, expires, size):
+        self.rows = rows
+        self.tables = tables
+        self.expires = expires
+        self.size = size
+
+
+class QueryCache:
+    """In-process cache of query results, tagged with the tables they read.
+
+    Entries expire after their TTL and the least recently used ones are
+    evicted once max_entries or max_bytes is exceeded.  invalidate(tables)
+    drops every entry tagged with any of the given tables.  Each process
+    has its own cache, so writes made by other processes are only seen
+    once the TTL runs out.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=1024, max_bytes=16 * 2**20):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> _Entry, least recently used first
+        self._by_table = {}             # table -> set of keys
+        self.bytes = 0
+        # bumped by every invalidate(); see generation()/put()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached rows for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.rows
+
+    def generation(self):
+        """Take this before running the query whose result goes to put()."""
+        return self._generation
+
+    def put(self, key, rows, tables, ttl=None, generation=None):
+        """Cache rows under key.  If generation (from generation()) is given
+        and an invalidation happened since, the rows may predate a write
+        and are not cached."""
+        size = _approx_size(rows)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(rows, tables, expires, size)
+            self.bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tables):
+        """Drop all entries that read any of the given tables."""
+        with self._lock:
+            self._generation += 1
+            for table in tables:
+                for key in self._by_table.pop(table, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_table.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_s': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'entries_by_table': {t: len(keys) for t, keys in sorted(self._by_table.items())},
+            }
@@ -3,6 +3,8 @@ from flask_login import login_required, current_user
 from flask import current_app as app
 from better_profanity import profanity
 
+from .db import unit_of_work
+
 profanity.load_censor_words()
 profanity.add_censor_words(['zebra'])
 
@@ -10,6 +12,7 @@ bp = Blueprint('reviews', __name__)
 
 
 @bp.route('/reviews')
+@unit_of_work(read_only=True)
 @login_required
 def mine():
     product_reviews = app.db.query_all('''
@@ -0,0 +1,75 @@
+import re
+
+
+# Text search configuration of products.search_vector (see db/create.sql)
+TS_CONFIG = 'english'
+
+_LIKE_SPECIAL_RE = re.compile(r'([\\%_])')
+_TOKEN_RE = re.compile(r'(-?)"([^"]*)"?|(\S+)')
+_WORD_RE = re.compile(r'\w+')
+
+
+def build_tsquery(text):
+    """Turn a search box string into to_tsquery() syntax, or None if it has
+    no searchable words.
+
+        red shoes       both words        red & shoes
+        "red shoes"     the phrase        red <-> shoes
+        sho*            prefix            sho:*
+        red OR blue     either            red | blue
+        -used           not               !used
+
+    Words are reduced to letters, digits and underscores, so the result
+    is always valid to_tsquery() input whatever the user typed.  A query
+    of nothing but exclusions ("-used") matches every product without
+    those words, see excludes_only().
+    """
+    terms = []
+    either = False
+    for negated, phrase, word in _TOKEN_RE.findall(text or ''):
+        if word == 'OR':
+            either = bool(terms)
+            continue
+        if word:
+            negated = word.startswith('-')
+            prefix = word.endswith('*')
+            words = _WORD_RE.findall(word)
+            if words and prefix:
+                words[-1] += ':*'
+        else:
+            words = _WORD_RE.findall(phrase)
+        if not words:
+            continue
+        term = ' <-> '.join(words)
+        if len(words) > 1:
+            term = f'({term})'
+        if negated:
+            term = '!' + term
+        if either:
+            terms[-1] = f'{terms[-1]} | {term}'
+            either = False
+        else:
+            terms.append(term)
+    if not terms:
+        return None
+    return ' & '.join(f'({t})' if ' | ' in t else t for t in terms)
+
+
+def excludes_only(tsquery):
+    """Whether a build_tsquery() result has no word a match must contain,
+    only words it must not ("!used", "!used & !(red <-> shoes)")."""
+    return all(alternative.lstrip('(').startswith('!')
+               for term in tsquery.split(' & ')
+               for alternative in term.split(' | '))
+
+
+def plain_words(text):
+    """The words of a search box string without the query syntax."""
+    return ' '.join(w for w in _WORD_RE.findall(text or '') if w != 'OR')
+
+
+def like_pattern(term):
+    """'%term%' for an unanchored [I]LIKE match, with % _ and \\ in the
+    term matched literally.  Columns searched this way have pg_trgm GIN
+    indexes (see db/create.sql), which ILIKE can use."""
+    return '%' + _LIKE_SPECIAL_RE.sub(r'\\\1', term) + '%'
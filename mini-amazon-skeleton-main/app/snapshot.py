@@ -0,0 +1,242 @@
+"""Compressed, chunked table snapshots.
+
+An alternative to the plain CSV files of db/generate for dumping and
+restoring the database.  A snapshot is a directory holding
+
+    manifest.json               tables, columns and the list of chunks
+    users.00000.csv.gz          gzip-compressed CSV, COPY format
+    users.00001.csv.gz
+    ...
+
+Each table's CSV (exactly what csv_sync.export_table() writes) is cut at
+row boundaries into chunks of about chunk_bytes uncompressed.  The
+manifest records, for every chunk, its row count and the SHA-256 of its
+uncompressed content, so a chunk can be checked while it streams into
+COPY ... FROM STDIN, and the chunks of a table can be restored
+concurrently (see bulk_load).  All tables are read from one database
+snapshot, even though they are written over several connections.
+
+    flask csv snapshot [DIR]            write a snapshot (default db/generate/snapshot)
+    flask csv verify [DIR]              check every chunk against the manifest
+    python -m app.bulk_load --snapshot DIR
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from .csv_sync import TABLES
+
+FORMAT = 'mini-amazon-snapshot/1'
+MANIFEST = 'manifest.json'
+CHUNK_BYTES = 64 * 2**20
+
+
+def default_path():
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, 'db', 'generate', 'snapshot')
+
+
+def _row_ends(data, quoted):
+    """Offsets just past each row-ending newline in a block of COPY CSV,
+    and whether the block ends inside a quoted field.  A newline ends a row
+    unless it is inside quotes; a doubled quote within a quoted field
+    toggles the state twice, so counting quotes is enough."""
+    ends = []
+    pos = 0
+    for i, piece in enumerate(data.split(b'"')):
+        if i:
+            quoted = not quoted
+            pos += 1
+        if not quoted:
+            nl = piece.find(b'\n')
+            while nl >= 0:
+                ends.append(pos + nl + 1)
+                nl = piece.find(b'\n', nl + 1)
+        pos += len(piece)
+    return ends, quoted
+
+
+class _ChunkWriter:
+    """File-like target for COPY ... TO STDOUT that cuts the stream into
+    gzip chunks at row boundaries."""
+
+    def __init__(self, directory, table, chunk_bytes, level):
+        self.directory = directory
+        self.table = table
+        self.chunk_bytes = chunk_bytes
+        self.level = level
+        self.chunks = []
+        self._quoted = False
+        self._file = None
+
+    def _open(self):
+        name = f'{self.table}.{len(self.chunks):05d}.csv.gz'
+        self._file = gzip.open(os.path.join(self.directory, name), 'wb',
+                               compresslevel=self.level)
+        self._chunk = {'file': name, 'rows': 0, 'bytes': 0}
+        self._sha = hashlib.sha256()
+
+    def _put(self, data, rows):
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self._sha.update(data)
+        self._chunk['bytes'] += len(data)
+        self._chunk['rows'] += rows
+
+    def _cut(self):
+        self._file.close()
+        self._file = None
+        self._chunk['sha256'] = self._sha.hexdigest()
+        self._chunk['compressed_bytes'] = os.path.getsize(
+            os.path.join(self.directory, self._chunk['file']))
+        self.chunks.append(self._chunk)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        ends, self._quoted = _row_ends(data, self._quoted)
+        used = self._chunk['bytes'] if self._file is not None else 0
+        if ends and used + ends[-1] >= self.chunk_bytes:
+            self._put(data[:ends[-1]], len(ends))
+            self._cut()
+            data, ends = data[ends[-1]:], []
+        if data:
+            self._put(data, len(ends))
+
+    def close(self):
+        if self._file is not None:
+            self._cut()
+        return self.chunks
+
+
+def _export_table(app, directory, name, snapshot_id, chunk_bytes, level):
+    table = TABLES[name]
+    writer = _ChunkWriter(directory, name, chunk_bytes, level)
+    conn = app.db.engine.raw_connection()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute('BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            cur.execute('SET TRANSACTION SNAPSHOT %s', (snapshot_id,))
+            cur.copy_expert(table.copy_sql, writer)
+            cur.execute('COMMIT')
+    finally:
+        conn.autocommit = False
+        conn.close()
+    return name, {'columns': list(table.columns), 'key': list(table.key),
+                  'chunks': writer.close()}
+
+
+def write_snapshot(app, path=None, tables=None, jobs=4, chunk_bytes=CHUNK_BYTES, level=6):
+    """Write a snapshot of the given tables (default: all csv_sync.TABLES)
+    to directory path, replacing any snapshot already there.  Returns the
+    manifest."""
+    path = path or default_path()
+    tables = list(tables or TABLES)
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    # one transaction holds the snapshot that all the exporting ones import
+    holder = app.db.engine.raw_connection()
+    try:
+        holder.autocommit = True
+        with holder.cursor() as cur:
+            cur.execute('BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            cur.execute('SELECT pg_export_snapshot()')
+            snapshot_id = cur.fetchone()[0]
+            with ThreadPoolExecutor(jobs) as pool:
+                exported = dict(pool.map(
+                    lambda name: _export_table(app, tmp, name, snapshot_id, chunk_bytes, level),
+                    tables))
+            cur.execute('COMMIT')
+    finally:
+        holder.autocommit = False
+        holder.close()
+
+    manifest = {
+        'format': FORMAT,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'tables': {name: exported[name] for name in tables},
+    }
+    with open(os.path.join(tmp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    if os.path.exists(path):
+        old = path + '.old'
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, path)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f'{path}: unsupported snapshot format {manifest.get("format")!r}')
+    return manifest
+
+
+def copy_from_sql(table, columns):
+    return f'COPY {table}({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+
+
+class ChunkReader:
+    """File-like source for COPY ... FROM STDIN that decompresses a chunk
+    as it is read; check() then compares it with the manifest."""
+
+    def __init__(self, path, chunk):
+        self.path = os.path.join(path, chunk['file'])
+        self.chunk = chunk
+        self._file = gzip.open(self.path, 'rb')
+        self._sha = hashlib.sha256()
+        self._quoted = False
+        self.rows = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._sha.update(data)
+        ends, self._quoted = _row_ends(data, self._quoted)
+        self.rows += len(ends)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def check(self, rows=None):
+        """Raise ValueError unless the content read (and rows, the row count
+        COPY reported, if given) matches the manifest."""
+        expected = self.chunk['rows']
+        if self._sha.hexdigest() != self.chunk['sha256']:
+            raise ValueError(f'{self.path}: checksum mismatch')
+        for counted in (self.rows, rows):
+            if counted is not None and counted != expected:
+                raise ValueError(f'{self.path}: {counted} rows, manifest says {expected}')
+
+
+def verify_snapshot(path=None):
+    """Read every chunk of a snapshot and check it; returns the manifest."""
+    path = path or default_path()
+    manifest = read_manifest(path)
+    for entry in manifest['tables'].values():
+        for chunk in entry['chunks']:
+            with ChunkReader(path, chunk) as reader:
+                while reader.read(1 << 20):
+                    pass
+                reader.check()
+    return manifest
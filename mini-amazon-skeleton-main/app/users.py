@@ -11,6 +11,7 @@ from .models.purchase import Purchase
 from .models.order import Order
 from .models.seller import Seller
 from .models.seller_review import SellerReview
+from .db import unit_of_work
 
 from flask import Blueprint
 bp = Blueprint('users', __name__)
@@ -198,6 +199,7 @@ def update_balance():
 ########################################
 
 @bp.route('/history', methods=['GET'])
+@unit_of_work(read_only=True)
 @login_required
 def orders():
     user_id = current_user.id
@@ -252,6 +254,7 @@ def orders():
 
 
 @bp.route('/public/<int:user_id>')
+@unit_of_work(read_only=True)
 def public_profile(user_id):
     from flask import current_app as app
     user = User.get(user_id)
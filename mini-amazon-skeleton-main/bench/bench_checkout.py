@@ -0,0 +1,134 @@
+"""Benchmark: checkout contention on one product's statistics.
+
+Gives one product offers from --sellers sellers (adding bench offers,
+removed afterwards), then runs one thread per seller, each decrementing its
+own offer's stock --orders times the way checkout does (a SERIALIZABLE
+transaction through DB.run_transaction).  The threads never touch the same
+inventory row, so every serialization failure they hit comes from what the
+inventory triggers write on their behalf (product_stats, product_facets).
+Prints orders per second and retries per order, with the product_stats
+inventory trigger enabled and, for comparison, disabled.
+
+Usage (from the repository root, with the usual DB_* environment; the
+second run needs to own the inventory table):
+
+    python bench/bench_checkout.py [--sellers 8] [--orders 200]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+STOCK = 1_000_000
+
+
+def setup(app, sellers):
+    """Pick the product with the most offers, give it offers from `sellers`
+    sellers with plenty of stock; return (product id, seller ids, the
+    original quantities, the seller ids whose offers were added)."""
+    with app.db.engine.begin() as conn:
+        pid = conn.execute(text('''
+SELECT product_id FROM inventory GROUP BY product_id ORDER BY COUNT(*) DESC, product_id LIMIT 1
+''')).scalar()
+        original = dict(conn.execute(text('''
+SELECT seller_id, quantity_on_hand FROM inventory WHERE product_id = :pid
+'''), {'pid': pid}).all())
+        added = [sid for (sid,) in conn.execute(text('''
+SELECT id FROM sellers WHERE id NOT IN (SELECT seller_id FROM inventory WHERE product_id = :pid)
+ORDER BY id LIMIT :n
+'''), {'pid': pid, 'n': max(0, sellers - len(original))})]
+        for sid in added:
+            conn.execute(text('''
+INSERT INTO inventory(seller_id, product_id, price_cents, quantity_on_hand)
+VALUES (:sid, :pid, 1000, :stock)
+'''), {'sid': sid, 'pid': pid, 'stock': STOCK})
+        conn.execute(text('''
+UPDATE inventory SET quantity_on_hand = :stock WHERE product_id = :pid
+'''), {'pid': pid, 'stock': STOCK})
+    seller_ids = sorted(original)[:sellers] + added
+    return pid, seller_ids, original, added
+
+
+def teardown(app, pid, original, added):
+    with app.db.engine.begin() as conn:
+        conn.execute(text('''
+DELETE FROM inventory WHERE product_id = :pid AND seller_id = ANY(:added)
+'''), {'pid': pid, 'added': added})
+        for sid, quantity in original.items():
+            conn.execute(text('''
+UPDATE inventory SET quantity_on_hand = :q WHERE seller_id = :sid AND product_id = :pid
+'''), {'q': quantity, 'sid': sid, 'pid': pid})
+
+
+def _order(conn, sid, pid):
+    conn.execute(text('''
+UPDATE inventory i
+SET quantity_on_hand = i.quantity_on_hand - 1, updated_at = NOW()
+WHERE i.seller_id = :sid AND i.product_id = :pid
+'''), {'sid': sid, 'pid': pid})
+
+
+def run(app, pid, seller_ids, orders):
+    """Orders per second and retries per order over all threads."""
+    before = app.db.retry_stats()
+    errors = []
+
+    def worker(sid):
+        try:
+            for _ in range(orders):
+                app.db.run_transaction(_order, sid, pid, attempts=50)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(sid,)) for sid in seller_ids]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    after = app.db.retry_stats()
+    total = orders * len(seller_ids)
+    return total / elapsed, (after['retries'] - before['retries']) / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sellers', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=200, help='Orders per seller.')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        pid, seller_ids, original, added = setup(app, args.sellers)
+        try:
+            print(f'product {pid}, {len(seller_ids)} sellers, {args.orders} orders each')
+            print(f'{"product_stats trigger":22} {"orders/s":>10} {"retries/order":>14}')
+            rate, retries = run(app, pid, seller_ids, args.orders)
+            print(f'{"enabled":22} {rate:10.0f} {retries:14.3f}')
+            with app.db.engine.begin() as conn:
+                conn.execute(text('ALTER TABLE inventory DISABLE TRIGGER trg_product_stats_inventory'))
+            try:
+                rate, retries = run(app, pid, seller_ids, args.orders)
+                print(f'{"disabled":22} {rate:10.0f} {retries:14.3f}')
+            finally:
+                with app.db.engine.begin() as conn:
+                    conn.execute(text('ALTER TABLE inventory ENABLE TRIGGER trg_product_stats_inventory'))
+        finally:
+            teardown(app, pid, original, added)
+            with app.db.engine.begin() as conn:
+                # the disabled run's decrements bypassed the statistics
+                conn.execute(text('SELECT refresh_product_stats()'))
+
+
+if __name__ == '__main__':
+    main()
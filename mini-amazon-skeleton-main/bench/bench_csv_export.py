@@ -0,0 +1,93 @@
+"""Benchmark: full-table CSV export, COPY vs. rows through SQLAlchemy.
+
+Fills a scratch table (bench_csv_export, dropped afterwards) with --rows
+rows shaped like order_items plus a text and a boolean column, then
+exports it with csv_sync.export_table() both ways and checks that the
+two files are identical.
+
+Usage (from the repository root, with the usual DB_* environment):
+
+    python bench/bench_csv_export.py [--rows 1000000]
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, csv_sync  # noqa: E402
+
+TABLE = 'bench_csv_export'
+
+
+def setup(app, rows):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {TABLE}'))
+        conn.execute(text(f'''
+CREATE TABLE {TABLE} (
+  order_id INT NOT NULL,
+  line_no INT NOT NULL,
+  quantity INT NOT NULL,
+  unit_price_cents INT NOT NULL,
+  note TEXT,
+  gift BOOLEAN NOT NULL,
+  fulfilled_at TIMESTAMP,
+  PRIMARY KEY (order_id, line_no)
+)'''))
+        conn.execute(text(f'''
+INSERT INTO {TABLE}
+SELECT g / 4, g % 4, 1 + g % 7, 100 + (g * 37) % 90000,
+       CASE WHEN g % 5 = 0 THEN NULL ELSE 'note, "quoted" ' || g END,
+       g % 3 = 0,
+       CASE WHEN g % 2 = 0 THEN NULL
+            ELSE timestamp '2025-01-01' + g * interval '1.25 second' END
+FROM generate_series(0, {rows - 1}) AS g'''))
+        conn.execute(text(f'ANALYZE {TABLE}'))
+    csv_sync.TABLES[TABLE] = csv_sync._Table(
+        TABLE, 'BenchCsvExport.csv',
+        ('order_id', 'line_no', 'quantity', 'unit_price_cents', 'note', 'gift', 'fulfilled_at'),
+        key=('order_id', 'line_no'), key_types=((int, 'INT'), (int, 'INT')),
+        booleans=('gift',))
+
+
+def teardown(app):
+    csv_sync.TABLES.pop(TABLE, None)
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {TABLE}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context(), tempfile.TemporaryDirectory() as tmp:
+        print(f'filling {TABLE} with {args.rows} rows ...')
+        setup(app, args.rows)
+        try:
+            paths = {}
+            results = {}
+            for label, use_copy in (('SQLAlchemy + csv.writer', False), ('COPY TO STDOUT', True)):
+                paths[label] = os.path.join(tmp, f'{use_copy}.csv')
+                start = time.perf_counter()
+                csv_sync.export_table(TABLE, path=paths[label], use_copy=use_copy)
+                seconds = time.perf_counter() - start
+                size = os.path.getsize(paths[label])
+                results[label] = seconds
+                print(f'{label:24} {seconds:7.2f} s {args.rows / seconds:12,.0f} rows/s '
+                      f'{size / 2**20 / seconds:7.1f} MiB/s')
+            old, new = results.values()
+            same = filecmp.cmp(*paths.values(), shallow=False)
+            print(f'speedup {old / new:.1f}x, identical output: {same}')
+        finally:
+            teardown(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark: browse facet counts, per-product rows vs. product_facets.
+
+Fills a scratch table shaped like product_stats (bench_facets_stats,
+dropped afterwards) with --rows products spread over --categories
+categories, and the product_facets-like table of its cell counts
+(bench_facets_cells).  Then it times the GROUPING SETS facets query of
+ProductFacets.for_search() over each: the whole catalog, one category, and
+a "search" matching --match of the products.
+
+Usage (from the repository root, with the usual DB_* environment):
+
+    python bench/bench_facets.py [--rows 5000000] [--categories 200] [--match 0.01]
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+STATS = 'bench_facets_stats'
+CELLS = 'bench_facets_cells'
+
+FACETS_SQL = '''
+SELECT GROUPING(s.category_id, s.price_bucket, s.rating_bucket, s.in_stock) AS grouped,
+       s.category_id, s.price_bucket, s.rating_bucket, s.in_stock,
+       COALESCE(SUM(s.product_count) FILTER (WHERE {filter}), 0) AS product_count
+FROM {source}
+GROUP BY GROUPING SETS ((s.category_id), (s.price_bucket), (s.rating_bucket), (s.in_stock), ())
+'''
+
+
+def setup(app, rows, categories):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {STATS}, {CELLS}'))
+        conn.execute(text(f'''
+CREATE TABLE {STATS} AS
+SELECT g AS product_id,
+       1 + (hashint4(g) & 2147483647) % :categories AS category_id,
+       (random() * 6)::smallint AS price_bucket,
+       (random() * 5)::smallint AS rating_bucket,
+       random() < 0.7 AS in_stock
+FROM generate_series(1, :rows) AS g'''), {'rows': rows, 'categories': categories})
+        conn.execute(text(f'ALTER TABLE {STATS} ADD PRIMARY KEY (product_id)'))
+        conn.execute(text(f'''
+CREATE TABLE {CELLS} AS
+SELECT category_id, price_bucket, rating_bucket, in_stock, COUNT(*)::int AS product_count
+FROM {STATS} GROUP BY 1, 2, 3, 4'''))
+        conn.execute(text(f'ALTER TABLE {CELLS} ADD PRIMARY KEY '
+                          f'(category_id, price_bucket, rating_bucket, in_stock)'))
+        conn.execute(text(f'ANALYZE {STATS}'))
+        conn.execute(text(f'ANALYZE {CELLS}'))
+
+
+def teardown(app):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {STATS}, {CELLS}'))
+
+
+def timed(app, sql, repeat, **params):
+    with app.db.engine.connect() as conn:
+        result = conn.execute(text(sql), params).all()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(text(sql), params).all()
+        return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--categories', type=int, default=200)
+    parser.add_argument('--match', type=float, default=0.01)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f'filling {STATS} with {args.rows} rows ...')
+        setup(app, args.rows, args.categories)
+        try:
+            per_product = f'(SELECT *, 1 AS product_count FROM {STATS}) s'
+            # every 1/match-th product, looked up by key, stands in for the
+            # products a search finds with its index
+            step = max(1, round(1 / args.match))
+            searched = (f'(SELECT *, 1 AS product_count FROM {STATS} '
+                        f'WHERE product_id IN (SELECT generate_series(1, {args.rows}, {step}))) s')
+            cases = (
+                ('whole catalog', per_product, f'{CELLS} s', 'true'),
+                ('one category', per_product, f'{CELLS} s', 's.category_id = 1'),
+                (f'search ({args.match:.0%} match)', searched, None, 'true'),
+            )
+            print(f'{"facets of":24} {"per-product ms":>15} {"cells ms":>10}')
+            for label, rows_source, cells_source, condition in cases:
+                expected, rows_ms = timed(app, FACETS_SQL.format(source=rows_source, filter=condition),
+                                          args.repeat)
+                cells_ms = ''
+                if cells_source:
+                    result, ms = timed(app, FACETS_SQL.format(source=cells_source, filter=condition),
+                                       args.repeat)
+                    assert sorted(result) == sorted(expected), 'cell counts differ'
+                    cells_ms = f'{ms:.1f}'
+                print(f'{label:24} {rows_ms:15.1f} {cells_ms:>10}')
+        finally:
+            teardown(app)
+
+
+if __name__ == '__main__':
+    main()
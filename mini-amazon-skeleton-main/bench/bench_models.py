@@ -0,0 +1,114 @@
+"""Micro-benchmark: building Product objects for a catalog listing.
+
+Compares the previous model (plain class with a per-instance __dict__,
+built by positional indexing in Product.row_to_product) with the current
+__slots__ Product built by Model.from_rows, on the rows of the whole
+catalog as Product.BROWSE_SQL lists it.  The rows are fetched once and
+repeated up to --rows so the numbers do not depend on the size of the
+sample data.
+
+Usage (from the repository root, with the usual DB_* environment):
+
+    python bench/bench_models.py [--rows 100000] [--repeat 5]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.models.product import Product  # noqa: E402
+
+
+class DictProduct:
+    """Product as it was before it had __slots__."""
+
+    def __init__(self, id, name, description=None, image_url=None, avg_price=None, seller_count=None,
+                 avg_rating=None, review_count=None, category_id=None, category_name=None,
+                 available=True, created_by=None):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.image_url = image_url
+        self.avg_price = avg_price
+        self.seller_count = seller_count
+        self.avg_rating = avg_rating
+        self.review_count = review_count
+        self.category_id = category_id
+        self.category_name = category_name
+        self.available = available
+        self.created_by = created_by
+
+    @staticmethod
+    def row_to_product(row):
+        return DictProduct(
+            id=row[0],
+            name=row[1],
+            description=row[2],
+            image_url=row[3],
+            avg_price=float(row[4]) if row[4] is not None else 0.0,
+            seller_count=int(row[5]) if row[5] is not None else 0,
+            avg_rating=float(row[6]) if row[6] is not None else 0.0,
+            review_count=int(row[7]) if row[7] is not None else 0,
+            category_id=row[8],
+            category_name=row[9],
+            created_by=row[10]
+        )
+
+
+def build_dict(rows):
+    return [DictProduct.row_to_product(row) for row in rows]
+
+
+def build_slots(rows):
+    return Product.from_rows(rows)
+
+
+def measure(build, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        objects = build(rows)
+        best = min(best, time.perf_counter() - start)
+        del objects
+    gc.collect()
+    tracemalloc.start()
+    objects = build(rows)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return best, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        sample = app.db.execute(Product.BROWSE_SQL.format(extra_columns='', where=''))
+    if not sample:
+        sys.exit('products table is empty')
+    rows = (sample * (args.rows // len(sample) + 1))[:args.rows]
+
+    print(f'{len(rows)} rows (from {len(sample)} products), best of {args.repeat}')
+    results = {}
+    for label, build in (('dict + row_to_product', build_dict),
+                         ('__slots__ + from_rows', build_slots)):
+        seconds, memory = measure(build, rows, args.repeat)
+        results[label] = (seconds, memory)
+        print(f'{label:24} {seconds * 1000:9.1f} ms {seconds / len(rows) * 1e9:8.0f} ns/row '
+              f'{memory / 2**20:9.1f} MiB {memory / len(rows):6.0f} B/row')
+    (old_s, old_m), (new_s, new_m) = results.values()
+    print(f'speedup {old_s / new_s:.2f}x, memory {new_m / old_m:.0%} of before')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Benchmark: product search, LIKE '%term%' vs. full-text search.
+
+Fills a scratch table (bench_search, dropped afterwards) with --rows
+products whose names and descriptions are made of the words of the real
+catalog, with the same generated tsvector column and GIN index as
+products, then times the LIKE predicate search_filter_sort() used to run
+against the to_tsquery() one it runs now, for a few search box strings.
+
+Usage (from the repository root, with the usual DB_* environment):
+
+    python bench/bench_search.py [--rows 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.search import TS_CONFIG, build_tsquery  # noqa: E402
+
+TABLE = 'bench_search'
+SEARCHES = ('improve', 'central well', '"central well"', 'impro*', 'music OR song')
+
+
+def setup(app, rows):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {TABLE}'))
+        conn.execute(text(f'''
+CREATE TABLE {TABLE} (
+  id INT PRIMARY KEY,
+  name TEXT NOT NULL,
+  description TEXT NOT NULL,
+  search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('{TS_CONFIG}', name), 'A') ||
+    setweight(to_tsvector('{TS_CONFIG}', description), 'B')) STORED
+)'''))
+        # random 3-word names and 12-word descriptions from the catalog's words
+        # (k and g keep the subqueries from being evaluated only once)
+        conn.execute(text(f'''
+WITH words AS (
+  SELECT array_agg(DISTINCT w) AS w
+  FROM products, regexp_split_to_table(lower(name || ' ' || description), '[^a-z]+') AS w
+  WHERE w <> ''
+)
+INSERT INTO {TABLE} (id, name, description)
+SELECT g,
+       (SELECT string_agg(w[1 + floor(random() * array_length(w, 1))::int + 0 * k], ' ')
+        FROM generate_series(1, 3) AS k WHERE g > 0),
+       (SELECT string_agg(w[1 + floor(random() * array_length(w, 1))::int + 0 * k], ' ')
+        FROM generate_series(1, 12) AS k WHERE g > 0)
+FROM generate_series(1, :rows) AS g, words'''), {'rows': rows})
+        conn.execute(text(f'CREATE INDEX ON {TABLE} USING GIN (search_vector)'))
+        conn.execute(text(f'ANALYZE {TABLE}'))
+
+
+def teardown(app):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {TABLE}'))
+
+
+def timed(app, sql, repeat, **params):
+    with app.db.engine.connect() as conn:
+        count = conn.execute(text(sql), params).scalar()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(text(sql), params).scalar()
+        return count, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f'filling {TABLE} with {args.rows} rows ...')
+        setup(app, args.rows)
+        try:
+            like_sql = f'''
+SELECT COUNT(*) FROM (SELECT id FROM {TABLE}
+WHERE LOWER(name) LIKE LOWER(:search) OR LOWER(description) LIKE LOWER(:search)
+ORDER BY name LIMIT 20) t'''
+            fts_sql = f'''
+SELECT COUNT(*) FROM (SELECT id FROM {TABLE}
+WHERE search_vector @@ to_tsquery('{TS_CONFIG}', :tsquery)
+ORDER BY ts_rank_cd(search_vector, to_tsquery('{TS_CONFIG}', :tsquery)) DESC LIMIT 20) t'''
+            print(f'{"search":16} {"LIKE ms":>10} {"FTS ms":>10} {"tsquery"}')
+            for search in SEARCHES:
+                _, like_ms = timed(app, like_sql, max(1, args.repeat // 10),
+                                   search=f'%{search.strip(chr(34))}%')
+                tsquery = build_tsquery(search)
+                _, fts_ms = timed(app, fts_sql, args.repeat, tsquery=tsquery)
+                print(f'{search:16} {like_ms:10.1f} {fts_ms:10.1f} {tsquery}')
+        finally:
+            teardown(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark: trigram-indexed substring search (pg_trgm GIN indexes).
+
+Fills scratch tables (bench_trgm_products and bench_trgm_users, dropped
+afterwards) with --products products and --users users made of the words
+of the real catalog, with the same gin_trgm_ops indexes db/create.sql puts
+on products and users.  Then it runs the app's ILIKE '%term%' predicates
+and the "did you mean" word-similarity lookup with EXPLAIN ANALYZE,
+once as planned and once with index scans disabled, and shows which index
+each plan used and how long each took.
+
+Needs the pg_trgm extension (PostgreSQL contrib).
+
+Usage (from the repository root, with the usual DB_* environment):
+
+    python bench/bench_trgm.py [--products 1000000] [--users 100000]
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.search import like_pattern  # noqa: E402
+
+PRODUCTS = 'bench_trgm_products'
+USERS = 'bench_trgm_users'
+
+_WORDS = '''
+WITH words AS (
+  SELECT array_agg(DISTINCT w) AS w
+  FROM products, regexp_split_to_table(lower(name || ' ' || description), '[^a-z]+') AS w
+  WHERE length(w) > 2
+)
+'''
+
+
+def _phrase(n):
+    # n random catalog words (k and g keep the subquery from being run only once)
+    return (f"(SELECT string_agg(w[1 + floor(random() * array_length(w, 1))::int + 0 * k], ' ') "
+            f"FROM generate_series(1, {n}) AS k WHERE g > 0)")
+
+
+def setup(app, products, users):
+    with app.db.engine.begin() as conn:
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        conn.execute(text(f'DROP TABLE IF EXISTS {PRODUCTS}, {USERS}'))
+        conn.execute(text(f'CREATE TABLE {PRODUCTS} (id INT PRIMARY KEY, name TEXT, description TEXT)'))
+        conn.execute(text(f'CREATE TABLE {USERS} (id INT PRIMARY KEY, full_name TEXT, email TEXT)'))
+        conn.execute(text(_WORDS + f'''
+INSERT INTO {PRODUCTS}
+SELECT g, {_phrase(3)}, {_phrase(12)}
+FROM generate_series(1, :n) AS g, words'''), {'n': products})
+        conn.execute(text(_WORDS + f'''
+INSERT INTO {USERS}
+SELECT g, initcap({_phrase(2)}), replace({_phrase(2)}, ' ', '.') || g || '@example.com'
+FROM generate_series(1, :n) AS g, words'''), {'n': users})
+        for table, column in ((PRODUCTS, 'name'), (PRODUCTS, 'description'),
+                              (USERS, 'full_name'), (USERS, 'email')):
+            conn.execute(text(f'CREATE INDEX {table}_{column}_trgm ON {table} '
+                              f'USING GIN ({column} gin_trgm_ops)'))
+        conn.execute(text(f'ANALYZE {PRODUCTS}'))
+        conn.execute(text(f'ANALYZE {USERS}'))
+
+
+def teardown(app):
+    with app.db.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {PRODUCTS}, {USERS}'))
+
+
+def _scans(plan):
+    node = plan.get('Index Name') or (plan['Node Type'] if 'Scan' in plan['Node Type'] else None)
+    found = [node] if node else []
+    for child in plan.get('Plans', ()):
+        found += _scans(child)
+    return found
+
+
+def explain(conn, sql, params, indexes=True):
+    conn.execute(text(f'SET LOCAL enable_bitmapscan = {"on" if indexes else "off"}'))
+    conn.execute(text(f'SET LOCAL enable_indexscan = {"on" if indexes else "off"}'))
+    result = conn.execute(text('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql), params).scalar()
+    plan = result[0]
+    return plan['Execution Time'], sorted(set(_scans(plan['Plan'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        with app.db.engine.connect() as conn:
+            available = conn.execute(text(
+                "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+        if not available:
+            sys.exit('pg_trgm is not available on this server')
+
+        print(f'filling {PRODUCTS} ({args.products} rows) and {USERS} ({args.users} rows) ...')
+        setup(app, args.products, args.users)
+        try:
+            with app.db.engine.connect() as conn:
+                # the longest word of some product name
+                word = conn.execute(text(f'''
+SELECT w FROM {PRODUCTS}, regexp_split_to_table(name, ' ') AS w
+WHERE id = 1 ORDER BY length(w) DESC LIMIT 1''')).scalar()
+                typo = word[:-1] + 'q' + word[-1]
+            cases = (
+                ('product search (like mode)',
+                 f'SELECT id FROM {PRODUCTS} WHERE name ILIKE :p OR description ILIKE :p '
+                 f'ORDER BY name LIMIT 20', {'p': like_pattern(word[1:-1])}),
+                ('order history / purchases filter',
+                 f'SELECT id FROM {PRODUCTS} WHERE name ILIKE :p', {'p': like_pattern(word[1:])}),
+                ('user search',
+                 f'SELECT id FROM {USERS} WHERE full_name ILIKE :p OR email ILIKE :p',
+                 {'p': like_pattern(word[:4])}),
+                ('did you mean',
+                 f'SELECT name FROM {PRODUCTS} WHERE :w <% name '
+                 f'ORDER BY word_similarity(:w, name) DESC, name LIMIT 3', {'w': typo}),
+            )
+            print(f'{"query":34} {"indexed ms":>11} {"no index ms":>12}  plan')
+            for label, sql, params in cases:
+                with app.db.engine.begin() as conn:
+                    with_ms, scans = explain(conn, sql, params)
+                with app.db.engine.begin() as conn:
+                    without_ms, _ = explain(conn, sql, params, indexes=False)
+                print(f'{label:34} {with_ms:11.1f} {without_ms:12.1f}  {", ".join(scans)}')
+        finally:
+            teardown(app)
+
+
+if __name__ == '__main__':
+    main()
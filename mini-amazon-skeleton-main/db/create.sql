@@ -14,6 +14,8 @@
    DROP TABLE IF EXISTS message_threads CASCADE;
    DROP TABLE IF EXISTS messages CASCADE;
    DROP TABLE IF EXISTS coupons CASCADE;
+   DROP TABLE IF EXISTS product_stats CASCADE;
+   DROP TABLE IF EXISTS product_facets CASCADE;
    
 -- Thomas (Account/Purchases)
 CREATE TABLE IF NOT EXISTS users (
@@ -53,9 +55,16 @@ CREATE TABLE IF NOT EXISTS products (
   image_url TEXT,
   category_id INT REFERENCES categories(id),
   created_by INT NOT NULL REFERENCES users(id),
-  created_at TIMESTAMP DEFAULT (current_timestamp AT TIME ZONE 'UTC')
+  created_at TIMESTAMP DEFAULT (current_timestamp AT TIME ZONE 'UTC'),
+  -- full-text search document: name weighted above description
+  search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED
 );
 
+CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_products_name ON products(name, id);
+
 
 --------------------------------
 -- Andy - Inventory/Order Fulfillment
@@ -322,3 +331,308 @@ CREATE TABLE IF NOT EXISTS coupons (
 
 CREATE INDEX IF NOT EXISTS idx_coupons_code ON coupons(code);
 
+
+--------------------------------
+--- Product statistics
+-- One row per product with the aggregates the product listings show, kept
+-- current by the triggers below, so browsing reads them by key instead of
+-- aggregating inventory x product_reviews on every request.
+-- version is bumped by every change to these statistics or to the
+-- product's page, except for offer quantities (read live, see below).
+
+-- Facet buckets of the browse page (labels in app/models/product_facet.py):
+-- price 0 = no offers, 1..6 = under $10, $10-25, $25-50, $50-100,
+-- $100-250, $250 and up; rating 0 = not rated, else the whole stars of
+-- the average rating.
+CREATE OR REPLACE FUNCTION product_price_bucket(sellers INT, price_sum_cents BIGINT)
+RETURNS SMALLINT AS $$
+  SELECT CASE WHEN sellers > 0
+              THEN width_bucket(price_sum_cents::numeric / sellers / 100.0,
+                                ARRAY[10, 25, 50, 100, 250]::numeric[]) + 1
+              ELSE 0 END::smallint
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION product_rating_bucket(ratings INT, rating_sum BIGINT)
+RETURNS SMALLINT AS $$
+  SELECT CASE WHEN ratings > 0
+              THEN LEAST(GREATEST(floor(rating_sum::numeric / ratings), 1), 5)
+              ELSE 0 END::smallint
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS product_stats (
+  product_id INT PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+  category_id INT,                            -- products.category_id, for the facets
+  seller_count INT NOT NULL DEFAULT 0,        -- inventory rows
+  stocked_count INT NOT NULL DEFAULT 0,       -- inventory rows with quantity on hand
+  price_sum_cents BIGINT NOT NULL DEFAULT 0,
+  review_count INT NOT NULL DEFAULT 0,
+  rating_count INT NOT NULL DEFAULT 0,        -- reviews with a rating
+  rating_sum BIGINT NOT NULL DEFAULT 0,
+  avg_price DOUBLE PRECISION GENERATED ALWAYS AS
+    (CASE WHEN seller_count > 0 THEN price_sum_cents::numeric / seller_count / 100.0 ELSE 0 END) STORED,
+  avg_rating DOUBLE PRECISION GENERATED ALWAYS AS
+    (CASE WHEN rating_count > 0 THEN rating_sum::numeric / rating_count ELSE 0 END) STORED,
+  price_bucket SMALLINT GENERATED ALWAYS AS
+    (product_price_bucket(seller_count, price_sum_cents)) STORED,
+  rating_bucket SMALLINT GENERATED ALWAYS AS
+    (product_rating_bucket(rating_count, rating_sum)) STORED,
+  in_stock BOOLEAN GENERATED ALWAYS AS (stocked_count > 0) STORED,
+  version BIGINT NOT NULL DEFAULT 1
+);
+
+-- (key, id) orders of the product listings' keyset pagination
+CREATE INDEX IF NOT EXISTS idx_product_stats_price ON product_stats(avg_price, product_id);
+CREATE INDEX IF NOT EXISTS idx_product_stats_rating ON product_stats(avg_rating, product_id);
+
+-- Apply a delta to a product's statistics, creating its row if needed
+CREATE OR REPLACE FUNCTION product_stats_add(
+  pid INT, sellers INT, stocked INT, price_cents BIGINT, reviews INT, ratings INT, rating BIGINT)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO product_stats AS s
+    (product_id, seller_count, stocked_count, price_sum_cents, review_count, rating_count, rating_sum)
+  VALUES (pid, sellers, stocked, price_cents, reviews, ratings, rating)
+  ON CONFLICT (product_id) DO UPDATE
+  SET seller_count = s.seller_count + EXCLUDED.seller_count,
+      stocked_count = s.stocked_count + EXCLUDED.stocked_count,
+      price_sum_cents = s.price_sum_cents + EXCLUDED.price_sum_cents,
+      review_count = s.review_count + EXCLUDED.review_count,
+      rating_count = s.rating_count + EXCLUDED.rating_count,
+      rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+      version = s.version + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_stats_products()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO product_stats(product_id, category_id) VALUES (NEW.id, NEW.category_id)
+    ON CONFLICT (product_id) DO UPDATE SET category_id = EXCLUDED.category_id;
+  ELSE
+    UPDATE product_stats SET version = version + 1, category_id = NEW.category_id
+    WHERE product_id = NEW.id;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_product_stats_products
+AFTER INSERT OR UPDATE ON products
+FOR EACH ROW
+EXECUTE FUNCTION product_stats_products();
+
+-- only offers appearing or going, price changes and offers running out of
+-- (or back in) stock touch a product's statistics.  A quantity change that
+-- leaves the offer in stock, like a checkout's, writes nothing here: every
+-- checkout of a product would otherwise update its one product_stats row
+-- (and conflict with the others under SERIALIZABLE, see
+-- bench/bench_checkout.py).  The product page reads the offers live.
+CREATE OR REPLACE FUNCTION product_stats_inventory()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' AND OLD.product_id = NEW.product_id THEN
+    IF OLD.price_cents = NEW.price_cents
+       AND (OLD.quantity_on_hand > 0) = (NEW.quantity_on_hand > 0) THEN
+      RETURN NULL;
+    END IF;
+    PERFORM product_stats_add(NEW.product_id, 0,
+                              (NEW.quantity_on_hand > 0)::int - (OLD.quantity_on_hand > 0)::int,
+                              NEW.price_cents - OLD.price_cents, 0, 0, 0);
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM product_stats_add(OLD.product_id, -1, -(OLD.quantity_on_hand > 0)::int,
+                              -OLD.price_cents, 0, 0, 0);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM product_stats_add(NEW.product_id, 1, (NEW.quantity_on_hand > 0)::int,
+                              NEW.price_cents, 0, 0, 0);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_product_stats_inventory
+AFTER INSERT OR UPDATE OR DELETE ON inventory
+FOR EACH ROW
+EXECUTE FUNCTION product_stats_inventory();
+
+CREATE OR REPLACE FUNCTION product_stats_reviews()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM product_stats_add(OLD.product_id, 0, 0, 0, -1,
+                              -(OLD.rating IS NOT NULL)::int, -COALESCE(OLD.rating, 0));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM product_stats_add(NEW.product_id, 0, 0, 0, 1,
+                              (NEW.rating IS NOT NULL)::int, COALESCE(NEW.rating, 0));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_product_stats_reviews
+AFTER INSERT OR UPDATE OR DELETE ON product_reviews
+FOR EACH ROW
+EXECUTE FUNCTION product_stats_reviews();
+
+-- helpful vote counts are on the product page too
+CREATE OR REPLACE FUNCTION product_stats_helpful_votes()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE product_stats SET version = version + 1
+  WHERE product_id = (SELECT product_id FROM product_reviews
+                      WHERE review_id = COALESCE(NEW.review_id, OLD.review_id));
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_product_stats_helpful_votes
+AFTER INSERT OR DELETE ON review_helpful_votes
+FOR EACH ROW
+EXECUTE FUNCTION product_stats_helpful_votes();
+
+-- Recompute all statistics from scratch (after loading with triggers off,
+-- or to repair drift); keeps versions, bumping the ones that change
+CREATE OR REPLACE FUNCTION refresh_product_stats()
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO product_stats AS s
+    (product_id, category_id, seller_count, stocked_count, price_sum_cents,
+     review_count, rating_count, rating_sum)
+  SELECT p.id, p.category_id,
+         COALESCE(i.seller_count, 0), COALESCE(i.stocked_count, 0), COALESCE(i.price_sum_cents, 0),
+         COALESCE(r.review_count, 0), COALESCE(r.rating_count, 0), COALESCE(r.rating_sum, 0)
+  FROM products p
+  LEFT JOIN (SELECT product_id, COUNT(*) AS seller_count,
+                    COUNT(*) FILTER (WHERE quantity_on_hand > 0) AS stocked_count,
+                    SUM(price_cents) AS price_sum_cents
+             FROM inventory GROUP BY product_id) i ON i.product_id = p.id
+  LEFT JOIN (SELECT product_id, COUNT(*) AS review_count, COUNT(rating) AS rating_count,
+                    SUM(rating) AS rating_sum
+             FROM product_reviews GROUP BY product_id) r ON r.product_id = p.id
+  ON CONFLICT (product_id) DO UPDATE
+  SET category_id = EXCLUDED.category_id,
+      seller_count = EXCLUDED.seller_count,
+      stocked_count = EXCLUDED.stocked_count,
+      price_sum_cents = EXCLUDED.price_sum_cents,
+      review_count = EXCLUDED.review_count,
+      rating_count = EXCLUDED.rating_count,
+      rating_sum = EXCLUDED.rating_sum,
+      version = s.version + 1
+  WHERE (s.category_id, s.seller_count, s.stocked_count, s.price_sum_cents,
+         s.review_count, s.rating_count, s.rating_sum)
+        IS DISTINCT FROM
+        (EXCLUDED.category_id, EXCLUDED.seller_count, EXCLUDED.stocked_count,
+         EXCLUDED.price_sum_cents, EXCLUDED.review_count, EXCLUDED.rating_count,
+         EXCLUDED.rating_sum);
+END;
+$$ LANGUAGE plpgsql;
+
+
+--- Product facets
+-- How many products fall in each (category, price bucket, rating bucket,
+-- in stock) cell of product_stats.  The browse page's facet counts for the
+-- whole catalog are sums over this small table instead of a scan of every
+-- product.  Only a product moving to another cell writes here, not every
+-- statistics change.
+
+CREATE TABLE IF NOT EXISTS product_facets (
+  category_id INT NOT NULL,                   -- 0: uncategorized
+  price_bucket SMALLINT NOT NULL,
+  rating_bucket SMALLINT NOT NULL,
+  in_stock BOOLEAN NOT NULL,
+  product_count INT NOT NULL,
+  PRIMARY KEY (category_id, price_bucket, rating_bucket, in_stock)
+);
+
+CREATE OR REPLACE FUNCTION product_facets_add(
+  cat INT, price SMALLINT, rating SMALLINT, stocked BOOLEAN, delta INT)
+RETURNS VOID AS $$
+BEGIN
+  IF delta < 0 THEN
+    -- the cell's last product leaves: drop the row
+    DELETE FROM product_facets
+    WHERE (category_id, price_bucket, rating_bucket, in_stock) = (COALESCE(cat, 0), price, rating, stocked)
+      AND product_count = -delta;
+    IF FOUND THEN
+      RETURN;
+    END IF;
+  END IF;
+  INSERT INTO product_facets AS f (category_id, price_bucket, rating_bucket, in_stock, product_count)
+  VALUES (COALESCE(cat, 0), price, rating, stocked, delta)
+  ON CONFLICT (category_id, price_bucket, rating_bucket, in_stock) DO UPDATE
+  SET product_count = f.product_count + EXCLUDED.product_count;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_facets_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND (OLD.category_id, OLD.price_bucket, OLD.rating_bucket, OLD.in_stock)
+         IS NOT DISTINCT FROM
+         (NEW.category_id, NEW.price_bucket, NEW.rating_bucket, NEW.in_stock) THEN
+    RETURN NULL;
+  END IF;
+  -- touch the two cells in key order, so that concurrent moves in opposite
+  -- directions cannot deadlock
+  IF TG_OP = 'UPDATE'
+     AND (COALESCE(OLD.category_id, 0), OLD.price_bucket, OLD.rating_bucket, OLD.in_stock)
+         > (COALESCE(NEW.category_id, 0), NEW.price_bucket, NEW.rating_bucket, NEW.in_stock) THEN
+    PERFORM product_facets_add(NEW.category_id, NEW.price_bucket, NEW.rating_bucket, NEW.in_stock, 1);
+    PERFORM product_facets_add(OLD.category_id, OLD.price_bucket, OLD.rating_bucket, OLD.in_stock, -1);
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM product_facets_add(OLD.category_id, OLD.price_bucket, OLD.rating_bucket, OLD.in_stock, -1);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM product_facets_add(NEW.category_id, NEW.price_bucket, NEW.rating_bucket, NEW.in_stock, 1);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_product_facets_stats
+AFTER INSERT OR UPDATE OR DELETE ON product_stats
+FOR EACH ROW
+EXECUTE FUNCTION product_facets_stats();
+
+-- Recompute all facet counts from product_stats (after loading with
+-- triggers off)
+CREATE OR REPLACE FUNCTION refresh_product_facets()
+RETURNS VOID AS $$
+BEGIN
+  DELETE FROM product_facets;
+  INSERT INTO product_facets (category_id, price_bucket, rating_bucket, in_stock, product_count)
+  SELECT COALESCE(category_id, 0), price_bucket, rating_bucket, in_stock, COUNT(*)
+  FROM product_stats
+  GROUP BY 1, 2, 3, 4;
+END;
+$$ LANGUAGE plpgsql;
+
+
+--------------------------------
+--- Trigram indexes
+-- Let the unanchored ILIKE '%term%' searches (products, users, order
+-- history, inventory) use an index, and power the product search's
+-- "did you mean" (word similarity on product names).  pg_trgm ships with
+-- PostgreSQL's contrib modules; where it is missing the searches still
+-- work, by scanning, and there are no suggestions.
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_products_description_trgm ON products USING GIN (description gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_users_full_name_trgm ON users USING GIN (full_name gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING GIN (email gin_trgm_ops);
+  ELSE
+    RAISE NOTICE 'pg_trgm is not available: substring searches will not be indexed';
+  END IF;
+END;
+$$;
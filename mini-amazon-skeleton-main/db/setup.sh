@@ -13,6 +13,12 @@ fi
 source ../.flaskenv
 dbname=$DB_NAME
 
+# fold the delta logs that the CSV exports append to (app/csv_sync.py) into
+# the snapshots first, or changes not compacted yet would not be loaded
+if compgen -G "$datadir/*.delta.csv*" > /dev/null ; then
+    (cd "$mybase/.." && flask csv compact) || exit 1
+fi
+
 PGPASSWORD="$DB_PASSWORD" dropdb -h "$DB_HOST" -p "$DB_PORT" -U "$DB_USER" --if-exists "$dbname"
 PGPASSWORD="$DB_PASSWORD" createdb -h "$DB_HOST" -p "$DB_PORT" -U "$DB_USER" "$dbname"
 
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+# app.config builds the database URI at import time; nothing here connects
+# to it (create_app() and the engine are lazy), tests stub the queries
+for name, value in (('DB_USER', 'postgres'), ('DB_PASSWORD', ''), ('DB_HOST', 'localhost'),
+                    ('DB_PORT', '5432'), ('DB_NAME', 'amazon'), ('SECRET_KEY', 'test')):
+    os.environ.setdefault(name, value)
+
+from app import create_app  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        yield app
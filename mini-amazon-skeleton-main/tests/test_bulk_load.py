@@ -0,0 +1,105 @@
+import os
+import re
+
+import pytest
+
+from app.bulk_load import _DB_DIR, load_waves, parse_load_sql
+
+
+def _schema_foreign_keys():
+    """(table, referenced table) for each REFERENCES in db/create.sql."""
+    with open(os.path.join(_DB_DIR, 'create.sql')) as f:
+        script = f.read()
+    return [(table.lower(), parent.lower())
+            for table, body in re.findall(r'CREATE TABLE (?:IF NOT EXISTS )?(\w+)\s*\((.*?)\n\);',
+                                          script, re.DOTALL | re.IGNORECASE)
+            for parent in re.findall(r'REFERENCES\s+(\w+)', body, re.IGNORECASE)]
+
+
+def _loads(*tables):
+    return dict.fromkeys(tables)
+
+
+def test_waves_follow_foreign_keys_in_file_order():
+    loads = _loads('orders', 'users', 'items', 'products', 'categories')
+    foreign_keys = [('orders', 'users'), ('items', 'orders'), ('items', 'products'),
+                    ('products', 'categories'), ('categories', 'categories')]
+    assert load_waves(loads, foreign_keys) == [
+        ['users', 'categories'], ['orders', 'products'], ['items']]
+
+
+def test_references_outside_the_load_are_ignored():
+    loads = _loads('products', 'product_stats')
+    assert load_waves(loads, [('products', 'users'), ('product_stats', 'products')]) == [
+        ['products'], ['product_stats']]
+
+
+def test_references_to_order_sellers_wait_for_order_items():
+    # order_sellers is not COPYed but filled once order_items is loaded
+    loads = _loads('orders', 'order_items', 'message_threads')
+    foreign_keys = [('order_items', 'orders'), ('order_sellers', 'orders'),
+                    ('message_threads', 'order_sellers')]
+    assert load_waves(loads, foreign_keys) == [['orders'], ['order_items'], ['message_threads']]
+
+
+def test_cycle_is_an_error():
+    loads = _loads('users', 'a', 'b')
+    with pytest.raises(ValueError, match='a, b'):
+        load_waves(loads, [('a', 'b'), ('b', 'a'), ('a', 'users')])
+
+
+def test_waves_of_the_schema():
+    loads = parse_load_sql(os.path.join(_DB_DIR, 'load.sql'))
+    foreign_keys = _schema_foreign_keys()
+    waves = load_waves(loads, foreign_keys)
+
+    assert sorted(t for wave in waves for t in wave) == sorted(loads)
+    wave_of = {table: i for i, wave in enumerate(waves) for table in wave}
+    wave_of['order_sellers'] = wave_of['order_items']
+    for table, parent in foreign_keys:
+        if table in loads and parent in wave_of and table != parent:
+            assert wave_of[table] > wave_of[parent], (table, parent)
+
+
+def test_parse_load_sql(tmp_path):
+    path = tmp_path / 'load.sql'
+    path.write_text('''
+\\COPY users(id, email) FROM 'Users.csv' WITH DELIMITER ',' NULL '' CSV;
+SELECT setval(pg_get_serial_sequence('users','id'), COALESCE((SELECT MAX(id)+1 FROM users), 1), false);
+
+\\COPY cart_items(user_id, quantity) FROM 'CartItems.csv' WITH DELIMITER ',' NULL '' CSV FORCE NULL quantity;
+''')
+    loads = parse_load_sql(str(path))
+
+    assert list(loads) == ['users', 'cart_items']
+    users, cart_items = loads.values()
+    assert users.filename == 'Users.csv'
+    assert users.copy_sql == "COPY users(id, email) FROM STDIN WITH DELIMITER ',' NULL '' CSV"
+    assert users.setval_sql.startswith("SELECT setval(pg_get_serial_sequence('users','id')")
+    assert not users.setval_sql.endswith(';')
+    assert cart_items.copy_sql.endswith('CSV FORCE NULL quantity')
+    assert cart_items.setval_sql is None
+
+
+@pytest.mark.parametrize('generate_dir, snapshot, folded', [
+    (True, None, True),
+    (False, None, False),
+    (True, 'snapshot', False),
+])
+def test_delta_logs_are_folded_before_loading_db_generate(app, tmp_path, monkeypatch,
+                                                         generate_dir, snapshot, folded):
+    from app import csv_sync
+    from app.bulk_load import BulkLoader
+
+    generate = tmp_path / 'generate'
+    generate.mkdir()
+    monkeypatch.setattr(csv_sync, '_generate_path', lambda filename: str(generate / filename))
+    calls = []
+    monkeypatch.setattr(csv_sync, 'compact_all', lambda: calls.append('compact_all'))
+    loader = BulkLoader.__new__(BulkLoader)
+    loader.datadir = str(generate if generate_dir else tmp_path)
+    loader.snapshot = snapshot
+
+    loader._fold_deltas(report=lambda line: None)
+
+    assert calls == (['compact_all'] if folded else [])
@@ -0,0 +1,130 @@
+import csv
+from collections import namedtuple
+
+import pytest
+
+from app import csv_sync
+
+
+@pytest.fixture
+def generate(tmp_path, monkeypatch):
+    """db/generate/ redirected to a temporary directory."""
+    monkeypatch.setattr(csv_sync, '_generate_path', lambda filename: str(tmp_path / filename))
+    return tmp_path
+
+
+def _write(path, rows):
+    with open(path, 'w', newline='') as f:
+        csv.writer(f, lineterminator='\n').writerows(rows)
+
+
+def _read(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_compact_folds_updates_inserts_and_deletes(app, generate):
+    _write(generate / 'Categories.csv', [['1', 'Books', ''], ['2', 'Toys', ''], ['10', 'Games', '2']])
+    _write(generate / 'Categories.delta.csv', [
+        ['U', '2', 'Toys & Games', ''],
+        ['U', '3', 'Music', ''],
+        ['D', '10'],
+        ['U', '10', 'Board games', '2'],     # re-created after the delete
+        ['D', '1'],
+        ['D', '99'],                         # never exported: ignored
+        ['U', '3', 'Music & Audio', ''],     # the last state of a row wins
+    ])
+
+    csv_sync.compact('categories')
+
+    # primary key order, compared as numbers
+    assert _read(generate / 'Categories.csv') == [
+        ['2', 'Toys & Games', ''], ['3', 'Music & Audio', ''], ['10', 'Board games', '2']]
+    assert sorted(p.name for p in generate.iterdir() if p.suffix != '.lock') == ['Categories.csv']
+
+
+def test_compact_handles_composite_boolean_keys(app, generate):
+    _write(generate / 'CartItems.csv', [['1', '5', '2', '1', 'True'], ['1', '5', '2', '3', 'False']])
+    _write(generate / 'CartItems.delta.csv', [
+        ['D', '1', '5', '2', 'True'],
+        ['U', '1', '5', '2', '4', 'False'],
+    ])
+
+    csv_sync.compact('cart_items')
+
+    assert _read(generate / 'CartItems.csv') == [['1', '5', '2', '4', 'False']]
+
+
+def test_compact_without_delta_leaves_snapshot_alone(app, generate):
+    _write(generate / 'Categories.csv', [['2', 'Toys', ''], ['1', 'Books', '']])
+    csv_sync.compact('categories')
+    assert _read(generate / 'Categories.csv') == [['2', 'Toys', ''], ['1', 'Books', '']]
+
+
+_Category = namedtuple('_Category', 'id name parent_id')
+
+
+@pytest.fixture
+def categories(app, monkeypatch):
+    """The categories table, as the delta query sees it."""
+    table = {1: _Category(1, 'Books', None), 2: _Category(2, 'Toys & Games', None)}
+
+    def execute(sqlstr, **params):
+        assert 'unnest' in sqlstr
+        return [table[id] for id in params['k0'] if id in table]
+
+    monkeypatch.setattr(app.db, 'execute', execute)
+    return table
+
+
+def test_export_changes_appends_delta_then_compacts(app, generate, categories):
+    _write(generate / 'Categories.csv', [['1', 'Books', ''], ['2', 'Toys', ''], ['3', 'Music', '']])
+
+    csv_sync.export_changes('categories', [(2,), (3,), (2,)])
+
+    assert _read(generate / 'Categories.delta.csv') == [['U', '2', 'Toys & Games', ''], ['D', '3']]
+    csv_sync.compact('categories')
+    assert _read(generate / 'Categories.csv') == [['1', 'Books', ''], ['2', 'Toys & Games', '']]
+    assert not (generate / 'Categories.delta.csv').exists()
+
+
+def test_export_changes_compacts_a_large_delta(app, generate, categories):
+    app.config['CSV_DELTA_MAX_BYTES'] = 1
+    _write(generate / 'Categories.csv', [['1', 'Books', ''], ['2', 'Toys', '']])
+
+    csv_sync.export_changes('categories', [(2,)])
+
+    assert _read(generate / 'Categories.csv') == [['1', 'Books', ''], ['2', 'Toys & Games', '']]
+    assert not (generate / 'Categories.delta.csv').exists()
+
+
+@pytest.mark.parametrize('incremental, snapshot', [(True, False), (False, True)])
+def test_export_changes_falls_back_to_a_full_export(app, generate, categories, monkeypatch,
+                                                    incremental, snapshot):
+    app.config['CSV_EXPORT_INCREMENTAL'] = incremental
+    if snapshot:
+        _write(generate / 'Categories.csv', [['1', 'Books', '']])
+    exported = []
+    monkeypatch.setattr(csv_sync, 'export_table', exported.append)
+
+    csv_sync.export_changes('categories', [(1,)])
+
+    assert exported == ['categories']
+    assert not (generate / 'Categories.delta.csv').exists()
+
+
+def test_compact_without_snapshot_starts_from_empty(app, generate):
+    _write(generate / 'Categories.delta.csv', [['U', '2', 'Toys', ''], ['U', '1', 'Books', '']])
+    csv_sync.compact('categories')
+    assert _read(generate / 'Categories.csv') == [['1', 'Books', ''], ['2', 'Toys', '']]
+
+
+def test_compact_folds_a_log_left_by_an_interrupted_compaction(app, generate):
+    _write(generate / 'Categories.csv', [['1', 'Books', '']])
+    _write(generate / 'Categories.delta.csv.compacting', [['U', '2', 'Toys', ''], ['D', '1']])
+    _write(generate / 'Categories.delta.csv', [['U', '2', 'Toys & Games', '']])
+
+    csv_sync.compact('categories')
+
+    assert _read(generate / 'Categories.csv') == [['2', 'Toys & Games', '']]
+    assert sorted(p.name for p in generate.iterdir() if p.suffix != '.lock') == ['Categories.csv']
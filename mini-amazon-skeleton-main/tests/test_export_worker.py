@@ -0,0 +1,44 @@
+import time
+
+from app import csv_sync
+from app.export_worker import ExportWorker
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_exports_are_coalesced_and_deltas_compacted_periodically(app, monkeypatch):
+    exported = []
+    compactions = []
+    monkeypatch.setattr(csv_sync, 'export_changes', lambda table, keys: exported.append((table, keys)))
+    monkeypatch.setattr(csv_sync, 'compact_all', lambda: compactions.append(time.monotonic()))
+    worker = ExportWorker(app, interval=0.05, compact_interval=0.1)
+    try:
+        worker.mark_dirty('categories', [(1,)])
+        worker.mark_dirty('categories', [(2,), (1,)])
+        _wait_for(lambda: len(compactions) >= 2)
+    finally:
+        worker.stop()
+
+    assert exported == [('categories', {(1,), (2,)})]
+    # with nothing left to export, the thread still wakes up to compact
+    assert compactions[1] - compactions[0] >= 0.1
+    stats = worker.stats()
+    assert stats['compactions'] >= 2 and stats['errors'] == 0
+
+
+def test_no_periodic_compaction_without_interval(app, monkeypatch):
+    monkeypatch.setattr(csv_sync, 'export_changes', lambda table, keys: None)
+    monkeypatch.setattr(csv_sync, 'compact_all', lambda: 1 / 0)
+    worker = ExportWorker(app, interval=0, compact_interval=None)
+    try:
+        worker.mark_dirty('categories', [(1,)])
+        _wait_for(lambda: worker.exports == 1)
+        time.sleep(0.05)
+    finally:
+        worker.stop()
+    assert worker.compactions == 0 and worker.errors == 0
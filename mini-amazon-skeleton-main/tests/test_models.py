@@ -0,0 +1,53 @@
+from collections import namedtuple
+
+import pytest
+
+from app.models.base import Model
+
+
+class Item(Model):
+    __slots__ = ('id', 'name', 'price', 'note')
+
+    def __init__(self, id, name=None, price=None, note='-'):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.note = note
+
+
+def _rows(columns, *values):
+    Row = namedtuple('Row', columns)
+    return [Row(*v) for v in values]
+
+
+def _attrs(item):
+    return item.id, item.name, item.price, item.note
+
+
+@pytest.mark.parametrize('columns, values, expected', [
+    ('id name price note', (1, 'a', 2.5, 'x'), (1, 'a', 2.5, 'x')),
+    ('note price name id', ('x', 2.5, 'a', 1), (1, 'a', 2.5, 'x')),
+    ('id name', (1, 'a'), (1, 'a', None, '-')),
+    ('price id', (2.5, 1), (1, None, 2.5, '-')),
+    ('note id', ('x', 1), (1, None, None, 'x')),
+    ('id', (1,), (1, None, None, '-')),
+])
+def test_columns_are_matched_by_name(columns, values, expected):
+    assert _attrs(Item.from_row(_rows(columns, values)[0])) == expected
+
+
+def test_from_rows():
+    items = Item.from_rows(_rows('name id', ('a', 1), ('b', 2)))
+    assert [_attrs(i) for i in items] == [(1, 'a', None, '-'), (2, 'b', None, '-')]
+    assert Item.from_rows([]) == []
+    assert Item.from_row(None) is None
+
+
+def test_unknown_column():
+    with pytest.raises(AttributeError, match='colour'):
+        Item.from_row(_rows('id colour', (1, 'red'))[0])
+
+
+def test_missing_required_column():
+    with pytest.raises(TypeError, match="'id'"):
+        Item.from_row(_rows('name', ('a',))[0])
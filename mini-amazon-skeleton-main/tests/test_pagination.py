@@ -0,0 +1,42 @@
+import base64
+import json
+
+import pytest
+
+from app.pagination import Cursor, Page
+
+
+@pytest.mark.parametrize('key', ['Desk lamp', 'ünïcode / & ?', 12.5, 7, ''])
+def test_cursor_round_trip(key):
+    token = Cursor(key, 42, 60).encode()
+    assert '=' not in token
+    cursor = Cursor.decode(token)
+    assert (cursor.key, cursor.id, cursor.pos) == (key, 42, 60)
+
+
+def _token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('token', [
+    None,
+    '',
+    'not a cursor',
+    '!!!',
+    _token({'key': 'a'}),
+    _token(['a', 1]),
+    _token(['a', '1', 0]),
+    _token(['a', 1, -20]),
+    _token(['a', 1, 2.5]),
+    _token([['a'], 1, 0]),
+    _token([None, 1, 0]),
+])
+def test_malformed_cursor_decodes_to_none(token):
+    assert Cursor.decode(token) is None
+
+
+def test_page_numbers():
+    page = Page([], pos=40, per_page=20, total=41)
+    assert (page.number, page.pages) == (3, 3)
+    assert Page([], pos=0, per_page=20, total=0).pages == 1
+    assert Page([], pos=0, per_page=20).pages is None
@@ -0,0 +1,118 @@
+import re
+from collections import namedtuple
+
+import pytest
+
+from app.models.product import Product
+from app.pagination import Cursor
+
+_Row = namedtuple('_Row', 'id name description image_url avg_price seller_count avg_rating '
+                          'review_count category_id category_name created_by version')
+
+# (id, name, avg_price): two price ties to check the id tie-break
+CATALOG = [_Row(id, name, None, None, price, 1, None, 0, None, None, None, 1)
+           for id, name, price in [
+               (1, 'Anvil', 30.0), (2, 'Bell', 10.0), (3, 'Candle', 20.0),
+               (4, 'Drum', 10.0), (5, 'Easel', 50.0), (6, 'Flute', 20.0),
+               (7, 'Globe', 40.0), (8, 'Harp', 60.0)]]
+
+_COLUMNS = {'p.name': 'name', 's.avg_price': 'avg_price', 'p.id': 'id', 's.product_id': 'id'}
+
+
+@pytest.fixture
+def queries(app, monkeypatch):
+    """Run browse_page()'s keyset query against CATALOG in Python."""
+    executed = []
+
+    def execute(query, read_only=False, size=None, cursor_key=None, cursor_id=None, **params):
+        executed.append(query)
+        (key, order), = set(re.findall(r'ORDER BY (\S+) (ASC|DESC), ', query))
+        attr = _COLUMNS[key]
+        rows = sorted(CATALOG, key=lambda r: (getattr(r, attr), r.id), reverse=order == 'DESC')
+        if cursor_id is not None:
+            op = re.search(r'\) ([<>]) \(:cursor_key, :cursor_id\)', query).group(1)
+            if op == '>':
+                rows = [r for r in rows if (getattr(r, attr), r.id) > (cursor_key, cursor_id)]
+            else:
+                rows = [r for r in rows if (getattr(r, attr), r.id) < (cursor_key, cursor_id)]
+        return rows[:size]
+
+    monkeypatch.setattr(Product, 'count_matching',
+                        staticmethod(lambda *args, **kwargs: (len(CATALOG), True)))
+    monkeypatch.setattr(app.db, 'execute', execute)
+    return executed
+
+
+def _ids(page):
+    return [product.id for product in page.items]
+
+
+def _walk(sort=None, per_page=3, limit=None):
+    pages = [Product.browse_page(sort=sort, per_page=per_page, limit=limit)]
+    while pages[-1].next_cursor:
+        pages.append(Product.browse_page(sort=sort, per_page=per_page, limit=limit,
+                                         after=pages[-1].next_cursor))
+    return pages
+
+
+@pytest.mark.parametrize('sort, expected', [
+    (None, [1, 2, 3, 4, 5, 6, 7, 8]),
+    ('price_asc', [2, 4, 3, 6, 1, 7, 5, 8]),
+    ('price_desc', [8, 5, 7, 1, 6, 3, 4, 2]),
+])
+def test_forward_walk_visits_every_product_once(queries, sort, expected):
+    pages = _walk(sort)
+    assert [_ids(page) for page in pages] == [expected[0:3], expected[3:6], expected[6:8]]
+    assert [page.number for page in pages] == [1, 2, 3]
+    assert pages[0].prev_cursor is None
+    assert all(page.prev_cursor for page in pages[1:])
+    assert pages[-1].pages == 3
+
+
+@pytest.mark.parametrize('sort', [None, 'price_asc', 'price_desc'])
+def test_backward_walk_returns_the_same_pages(queries, sort):
+    forward = _walk(sort)
+    page = forward[-1]
+    backward = [page]
+    while page.prev_cursor:
+        page = Product.browse_page(sort=sort, per_page=3, before=page.prev_cursor)
+        backward.append(page)
+    backward.reverse()
+    assert [_ids(page) for page in backward] == [_ids(page) for page in forward]
+    assert [page.pos for page in backward] == [0, 3, 6]
+    assert backward[0].prev_cursor is None
+    assert all(page.next_cursor for page in backward[:-1])
+
+
+def test_limit_caps_the_last_page_and_total(queries):
+    pages = _walk(per_page=3, limit=5)
+    assert [_ids(page) for page in pages] == [[1, 2, 3], [4, 5]]
+    assert pages[-1].next_cursor is None
+    assert (pages[-1].total, pages[-1].total_exact, pages[-1].pages) == (5, True, 2)
+
+    back = Product.browse_page(per_page=3, limit=5, before=pages[-1].prev_cursor)
+    assert _ids(back) == [1, 2, 3]
+    assert back.prev_cursor is None and back.next_cursor
+
+
+def test_cursor_past_the_limit_runs_no_query(queries):
+    after = Cursor('Easel', 5, 5).encode()
+    page = Product.browse_page(per_page=3, limit=5, after=after)
+    assert page.items == [] and page.next_cursor is None
+    assert queries == []
+
+
+@pytest.mark.parametrize('token', ['garbage', Cursor('Candle', 3, 3).encode()])
+def test_unusable_cursor_starts_at_the_first_page(queries, token):
+    # a name cursor is useless for a price sort
+    page = Product.browse_page(sort='price_asc', per_page=3, after=token)
+    assert _ids(page) == [2, 4, 3]
+    assert page.pos == 0 and page.prev_cursor is None
+
+
+def test_given_total_skips_counting(queries, monkeypatch):
+    def count_matching(*args, **kwargs):
+        raise AssertionError('count_matching() called')
+    monkeypatch.setattr(Product, 'count_matching', staticmethod(count_matching))
+    page = Product.browse_page(per_page=3, total=8)
+    assert (page.total, page.total_exact) == (8, True)
@@ -0,0 +1,25 @@
+from app.models.inventory import InventoryItem
+from app.models.product import Product
+from app.models.product_detail import ProductDetail
+from app.models.product_review import ProductReview
+
+
+def _detail(category='Books', seller='Ann', author='Bob', quantity=3):
+    return ProductDetail(
+        product=Product(1, 'Lamp', category_name=category, version=7),
+        offers=[InventoryItem(2, 1, 1000, quantity, None, seller_user_id=5, seller_name=seller)],
+        rating_histogram={},
+        reviews=[ProductReview(9, 1, 6, 5, 'Good', None, None, None, author_name=author)])
+
+
+def test_fragment_versions_cover_denormalized_names():
+    detail = _detail()
+    assert detail.product.fragment_version != _detail(category='Music').product.fragment_version
+    assert detail.offers_version != _detail(seller='Ann B.').offers_version
+    assert detail.offers_version != _detail(quantity=2).offers_version
+    assert detail.reviews_version != _detail(author='Bob C.').reviews_version
+    assert detail.reviews_version == _detail(quantity=2).reviews_version
+
+
+def test_product_without_version_is_not_cached():
+    assert Product(1, 'Lamp', category_name='Books').fragment_version is None
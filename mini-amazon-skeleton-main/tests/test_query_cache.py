@@ -0,0 +1,130 @@
+import pytest
+
+from app import query_cache
+from app.query_cache import QueryCache, written_tables
+
+
+@pytest.mark.parametrize('statement, tables', [
+    ('SELECT * FROM products', set()),
+    ('INSERT INTO Inventory(seller_id) VALUES (1)', {'inventory'}),
+    ('UPDATE ONLY public."Products" SET name = :name', {'products'}),
+    ('DELETE FROM cart_items WHERE user_id = :uid', {'cart_items'}),
+    ('TRUNCATE TABLE categories', {'categories'}),
+    ('COPY product_reviews FROM STDIN', {'product_reviews'}),
+    ('WITH moved AS (DELETE FROM cart_items RETURNING *) '
+     'INSERT INTO order_items SELECT * FROM moved', {'cart_items', 'order_items'}),
+])
+def test_written_tables(statement, tables):
+    assert written_tables(statement) == tables
+
+
+def test_invalidate_drops_only_entries_reading_the_table():
+    cache = QueryCache()
+    cache.put('a', [(1,)], {'products'})
+    cache.put('b', [(2,)], {'products', 'categories'})
+    cache.put('c', [(3,)], {'users'})
+
+    cache.invalidate({'products'})
+
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert cache.get('c') == [(3,)]
+    assert cache.stats()['entries_by_table'] == {'users': 1}
+
+
+def test_put_after_invalidation_is_not_cached():
+    cache = QueryCache()
+    generation = cache.generation()
+    cache.invalidate({'products'})
+    cache.put('a', [(1,)], {'products'}, generation=generation)
+    assert cache.get('a') is None
+
+    cache.put('a', [(1,)], {'products'}, generation=cache.generation())
+    assert cache.get('a') == [(1,)]
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(query_cache.time, 'monotonic', lambda: now[0])
+    cache = QueryCache(ttl=10)
+    cache.put('a', [(1,)], {'products'})
+    cache.put('b', [(2,)], {'products'}, ttl=60)
+
+    now[0] += 10
+    assert cache.get('a') is None
+    assert cache.get('b') == [(2,)]
+    assert cache.expirations == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put('a', [(1,)], {'products'})
+    cache.put('b', [(2,)], {'products'})
+    cache.get('a')
+    cache.put('c', [(3,)], {'products'})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == [(1,)]
+    assert cache.get('c') == [(3,)]
+    assert cache.evictions == 1
+
+
+class _Conn:
+    def __init__(self):
+        self.info = {}
+
+
+@pytest.fixture
+def executed(app, monkeypatch):
+    calls = []
+
+    def execute(sqlstr, **kwargs):
+        calls.append((sqlstr, kwargs))
+        return [(len(calls),)]
+
+    monkeypatch.setattr(app.db, 'execute', execute)
+    return calls
+
+
+def test_execute_cached_hits_until_a_write_to_its_table(app, executed):
+    sql = 'SELECT name FROM categories WHERE id = :id'
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=1) == [(1,)]
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=1) == [(1,)]
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=2) == [(2,)]
+    assert len(executed) == 2
+
+    conn = _Conn()
+    app.db._track_writes(conn, None, 'UPDATE users SET firstname = :f', {}, None, False)
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=1) == [(1,)]
+
+    app.db._track_writes(conn, None, 'UPDATE categories SET name = :n', {}, None, False)
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=1) == [(3,)]
+    assert conn.info['written_tables'] == {'users', 'categories'}
+
+    # entries cached while the writing transaction was open go at commit
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=2) == [(4,)]
+    app.db._invalidate_written(conn)
+    assert app.db.execute_cached(sql, cache_tables=('categories',), id=2) == [(5,)]
+    assert 'written_tables' not in conn.info
+
+
+def test_execute_cached_skips_unhashable_parameters(app, executed):
+    sql = 'SELECT name FROM categories WHERE id = ANY(:ids)'
+    app.db.execute_cached(sql, cache_tables=('categories',), ids=[1, 2])
+    app.db.execute_cached(sql, cache_tables=('categories',), ids=[1, 2])
+    assert len(executed) == 2
+
+
+def test_execute_cached_without_cache(app, executed):
+    app.db.query_cache = None
+    sql = 'SELECT name FROM categories'
+    app.db.execute_cached(sql, cache_tables=('categories',))
+    app.db.execute_cached(sql, cache_tables=('categories',))
+    assert len(executed) == 2
+
+
+def test_execute_cached_passes_sql_parameters_named_like_its_options(app, executed):
+    sql = 'SELECT :tables, :ttl'
+    app.db.execute_cached(sql, cache_tables=('categories',), cache_ttl=5, tables='t', ttl=1)
+    app.db.execute_cached(sql, cache_tables=('categories',), cache_ttl=5, tables='t', ttl=1)
+    assert executed == [(sql, {'tables': 't', 'ttl': 1})]
@@ -0,0 +1,73 @@
+import pytest
+
+from app.models.product import Product
+from app.search import build_tsquery, excludes_only, like_pattern, plain_words
+
+
+@pytest.mark.parametrize('text, tsquery', [
+    ('red shoes', 'red & shoes'),
+    ('"red shoes"', '(red <-> shoes)'),
+    ('"unterminated phrase', '(unterminated <-> phrase)'),
+    ('sho*', 'sho:*'),
+    ('red OR blue', '(red | blue)'),
+    ('a OR b OR c', '(a | b | c)'),
+    ('OR red OR', 'red'),
+    ('-used', '!used'),
+    ('-"red shoes"', '!(red <-> shoes)'),
+    ('red -used', 'red & !used'),
+    ("it's 50% off!", '(it <-> s) & 50 & off'),
+    ("x'); DROP TABLE products; --", 'x & DROP & TABLE & products'),
+    ('', None),
+    ('   ', None),
+    ('*** -""', None),
+    (None, None),
+])
+def test_build_tsquery(text, tsquery):
+    assert build_tsquery(text) == tsquery
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('-used', True),
+    ('-used -"red shoes"', True),
+    ('-a OR -b', True),
+    ('red', False),
+    ('red -used', False),
+    ('x OR -y', False),
+    ('"red shoes" -used', False),
+])
+def test_excludes_only(text, expected):
+    assert excludes_only(build_tsquery(text)) is expected
+
+
+def test_plain_words_and_like_pattern():
+    assert plain_words('red OR "blue shoes" -used*') == 'red blue shoes used'
+    assert like_pattern('50%_off\\') == '%50\\%\\_off\\\\%'
+
+
+@pytest.fixture
+def fts(app):
+    app.config['PRODUCT_SEARCH_MODE'] = 'fts'
+    return app
+
+
+def test_search_filters_rank_by_the_tsquery(fts):
+    where, params, tsquery = Product._search_filters(search='red -used')
+    assert '@@ to_tsquery' in where
+    assert params == {'tsquery': 'red & !used'}
+    assert tsquery == 'red & !used'
+    assert Product._sort_key('relevance', tsquery)[2] == 'relevance'
+
+
+def test_exclusion_only_search_filters_without_ranking(fts):
+    where, params, tsquery = Product._search_filters(search='-used')
+    assert '@@ to_tsquery' in where
+    assert params == {'tsquery': '!used'}
+    assert tsquery is None
+    assert Product._sort_key('relevance', tsquery)[2] == 'name'
+
+
+def test_like_mode_is_the_default(app):
+    where, params, tsquery = Product._search_filters(search='50% off')
+    assert 'ILIKE :search' in where
+    assert params == {'search': '%50\\% off%'}
+    assert tsquery is None